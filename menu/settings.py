@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
+    "whitenoise.runserver_nostatic",  # и в dev статику отдаёт WhiteNoise, как в проде
     "django.contrib.staticfiles",
 
     # сторонние
@@ -54,14 +55,18 @@ INSTALLED_APPS = [
 # но до Common, чтобы как можно раньше отсекать небезопасные запросы.
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",  # /static/: отдаёт .br/.gz, immutable для хэшированных
+    "menuapp.middleware.MetricsMiddleware",  # /metrics: первым, чтобы мерить весь запрос
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
+    "menuapp.middleware.ProfilingMiddleware",  # Server-Timing; включается MENU_PROFILING=true
     "menuapp.middleware.AgeGate21Middleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "menuapp.middleware.PageCacheMiddleware",  # последним: страницы меню анонимам до вьюхи
 ]
 
 # =========================
@@ -120,6 +125,27 @@ DATABASES = {
     }
 }
 
+# =========================
+# КЭШ
+# =========================
+# По умолчанию — память процесса. На проде с несколькими воркерами gunicorn
+# нужен общий бэкенд (file/redis/memcached): в кэше живёт версия меню,
+# и все воркеры должны видеть её одинаково.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", "ryumki-mira"),
+    },
+    # {% cache ... using="fragments" %}: карточки меню. Всегда в памяти процесса —
+    # на странице их сотни, сетевой кэш превратил бы это в сотни походов по сети
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "ryumki-mira-fragments",
+        "TIMEOUT": 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("MENU_FRAGMENT_CACHE_ENTRIES", "20000"))},
+    },
+}
+
 # =========================
 # ПАРОЛИ
 # =========================
@@ -160,6 +186,14 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]     # dev
 STATIC_ROOT = BASE_DIR / "staticfiles"       # collectstatic для прод
 
+# collectstatic: хэш в имени + .gz/.br рядом (см. menuapp/storage.py)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "menuapp.storage.StaticStorage"},
+}
+# файлы без хэша (не из манифеста) — недолго; хэшированные WhiteNoise кэширует на год с immutable
+WHITENOISE_MAX_AGE = int(os.getenv("WHITENOISE_MAX_AGE", "3600"))
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
@@ -207,6 +241,45 @@ if not DEBUG:
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
 
+# =========================
+# МЕНЮ
+# =========================
+# «Популярные» на главной: окно в днях и (опционально) полураспад веса продаж
+MENU_POPULAR_DAYS = int(os.getenv("MENU_POPULAR_DAYS", "30"))
+MENU_POPULAR_HALF_LIFE_DAYS = float(os.getenv("MENU_POPULAR_HALF_LIFE_DAYS", "0")) or None
+
+# Профилирование запросов: Server-Timing + буфер медленных запросов (страница для staff)
+MENU_PROFILING = os.getenv("MENU_PROFILING", "false").strip().lower() == "true"
+MENU_PROFILING_SLOW_MS = int(os.getenv("MENU_PROFILING_SLOW_MS", "500"))
+MENU_PROFILING_BUFFER = int(os.getenv("MENU_PROFILING_BUFFER", "50"))
+
+# Метрики Prometheus (/metrics). MENU_METRICS_DIR — общий каталог воркеров gunicorn
+# (очищать при деплое); без него видны только метрики процесса, принявшего скрейп.
+# MENU_METRICS_TOKEN — скрейпер шлёт "Authorization: Bearer <token>". По умолчанию
+# токена нет, и тогда /metrics отвечает только при DEBUG, в проде — 403: задайте токен.
+MENU_METRICS = os.getenv("MENU_METRICS", "true").strip().lower() == "true"
+MENU_METRICS_DIR = os.getenv("MENU_METRICS_DIR", "")
+MENU_METRICS_TOKEN = os.getenv("MENU_METRICS_TOKEN", "")
+
+# Кэш готовых страниц меню для анонимов (в памяти процесса, LRU по байтам).
+# TTL ограничивает устаревание «популярных» на главной — остальное следует за версией меню.
+MENU_PAGE_CACHE = os.getenv("MENU_PAGE_CACHE", "true").strip().lower() == "true"
+MENU_PAGE_CACHE_BYTES = int(os.getenv("MENU_PAGE_CACHE_BYTES", str(32 * 1024 * 1024)))
+MENU_PAGE_CACHE_TTL = int(os.getenv("MENU_PAGE_CACHE_TTL", "60"))
+# Страницы меню — общие для всех «оболочки» (Cache-Control: public): столько секунд
+# их могут держать браузер и прокси/CDN.
+MENU_SHELL_MAX_AGE = int(os.getenv("MENU_SHELL_MAX_AGE", "30"))
+
+# Фоновые задачи (нарезка картинок) выполняет `manage.py run_jobs`.
+# MENU_JOBS_EAGER=true — выполнять их сразу после коммита в том же процессе (dev без воркера).
+MENU_JOBS_EAGER = os.getenv("MENU_JOBS_EAGER", "false").strip().lower() == "true"
+
+# Статическая копия меню для nginx/CDN (`manage.py prerender_menu`, см. menuapp/prerender.py).
+# Если каталог задан, после правок меню её обновляет воркер. MENU_PRERENDER_HOST — Host
+# для рендера (по умолчанию первый из ALLOWED_HOSTS).
+MENU_PRERENDER_DIR = os.getenv("MENU_PRERENDER_DIR", "")
+MENU_PRERENDER_HOST = os.getenv("MENU_PRERENDER_HOST", "")
+
 # =========================
 # ПРОЧЕЕ
 # =========================
@@ -5,10 +5,14 @@ from django.contrib import admin
 from django.urls import include, path
 from django.conf.urls.i18n import i18n_patterns
 
+from menuapp.views import prometheus_metrics
+
 # вне i18n: служебное переключение языка
 urlpatterns = [
     path("i18n/", include("django.conf.urls.i18n")),
     path("rosetta/", include("rosetta.urls")),  # только для staff
+    path("api/", include("menuapp.api")),       # read-API меню (язык — ?lang=, иначе куки/Accept-Language)
+    path("metrics", prometheus_metrics, name="metrics"),  # Prometheus
 ]
 
 # локализованные маршруты приложения и админка
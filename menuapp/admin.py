@@ -1,7 +1,37 @@
 # menuapp/admin.py
 from django.contrib import admin
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Category, Dish
+
+from . import images, jobs, search
+from .models import Category, Dish, Job
+
+
+def image_cell(obj, field: str):
+    """Превью картинки + статус нарезки производных (её делает воркер, см. jobs.py)."""
+    img = getattr(obj, field, None)
+    if not img:
+        return "—"
+    try:
+        url = img.url
+    except Exception:
+        return "—"
+    state = images.status(obj, field)
+    if state == "pending":
+        failed = getattr(obj, "image_job_status", None) == Job.STATUS_FAILED
+        badge = ("⚠ ошибка нарезки", "#b42318") if failed else ("⏳ обрабатывается", "#8a6d00")
+    elif state == "broken":
+        badge = ("не картинка", "#b42318")
+    else:
+        badge = None
+    if badge is None:
+        return format_html('<img src="{}" width="60" style="border-radius:6px" />', url)
+    return format_html(
+        '<img src="{}" width="60" style="border-radius:6px" /><br><small style="color:{}">{}</small>',
+        url, badge[1], badge[0],
+    )
 
 
 @admin.register(Category)
@@ -47,15 +77,12 @@ class CategoryAdmin(admin.ModelAdmin):
     )
     readonly_fields = ("image_preview",)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(image_job_status=jobs.image_job_status(Category))
+
     @admin.display(description="Фото")
     def image_preview(self, obj):
-        img = getattr(obj, "image", None)
-        if not img:
-            return "—"
-        try:
-            return format_html('<img src="{}" width="60" style="border-radius:6px" />', img.url)
-        except Exception:
-            return "—"
+        return image_cell(obj, "image")
 
     actions = ["act_show_in_nav", "act_hide_in_nav", "act_mark_21", "act_unmark_21"]
 
@@ -93,11 +120,8 @@ class DishAdmin(admin.ModelAdmin):
     list_display_links = ("name_ru",)
     list_editable = ("is_available", "position")
     list_filter = ("category", "is_available")
-    search_fields = (
-        "name_ru", "name_en", "name_kk",
-        "description_ru", "description_en", "description_kk",
-        "slug",
-    )
+    # названия и описания ищет индекс search.py (см. get_search_results)
+    search_fields = ("slug",)
     ordering = ("category", "position", "name_ru")
     list_select_related = ("category",)
     autocomplete_fields = ("category",)
@@ -123,27 +147,25 @@ class DishAdmin(admin.ModelAdmin):
     readonly_fields = ("image_preview", "passport_preview")
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related("category")
+        return (
+            super().get_queryset(request)
+            .select_related("category")
+            .annotate(image_job_status=jobs.image_job_status(Dish))
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        ids = search.search(search_term)
+        return queryset.filter(Q(pk__in=ids) | Q(slug__icontains=search_term.strip())), False
 
     @admin.display(description="Фото")
     def image_preview(self, obj):
-        img = getattr(obj, "image", None)
-        if not img:
-            return "—"
-        try:
-            return format_html('<img src="{}" width="60" style="border-radius:6px" />', img.url)
-        except Exception:
-            return "—"
+        return image_cell(obj, "image")
 
     @admin.display(description="Паспорт")
     def passport_preview(self, obj):
-        pb = getattr(obj, "passport_bg", None)
-        if not pb:
-            return "—"
-        try:
-            return format_html('<img src="{}" width="60" style="border-radius:6px" />', pb.url)
-        except Exception:
-            return "—"
+        return image_cell(obj, "passport_bg")
 
     actions = ["mark_available", "mark_unavailable"]
 
@@ -154,3 +176,36 @@ class DishAdmin(admin.ModelAdmin):
     @admin.action(description="Скрыть из меню")
     def mark_unavailable(self, request, queryset):
         queryset.update(is_available=False)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "key", "status", "attempts", "run_after", "locked_by", "updated_at")
+    list_filter = ("status", "kind")
+    search_fields = ("key", "last_error")
+    ordering = ("-id",)
+    list_per_page = 100
+    readonly_fields = (
+        "kind", "key", "payload", "status", "attempts", "max_attempts",
+        "run_after", "locked_at", "locked_by", "last_error", "created_at", "updated_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    actions = ["retry"]
+
+    @admin.action(description="Повторить")
+    def retry(self, request, qs):
+        retried = 0
+        for job in qs.exclude(status__in=[Job.STATUS_QUEUED, Job.STATUS_RUNNING]):
+            try:
+                with transaction.atomic():
+                    Job.objects.filter(pk=job.pk).update(
+                        status=Job.STATUS_QUEUED, attempts=0, run_after=timezone.now(),
+                        locked_at=None, locked_by="", updated_at=timezone.now(),
+                    )
+            except IntegrityError:
+                continue  # такая же задача уже в очереди
+            retried += 1
+        self.message_user(request, f"Поставлено в очередь: {retried}")
@@ -1,39 +1,123 @@
+# menuapp/api.py
+"""
+Read-API меню для планшетов и фронта.
+
+Ответы строятся из снимка меню, а ETag — из версии меню в кэше, языка
+ответа и куки 21+: повторный опрос с If-None-Match получает 304, не трогая ORM.
+If-Modified-Since не проверяется: время правки меню не различает языки,
+и клиент, сменивший язык, получил бы 304 на тело другого языка
+(Last-Modified отдаётся только для сведения).
+
+/api/ живёт вне i18n_patterns: язык задаётся параметром ?lang=ru|kk|en,
+без него — из куки языка или Accept-Language, иначе ru.
+
+/api/search/?q=… — поиск блюд по индексу в памяти (search.py), ответ —
+список блюд в формате /api/dishes/<slug>/, лучшие совпадения первыми.
+"""
+import hashlib
+
+from django.http import Http404
 from django.urls import path
-from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.translation import get_language_from_request
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from .models import Category, Dish
-from .serializers import CategorySerializer, DishSerializer
+from . import search as menu_search
+from .models import _normalize_lang
+from .serializers import AGE_COOKIE, CategorySerializer, DishSerializer
+from .snapshot import get_menu, get_menu_modified, get_menu_version
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+def _request_lang(request) -> str:
+    # LocaleMiddleware для путей без префикса выставляет язык по умолчанию,
+    # поэтому куку языка и Accept-Language читаем сами
+    lang = request.GET.get("lang") or get_language_from_request(request)
+    return _normalize_lang(lang)
+
+
+def _etag(request, *args, **kwargs) -> str:
+    # тело ответа зависит от версии меню, языка (?lang=, куки или Accept-Language),
+    # куки 21+ и абсолютного URL
+    raw = "|".join((
+        str(get_menu_version()),
+        _request_lang(request),
+        request.COOKIES.get(AGE_COOKIE, ""),
+        request.build_absolute_uri(),
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()
 
 
+def _respond(request, data, menu) -> Response:
+    resp = Response(data)
+    resp["X-Menu-Version"] = str(menu.version)
+    # клиент всегда переспрашивает, но дешёвым условным запросом
+    patch_cache_control(resp, no_cache=True)
+    patch_vary_headers(resp, ("Cookie", "Accept-Language"))
+    resp["Last-Modified"] = http_date(get_menu_modified().timestamp())
+    return resp
+
+
+def _context(request, menu) -> dict:
+    return {"request": request, "lang": menu.lang}
+
+
+@condition(etag_func=_etag)
 @api_view(['GET'])
 def categories(request):
-    qs = Category.objects.prefetch_related('dishes__modifier_groups__modifiers')
-    return Response(CategorySerializer(qs, many=True).data)
+    menu = get_menu(_request_lang(request))
+    data = CategorySerializer(menu.categories, many=True, context=_context(request, menu)).data
+    return _respond(request, data, menu)
 
 
+@condition(etag_func=_etag)
 @api_view(['GET'])
 def category(request, slug):
-    obj = get_object_or_404(
-        Category.objects.prefetch_related('dishes__modifier_groups__modifiers'),
-        slug=slug,
-    )
-    return Response(CategorySerializer(obj).data)
+    menu = get_menu(_request_lang(request))
+    obj = menu.category(slug)
+    if obj is None:
+        raise Http404
+    return _respond(request, CategorySerializer(obj, context=_context(request, menu)).data, menu)
 
 
+@condition(etag_func=_etag)
 @api_view(['GET'])
 def dish(request, slug):
-    obj = get_object_or_404(
-        Dish.objects.prefetch_related('modifier_groups__modifiers'),
-        slug=slug,
-    )
-    return Response(DishSerializer(obj).data)
+    menu = get_menu(_request_lang(request))
+    obj = menu.dish(slug)
+    if obj is None:
+        raise Http404
+    return _respond(request, DishSerializer(obj, context=_context(request, menu)).data, menu)
+
+
+@condition(etag_func=_etag)
+@api_view(['GET'])
+def search(request):
+    menu = get_menu(_request_lang(request))
+    try:
+        limit = min(max(int(request.GET.get("limit", SEARCH_LIMIT)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        limit = SEARCH_LIMIT
+    found = []
+    for dish_id in menu_search.search(request.GET.get("q", "")):
+        obj = menu.dishes_by_id.get(dish_id)
+        # недоступные блюда в снимке есть (для /api/dishes/), в поиске их не показываем
+        if obj is None or not obj.is_available:
+            continue
+        found.append(obj)
+        if len(found) == limit:
+            break
+    return _respond(request, DishSerializer(found, many=True, context=_context(request, menu)).data, menu)
 
 
 urlpatterns = [
-    path('categories/', categories),
-    path('categories/<slug:slug>/', category),
-    path('dishes/<slug:slug>/', dish),
+    path('categories/', categories, name='api_categories'),
+    path('categories/<slug:slug>/', category, name='api_category'),
+    path('dishes/<slug:slug>/', dish, name='api_dish'),
+    path('search/', search, name='api_search'),
 ]
-
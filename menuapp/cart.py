@@ -0,0 +1,62 @@
+# menuapp/cart.py
+"""
+Сводка корзины для бейджа (сколько позиций и на какую сумму).
+
+Хранится в кэше Django по id пользователя и сбрасывается теми, кто меняет
+заказ: add_to_order, finalize_order и переходы статусов на кухне.
+Кэш, а не сессия — кухня сбрасывает сводку чужого пользователя.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+from .models import Order
+
+CART_TTL = 60 * 10  # страховка на случай пропущенного сброса
+OPEN_STATUSES = (Order.STATUS_NEW, Order.STATUS_KITCHEN)
+
+
+def _key(user_id: int) -> str:
+    return f"cart:summary:{user_id}"
+
+
+def _compute(user_id: int) -> Optional[dict]:
+    order = (
+        Order.objects.filter(user_id=user_id, status__in=OPEN_STATUSES)
+        .order_by("-created_at")
+        .values("id", "status", "total_quantity", "total_price")
+        .first()
+    )
+    if order is None:
+        return None
+    return {
+        "order_id": order["id"],
+        "status": order["status"],
+        "quantity": order["total_quantity"],
+        "total": order["total_price"],
+    }
+
+
+def get_cart_summary(user) -> Optional[dict]:
+    """Сводка открытого заказа или None; в установившемся режиме без запросов."""
+    if not getattr(user, "is_authenticated", False):
+        return None
+    key = _key(user.pk)
+    summary = cache.get(key, False)
+    metrics.cache_result("cart_summary", "miss" if summary is False else "hit")
+    if summary is False:
+        summary = _compute(user.pk)
+        cache.set(key, summary, CART_TTL)
+    return summary
+
+
+def invalidate_cart(user_id: Optional[int]) -> None:
+    """Сбросить сводку после коммита (иначе параллельный запрос закэширует старое)."""
+    if not user_id:
+        return
+    cache.delete(_key(user_id))
+    transaction.on_commit(lambda: cache.delete(_key(user_id)))
@@ -1,7 +1,10 @@
 # menuapp/context_processors.py
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import get_language
-from .models import Category, Order
+from .cart import get_cart_summary
+from .models import Order
+from .snapshot import get_menu
 
 AGE_COOKIE = "AGE_VERIFIED_21"
 
@@ -12,25 +15,36 @@ def _age_verified(request):
 
 
 def nav_categories(request):
-    """Категории для навбара (сортируем по реальным полям БД)."""
-    categories = (
-        Category.objects
-        .filter(show_in_nav=True)
-        .order_by("nav_position", "position", "id")
+    """
+    Категории для навбара — из снимка меню (порядок nav_position, position, id).
+    Снимок версионирован: show_in_nav/nav_position/названия, в т.ч. через
+    bulk-экшены CategoryAdmin, поднимают версию, тёплый навбар — без запросов.
+    """
+    return {"nav_categories": get_menu().nav_categories}
+
+
+def _open_order(user):
+    if not user.is_authenticated:
+        return None
+    return (
+        Order.objects.filter(user=user, status__in=["new", "kitchen"])
+        .order_by("-created_at")
+        .first()
     )
-    return {"nav_categories": categories}
 
 
 def cart_processor(request):
-    """Текущая корзина (если пользователь залогинен)."""
-    order = None
-    if request.user.is_authenticated:
-        order = (
-            Order.objects.filter(user=request.user, status__in=["new", "kitchen"])
-            .order_by("-created_at")
-            .first()
-        )
-    return {"cart_order": order}
+    """
+    Текущая корзина (если пользователь залогинен). Оба значения ленивые:
+    шаблон, который их не трогает, не платит ни запросом, ни походом в кэш.
+      cart_summary — {order_id, status, quantity, total} из кэша (для бейджа)
+      cart_order   — сам заказ (запрос в БД, только если шаблону он нужен)
+    """
+    user = request.user
+    return {
+        "cart_summary": SimpleLazyObject(lambda: get_cart_summary(user)),
+        "cart_order": SimpleLazyObject(lambda: _open_order(user)),
+    }
 
 
 def brand_contacts(request):
@@ -0,0 +1,134 @@
+# menuapp/events.py
+"""
+Шина событий заказов для экранов кухни.
+
+Брокер живёт в памяти процесса: синхронные вьюхи публикуют событие после
+коммита, а SSE-подписчики (async-вьюха kitchen_events) получают его через
+свою asyncio-очередь. Это заглушка вместо внешнего брокера — кухня должна
+обслуживаться одним ASGI-процессом (uvicorn/daphne, см. menu/asgi.py).
+
+Последние события хранятся в кольцевом буфере, чтобы переподключившийся
+экран догнал пропущенное по Last-Event-ID.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from django.db import transaction
+
+from .models import DEFAULT_LANG, Order, OrderItem, localized
+
+ORDER_CREATED = "order.created"
+ORDER_UPDATED = "order.updated"      # поменялись позиции открытого заказа
+ORDER_FINALIZED = "order.finalized"
+ORDER_ACCEPTED = "order.accepted"
+ORDER_READY = "order.ready"
+
+BACKLOG_SIZE = 200
+QUEUE_SIZE = 100
+
+_ids = itertools.count(1)
+_backlog: deque[dict] = deque(maxlen=BACKLOG_SIZE)
+_subscribers: set["Subscription"] = set()
+_lock = threading.Lock()
+
+
+class Subscription:
+    """Одна подписка = один открытый SSE-поток."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, event: dict) -> None:
+        # вызывается из любого потока; в очередь кладём в потоке цикла подписчика
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict) -> None:
+        if self.queue.full():
+            # медленный экран: выкидываем самое старое, клиент догонит по полному списку
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def subscribe(last_event_id: Optional[int] = None) -> tuple[Subscription, list[dict]]:
+    """Подписаться из async-кода; вернёт подписку и пропущенные события."""
+    sub = Subscription(asyncio.get_running_loop())
+    with _lock:
+        _subscribers.add(sub)
+        missed = [e for e in _backlog if last_event_id is not None and e["id"] > last_event_id]
+    return sub, missed
+
+
+def unsubscribe(sub: Subscription) -> None:
+    with _lock:
+        _subscribers.discard(sub)
+
+
+def _publish_now(event_type: str, data: dict) -> dict:
+    event = {"id": next(_ids), "type": event_type, "ts": time.time(), "data": data}
+    with _lock:
+        _backlog.append(event)
+        subscribers = list(_subscribers)
+    for sub in subscribers:
+        try:
+            sub.deliver(event)
+        except RuntimeError:
+            # цикл подписчика уже закрыт
+            unsubscribe(sub)
+    return event
+
+
+def publish(event_type: str, data: dict) -> None:
+    """Отправить событие подписчикам после коммита текущей транзакции."""
+    transaction.on_commit(lambda: _publish_now(event_type, data))
+
+
+def order_payload(order: Order, with_items: bool = True, items=None) -> dict:
+    """
+    Данные заказа для карточки на экране кухни. Позиции можно передать
+    готовыми (prefetch), иначе — один запрос за ними.
+    """
+    data = {"order_id": order.pk, "status": order.status}
+    if with_items:
+        data["user"] = order.user.username if order.user_id else ""
+        if items is None:
+            items = OrderItem.objects.filter(order=order).select_related("dish").order_by("id")
+        data["items"] = [
+            {"dish_id": i.dish_id, "dish": localized(i.dish, "name", DEFAULT_LANG), "quantity": i.quantity}
+            for i in items
+        ]
+    return data
+
+
+def cart_payload(order: Order, quantities: dict[int, int], names: dict[int, str]) -> dict:
+    """
+    Данные заказа после записи в корзину — без запроса к БД: только
+    затронутые позиции с их новым количеством (dish_id → quantity), имена
+    блюд — из снимка меню. merge=True: экран кухни вливает позиции в
+    карточку по dish_id, а не заменяет список.
+    """
+    data = order_payload(order, with_items=False)
+    data["user"] = order.user.username if order.user_id else ""
+    data["merge"] = True
+    data["items"] = [
+        {"dish_id": pk, "dish": names.get(pk, ""), "quantity": quantity} for pk, quantity in quantities.items()
+    ]
+    return data
+
+
+def format_sse(event: dict) -> str:
+    payload = json.dumps(event["data"], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,206 @@
+# menuapp/images.py
+"""
+Производные картинок меню: несколько ширин в AVIF / WebP / JPEG.
+
+Оригинал остаётся как есть, производные кладутся рядом с ним в то же
+хранилище: dishes/borsch.jpg → dishes/borsch.w640.webp и т.д. Что получилось,
+записывается в JSON-поле image_variants модели (манифест), чтобы шаблоны
+и API строили srcset без обращений к хранилищу. Нарезкой занимается воркер
+(задача "images" в jobs.py), а не запрос админки: пока он не дошёл до
+файла, манифест устаревший и страницы отдают оригинал.
+
+Манифест одного поля:
+    {"src": "dishes/borsch.jpg", "width": 2400,
+     "formats": {"avif": [[320, "dishes/borsch.w320.avif"], ...], "webp": [...], "jpeg": [...]}}
+"""
+from __future__ import annotations
+
+import io
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+
+WIDTHS = (320, 640, 1280, 1920)
+
+# формат → (расширение, имя для Pillow, параметры сохранения, MIME)
+FORMATS = {
+    "avif": ("avif", "AVIF", {"quality": 55}, "image/avif"),
+    "webp": ("webp", "WEBP", {"quality": 78, "method": 4}, "image/webp"),
+    "jpeg": ("jpg", "JPEG", {"quality": 80, "optimize": True, "progressive": True}, "image/jpeg"),
+}
+
+
+def available_formats() -> list[str]:
+    from PIL import features
+
+    formats = []
+    for fmt in FORMATS:
+        if fmt == "jpeg" or features.check(fmt):
+            formats.append(fmt)
+    return formats
+
+
+def _target_widths(width: int) -> list[int]:
+    """Ширины не больше оригинала; маленький оригинал — одна производная в его размер."""
+    widths = [w for w in WIDTHS if w < width]
+    if width <= WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def _variant_name(name: str, width: int, ext: str) -> str:
+    root, _ext = os.path.splitext(name)
+    return f"{root}.w{width}.{ext}"
+
+
+# ========= сборка =========
+def build(storage: Storage, name: str) -> dict:
+    """Нарезать производные для файла `name` из `storage`; вернуть манифест."""
+    from PIL import Image, ImageOps
+
+    with storage.open(name, "rb") as f:
+        img = Image.open(f)
+        img.load()
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+
+    manifest = {"src": name, "width": img.width, "formats": {}}
+    for fmt in available_formats():
+        if fmt == "jpeg" and has_alpha:
+            continue  # у прозрачных картинок запасной вариант — сам оригинал
+        ext, pil_format, options, _mime = FORMATS[fmt]
+        out = []
+        for width in _target_widths(img.width):
+            height = max(1, round(img.height * width / img.width))
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            buf = io.BytesIO()
+            resized.save(buf, pil_format, **options)
+            variant = _variant_name(name, width, ext)
+            if storage.exists(variant):
+                storage.delete(variant)
+            storage.save(variant, ContentFile(buf.getvalue()))
+            out.append([width, variant])
+        manifest["formats"][fmt] = out
+    return manifest
+
+
+def delete(storage: Storage, manifest: Optional[dict], keep: Optional[dict] = None) -> None:
+    """Удалить файлы манифеста (кроме тех, что есть в `keep`)."""
+    if not manifest:
+        return
+    keep_names = {n for items in (keep or {}).get("formats", {}).values() for _w, n in items}
+    for items in manifest.get("formats", {}).values():
+        for _w, name in items:
+            if name not in keep_names:
+                try:
+                    storage.delete(name)
+                except Exception:
+                    pass
+
+
+def refresh(instance, fields: tuple[str, ...]) -> bool:
+    """
+    Привести instance.image_variants в соответствие с файлами в `fields`:
+    пересобрать только поля, у которых сменился файл. True — если манифест
+    изменился (вызывающий сохраняет его сам).
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    variants = dict(instance.image_variants or {})
+    changed = False
+    for name in fields:
+        f = getattr(instance, name)
+        current = variants.get(name)
+        if not f:
+            if current:
+                delete(f.storage, current)
+                variants.pop(name)
+                changed = True
+            continue
+        if current and current.get("src") == f.name:
+            continue
+        try:
+            manifest = build(f.storage, f.name)
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            # не картинка / неподдерживаемый формат: отдаём оригинал, как раньше.
+            # Остальные ошибки (хранилище, обрыв файла) летят наружу — задачу
+            # повторит воркер (см. jobs.py)
+            manifest = {"src": f.name, "width": None, "formats": {}}
+        delete(f.storage, current, keep=manifest)
+        variants[name] = manifest
+        changed = True
+    if changed:
+        instance.image_variants = variants
+    return changed
+
+
+def stale(instance, fields: tuple[str, ...]) -> bool:
+    """Есть ли поле, чей манифест не соответствует текущему файлу (без обращений к хранилищу)."""
+    variants = instance.image_variants or {}
+    for name in fields:
+        f = getattr(instance, name)
+        current = variants.get(name)
+        if f and (not current or current.get("src") != f.name):
+            return True
+        if not f and current:
+            return True
+    return False
+
+
+def status(instance, name: str) -> str:
+    """Для админки: "" — файла нет, ready / broken (не картинка) / pending (ждёт воркера)."""
+    f = getattr(instance, name)
+    if not f:
+        return ""
+    current = (instance.image_variants or {}).get(name)
+    if not current or current.get("src") != f.name:
+        return "pending"
+    return "ready" if current.get("formats") else "broken"
+
+
+# ========= для шаблонов и API =========
+@dataclass(eq=False)
+class Picture:
+    src: str                                   # JPEG ~640px (или оригинал) для <img src>
+    srcset: str = ""                           # JPEG-ширины для <img srcset>
+    sources: list[dict] = field(default_factory=list)  # [{"type": "image/avif", "srcset": "..."}]
+    widths: dict[str, list[tuple[int, str]]] = field(default_factory=dict)  # формат → [(ширина, url)]
+
+    def best(self, width: int, fmt: str = "webp") -> str:
+        """URL ближайшей производной не уже `width` (для CSS-фонов)."""
+        items = self.widths.get(fmt) or self.widths.get("jpeg") or []
+        for w, url in items:
+            if w >= width:
+                return url
+        return items[-1][1] if items else self.src
+
+
+def picture(storage: Storage, name: Optional[str], manifest: Optional[dict]) -> Optional[Picture]:
+    if not name:
+        return None
+    try:
+        src = storage.url(name)
+    except Exception:
+        return None
+    pic = Picture(src=src)
+    if not manifest or manifest.get("src") != name:
+        return pic  # производных ещё нет (или они от прошлого файла)
+
+    formats = manifest.get("formats", {})
+    for fmt in FORMATS:  # порядок <source> важен: браузер берёт первый поддерживаемый
+        urls = [(w, storage.url(n)) for w, n in formats.get(fmt, [])]
+        if not urls:
+            continue
+        pic.widths[fmt] = urls
+        srcset = ", ".join(f"{url} {w}w" for w, url in urls)
+        if fmt == "jpeg":
+            pic.srcset = srcset
+        else:
+            pic.sources.append({"type": FORMATS[fmt][3], "srcset": srcset})
+    if "jpeg" in pic.widths:
+        pic.src = pic.best(640, "jpeg")  # браузеры без srcset не тянут оригинал
+    return pic
@@ -0,0 +1,230 @@
+# menuapp/jobs.py
+"""
+Фоновые задачи на очереди в БД (модель Job) и воркер для неё.
+
+    enqueue("images", {"model": "menuapp.dish", "pk": 7}, key="images:menuapp.dish:7")
+
+  • Задача создаётся после коммита транзакции — воркер не увидит данных,
+    которых ещё нет.
+  • key — идемпотентность: пока такая задача ждёт в очереди, повторный
+    enqueue ничего не добавляет (частичный уникальный индекс), так что
+    десять сохранений блюда подряд дают одну нарезку.
+  • Воркер (manage.py run_jobs) берёт задачи через SELECT … FOR UPDATE
+    SKIP LOCKED: несколько воркеров не хватают одну и ту же.
+  • Упавшая задача повторяется с экспоненциальной паузой, после
+    max_attempts — status=failed с текстом ошибки (видно в админке).
+    Задача, чей воркер умер, через LEASE снова считается свободной.
+
+Обработчики должны быть идемпотентными: одна задача может выполниться
+дважды (повтор после падения, истёкшая аренда). Они читают актуальное
+состояние из БД, а не из payload.
+
+MENU_JOBS_EAGER=true — выполнять задачи сразу после коммита в том же
+процессе (dev без воркера).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import CharField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from . import images, prerender
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+LEASE = 600            # сек.: дольше задача не выполняется — воркер считается умершим
+BACKOFF_BASE = 10      # сек. до первого повтора, дальше ×2
+BACKOFF_MAX = 3600
+PRERENDER_DELAY = 5    # сек.: серия правок в админке — одна пересборка статической копии
+ERROR_LIMIT = 4000     # символов traceback в last_error
+
+Handler = Callable[[dict], None]
+HANDLERS: dict[str, Handler] = {}
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    def register(fn: Handler) -> Handler:
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def eager() -> bool:
+    return bool(getattr(settings, "MENU_JOBS_EAGER", False))
+
+
+# ========= постановка =========
+def enqueue(kind: str, payload: Optional[dict] = None, key: str = "", delay: float = 0) -> None:
+    """Поставить задачу после коммита текущей транзакции (вне транзакции — сразу)."""
+    payload = payload or {}
+
+    def create():
+        if eager():
+            try:
+                HANDLERS[kind](payload)
+            except Exception:
+                log.exception("eager job %s failed", kind)
+            return
+        # ON CONFLICT DO NOTHING: такая же задача уже ждёт — она и сделает работу
+        Job.objects.bulk_create(
+            [Job(kind=kind, key=key, payload=payload, run_after=timezone.now() + timedelta(seconds=delay))],
+            ignore_conflicts=True,
+        )
+
+    transaction.on_commit(create)
+
+
+# ========= выполнение =========
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker: str) -> Optional[Job]:
+    """Взять одну готовую к запуску задачу (или задачу с истёкшей арендой)."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.filter(
+                Q(status=Job.STATUS_QUEUED, run_after__lte=now)
+                | Q(status=Job.STATUS_RUNNING, locked_at__lt=now - timedelta(seconds=LEASE))
+            )
+            .order_by("run_after", "id")
+            .select_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.STATUS_RUNNING
+        job.attempts += 1
+        job.locked_at = now
+        job.locked_by = worker
+        job.save(update_fields=["status", "attempts", "locked_at", "locked_by", "updated_at"])
+    return job
+
+
+def backoff(attempts: int) -> float:
+    return min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+
+
+def _finish(job: Job, **fields) -> None:
+    # пишем, только если аренда всё ещё наша: иначе задачу уже перехватил другой воркер
+    fields["updated_at"] = timezone.now()
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts).update(**fields)
+
+
+def run(job: Job) -> bool:
+    """Выполнить взятую задачу; True — успешно."""
+    try:
+        fn = HANDLERS.get(job.kind)
+        if fn is None:
+            raise LookupError(f"нет обработчика для задачи {job.kind!r}")
+        fn(job.payload)
+    except Exception:
+        error = traceback.format_exc()[-ERROR_LIMIT:]
+        log.exception("job %s (%s) failed, attempt %s/%s", job.pk, job.kind, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            _finish(job, status=Job.STATUS_FAILED, locked_at=None, last_error=error)
+            return False
+        try:
+            with transaction.atomic():
+                _finish(
+                    job, status=Job.STATUS_QUEUED, locked_at=None, last_error=error,
+                    run_after=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+                )
+        except IntegrityError:
+            # пока мы работали, такую же задачу поставили заново — повтор сделает она
+            _finish(job, status=Job.STATUS_DONE, locked_at=None, last_error=error)
+        return False
+    _finish(job, status=Job.STATUS_DONE, locked_at=None, last_error="")
+    return True
+
+
+def work(
+    worker: Optional[str] = None,
+    *,
+    once: bool = False,
+    sleep: float = 1.0,
+    max_jobs: Optional[int] = None,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> int:
+    """
+    Цикл воркера. once — выйти, когда очередь опустела; иначе ждать новых
+    задач, опрашивая БД раз в `sleep` сек. Возвращает число выполненных задач.
+    """
+    worker = worker or worker_name()
+    done = 0
+    while not should_stop() and (max_jobs is None or done < max_jobs):
+        if not transaction.get_connection().in_atomic_block:
+            close_old_connections()  # долгоживущий процесс: не держим протухшее соединение
+        job = claim(worker)
+        if job is None:
+            if once:
+                break
+            time.sleep(sleep)
+            continue
+        run(job)
+        done += 1
+    return done
+
+
+def purge(days: int) -> int:
+    """Удалить выполненные задачи старше `days` дней (упавшие остаются для разбора)."""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Job.objects.filter(status=Job.STATUS_DONE, updated_at__lt=cutoff).delete()
+    return deleted
+
+
+# ========= картинки =========
+def image_key(model, pk) -> str:
+    return f"images:{model._meta.label_lower}:{pk}"
+
+
+def enqueue_images(instance) -> None:
+    model = type(instance)
+    enqueue("images", {"model": model._meta.label_lower, "pk": instance.pk}, key=image_key(model, instance.pk))
+
+
+def image_job_status(model) -> Subquery:
+    """Статус последней задачи нарезки для строки — аннотация для списка в админке."""
+    key = Concat(Value(f"images:{model._meta.label_lower}:"), Cast(OuterRef("pk"), CharField()))
+    return Subquery(Job.objects.filter(key=key).order_by("-id").values("status")[:1])
+
+
+@handler("images")
+def refresh_images(payload: dict) -> None:
+    model = apps.get_model(payload["model"])
+    obj = model.objects.filter(pk=payload["pk"]).first()
+    if obj is None:
+        return  # удалили, пока задача ждала
+    if not images.refresh(obj, model.IMAGE_FIELDS):
+        return
+    # пишем, только если файлы не сменились за время нарезки — иначе
+    # манифест устарел, и новую нарезку сделает уже поставленная задача
+    same_files = Q(pk=obj.pk)
+    for name in model.IMAGE_FIELDS:
+        f = getattr(obj, name)
+        same_files &= Q(**{name: f.name}) if f else Q(**{name: ""}) | Q(**{f"{name}__isnull": True})
+    model.objects.filter(same_files).update(image_variants=obj.image_variants)
+
+
+# ========= статическая копия меню =========
+def enqueue_prerender() -> None:
+    if getattr(settings, "MENU_PRERENDER_DIR", ""):
+        enqueue("prerender", key="prerender", delay=PRERENDER_DELAY)
+
+
+@handler("prerender")
+def run_prerender(payload: dict) -> None:
+    prerender.build(settings.MENU_PRERENDER_DIR)
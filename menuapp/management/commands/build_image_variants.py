@@ -0,0 +1,53 @@
+# menuapp/management/commands/build_image_variants.py
+"""
+Нарезать производные (AVIF/WebP/JPEG по ширинам) для уже загруженных картинок.
+
+    python manage.py build_image_variants          # только где их нет/устарели
+    python manage.py build_image_variants --force  # пересобрать все
+    python manage.py build_image_variants --enqueue  # отдать воркеру (run_jobs)
+"""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from menuapp import images, jobs
+from menuapp.models import Category, Dish
+
+
+class Command(BaseCommand):
+    help = "Собрать производные картинок блюд и категорий (srcset)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="пересобрать, даже если манифест актуален")
+        parser.add_argument("--enqueue", action="store_true", help="не резать здесь, а поставить задачи в очередь")
+
+    def handle(self, *args, **opts):
+        for model in (Category, Dish):
+            changed, queued, failed = [], [], 0
+            for obj in model.objects.order_by("id").iterator():
+                if opts["force"]:
+                    obj.image_variants = {
+                        k: {**v, "src": None} for k, v in (obj.image_variants or {}).items()
+                    }
+                if opts["enqueue"]:
+                    if images.stale(obj, model.IMAGE_FIELDS):
+                        queued.append(obj)
+                    continue
+                try:
+                    if images.refresh(obj, model.IMAGE_FIELDS):
+                        changed.append(obj)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} #{obj.pk}: {e}")
+            # bulk_update идёт через MenuQuerySet.update → menu_changed, версия меню сдвинется
+            model.objects.bulk_update(changed, ["image_variants"], batch_size=200)
+            if queued and opts["force"]:
+                # воркер сверяет манифест из БД — сбросим его и там
+                model.objects.bulk_update(queued, ["image_variants"], batch_size=200)
+            for obj in queued:
+                jobs.enqueue_images(obj)
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: обновлено {len(changed)}, "
+                f"в очереди {len(queued)}, ошибок {failed}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Форматы: {', '.join(images.available_formats())}"))
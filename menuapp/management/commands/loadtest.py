@@ -0,0 +1,393 @@
+# menuapp/management/commands/loadtest.py
+"""
+Нагрузочный прогон «обеденного пика» против живого локального сервера.
+
+    python manage.py loadtest --seed --base-url http://127.0.0.1:8000 \\
+        --concurrency 32 --duration 60 --output loadtest.json
+
+1) --seed создаёт синтетическое меню (категории/блюда со слагами lt-*),
+   гостей lt-guest-N и повара lt-chef, а сессии для них пишет прямо в БД —
+   логин через форму не нужен.
+2) N потоков гоняют смесь home / category_detail / dish_detail /
+   add_to_order / finalize_order / kitchen_orders / mark_ready.
+3) Итог — пропускная способность и p50/p95/p99 по каждому эндпоинту,
+   в консоль и в JSON (--output), чтобы сравнивать релизы (--baseline).
+"""
+from __future__ import annotations
+
+import http.cookiejar
+import json
+import math
+import random
+import secrets
+import string
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from decimal import Decimal
+from importlib import import_module
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from menuapp.models import Category, Dish, Order
+
+PREFIX = "lt"
+DEFAULT_MIX = {
+    "home": 30,
+    "category_detail": 20,
+    "dish_detail": 15,
+    "add_to_order": 18,
+    "finalize_order": 5,
+    "kitchen_orders": 6,
+    "mark_ready": 6,
+}
+LANG_PREFIXES = ("", "/kk", "/en")
+
+
+# ========= данные =========
+def seed(categories: int, dishes_per_category: int, guests: int) -> None:
+    for c in range(categories):
+        cat, _ = Category.objects.update_or_create(
+            slug=f"{PREFIX}-cat-{c}",
+            defaults={
+                "name_ru": f"Категория {c}",
+                "name_en": f"Category {c}",
+                "name_kk": f"Санат {c}",
+                "position": c,
+                "nav_position": c,
+                "is_21plus": c % 5 == 4,
+            },
+        )
+        for d in range(dishes_per_category):
+            Dish.objects.update_or_create(
+                slug=f"{PREFIX}-dish-{c}-{d}",
+                defaults={
+                    "category": cat,
+                    "name_ru": f"Блюдо {c}.{d}",
+                    "name_en": f"Dish {c}.{d}",
+                    "description_ru": "Синтетическое блюдо для нагрузочного теста.",
+                    "base_price": Decimal(1000 + 10 * d),
+                    "position": d,
+                    "is_available": True,
+                },
+            )
+    for g in range(guests):
+        User.objects.get_or_create(username=f"{PREFIX}-guest-{g}")
+    chef, _ = User.objects.get_or_create(username=f"{PREFIX}-chef")
+    if not chef.is_staff:
+        chef.is_staff = True
+        chef.save(update_fields=["is_staff"])
+
+
+def cleanup() -> None:
+    users = User.objects.filter(username__startswith=f"{PREFIX}-")
+    _delete_user_sessions(set(map(str, users.values_list("pk", flat=True))))
+    Order.objects.filter(user__in=users).delete()
+    users.delete()
+    Dish.objects.filter(slug__startswith=f"{PREFIX}-").delete()
+    Category.objects.filter(slug__startswith=f"{PREFIX}-").delete()
+
+
+def _session_store():
+    return import_module(settings.SESSION_ENGINE).SessionStore
+
+
+def _session_cookie(user: User) -> str:
+    """Сессия «как после логина», записанная напрямую в хранилище сессий."""
+    store = _session_store()()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.create()
+    return store.session_key
+
+
+def _end_sessions(keys: list[str]) -> None:
+    """Удалить сессии, созданные прогоном: по одной на гостя и повара на каждый запуск."""
+    store_class = _session_store()
+    for key in keys:
+        store_class(session_key=key).delete()
+
+
+def _delete_user_sessions(user_ids: set[str]) -> None:
+    """
+    Сессии lt-пользователей, оставшиеся от прерванных прогонов. Найти их можно
+    только в БД-хранилище (db / cached_db) — перебором с расшифровкой; в кэше
+    они сами истекут через SESSION_COOKIE_AGE.
+    """
+    store_class = _session_store()
+    if not user_ids or not hasattr(store_class, "get_model_class"):
+        return
+    model = store_class.get_model_class()
+    stale = [
+        s.session_key for s in model.objects.iterator(chunk_size=2000)
+        if s.get_decoded().get(SESSION_KEY) in user_ids
+    ]
+    _end_sessions(stale)
+
+
+# ========= HTTP =========
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # меряем сам эндпоинт, а не страницу после редиректа
+
+
+class VirtualUser:
+    def __init__(self, base_url: str, session_key: Optional[str], age_verified: bool = True):
+        self.base_url = base_url.rstrip("/")
+        self.csrf = "".join(secrets.choice(string.ascii_letters + string.digits) for _ in range(32))
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect()
+        )
+        self.cookies = {settings.CSRF_COOKIE_NAME: self.csrf}
+        if session_key:
+            self.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        if age_verified:
+            self.cookies["AGE_VERIFIED_21"] = "1"
+
+    def request(self, method: str, path: str, body: bytes | None = None) -> tuple[int, bytes]:
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        req.add_header("Cookie", "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        req.add_header("Accept", "application/json" if method == "POST" else "text/html")
+        if method == "POST":
+            req.add_header("X-CSRFToken", self.csrf)
+            req.add_header("Referer", self.base_url + "/")
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read() if e.fp else b""
+
+
+# ========= прогон =========
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, seconds: float, status: int) -> None:
+        with self.lock:
+            self.latencies[name].append(seconds)
+            self.statuses[name][str(status)] += 1
+            if status == 0 or status >= 400:
+                self.errors[name] += 1
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    """Метод ближайшего ранга: наименьшее значение, не меньше которого p% выборки."""
+    if not sorted_values:
+        return 0.0
+    # p * n до деления: 7 / 100 * 100 во float — уже 7.000000000000001
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values) / 100) - 1))
+    return sorted_values[k]
+
+
+def build_report(rec: Recorder, elapsed: float, meta: dict) -> dict:
+    endpoints = {}
+    all_lat: list[float] = []
+    for name, lat in sorted(rec.latencies.items()):
+        s = sorted(lat)
+        all_lat.extend(s)
+        endpoints[name] = {
+            "count": len(s),
+            "errors": rec.errors.get(name, 0),
+            "statuses": dict(rec.statuses[name]),
+            "rps": round(len(s) / elapsed, 2),
+            "mean_ms": round(1000 * sum(s) / len(s), 2),
+            "p50_ms": round(1000 * _percentile(s, 50), 2),
+            "p95_ms": round(1000 * _percentile(s, 95), 2),
+            "p99_ms": round(1000 * _percentile(s, 99), 2),
+            "max_ms": round(1000 * s[-1], 2),
+        }
+    all_lat.sort()
+    return {
+        "meta": {**meta, "elapsed_s": round(elapsed, 2)},
+        "total": {
+            "count": len(all_lat),
+            "errors": sum(rec.errors.values()),
+            "rps": round(len(all_lat) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(1000 * _percentile(all_lat, 50), 2),
+            "p95_ms": round(1000 * _percentile(all_lat, 95), 2),
+            "p99_ms": round(1000 * _percentile(all_lat, 99), 2),
+        },
+        "endpoints": endpoints,
+    }
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный прогон меню и кухни против локального сервера (p50/p95/p99, JSON-отчёт)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=30.0, help="секунды")
+        parser.add_argument("--mix", default="", help='веса, напр. "home=50,add_to_order=30"')
+        parser.add_argument("--seed", action="store_true", help="создать синтетическое меню и пользователей")
+        parser.add_argument("--categories", type=int, default=8)
+        parser.add_argument("--dishes", type=int, default=25, help="блюд на категорию")
+        parser.add_argument("--guests", type=int, default=200)
+        parser.add_argument("--output", default="", help="куда записать JSON-отчёт")
+        parser.add_argument("--baseline", default="", help="JSON прошлого прогона для сравнения")
+        parser.add_argument("--cleanup", action="store_true", help="удалить данные lt-* и выйти")
+        parser.add_argument("--random-seed", type=int, default=None)
+
+    def handle(self, *args, **opts):
+        if opts["cleanup"]:
+            cleanup()
+            self.stdout.write(self.style.SUCCESS("Данные нагрузочного теста удалены."))
+            return
+
+        if opts["seed"]:
+            seed(opts["categories"], opts["dishes"], opts["guests"])
+
+        rng = random.Random(opts["random_seed"])
+        mix = self._parse_mix(opts["mix"])
+
+        cat_slugs = list(Category.objects.filter(slug__startswith=f"{PREFIX}-").values_list("slug", flat=True))
+        dishes = list(
+            Dish.objects.filter(slug__startswith=f"{PREFIX}-", is_available=True)
+            .values_list("id", "slug", "category__is_21plus")
+        )
+        guests = list(User.objects.filter(username__startswith=f"{PREFIX}-guest-"))
+        chef = User.objects.filter(username=f"{PREFIX}-chef").first()
+        if not (cat_slugs and dishes and guests and chef):
+            raise CommandError("Нет данных lt-*: запустите с --seed.")
+
+        guest_sessions = [_session_cookie(u) for u in guests]
+        chef_session = _session_cookie(chef)
+        base = opts["base_url"]
+
+        rec = Recorder()
+        ready_queue: list[int] = []   # заказы, ушедшие на кухню (для mark_ready)
+        queue_lock = threading.Lock()
+        deadline = time.monotonic() + opts["duration"]
+        names, weights = zip(*mix.items())
+
+        def worker(n: int):
+            local = random.Random(rng.random())
+            guest = VirtualUser(base, guest_sessions[n % len(guest_sessions)])
+            staff = VirtualUser(base, chef_session)
+            has_cart = False
+            while time.monotonic() < deadline:
+                name = local.choices(names, weights)[0]
+                lang = local.choice(LANG_PREFIXES)
+                client, method, path = guest, "GET", None
+                if name == "home":
+                    path = f"{lang}/"
+                elif name == "category_detail":
+                    path = f"{lang}/categories/{local.choice(cat_slugs)}/"
+                elif name == "dish_detail":
+                    path = f"{lang}/dishes/{local.choice(dishes)[1]}/"
+                elif name == "add_to_order":
+                    method, path = "POST", f"/order/add/{local.choice(dishes)[0]}/"
+                elif name == "finalize_order":
+                    if not has_cart:
+                        continue  # пустую корзину гость не отправляет
+                    method, path = "POST", "/order/finalize/"
+                elif name == "kitchen_orders":
+                    client, path = staff, "/kitchen/"
+                elif name == "mark_ready":
+                    with queue_lock:
+                        order_id = ready_queue.pop() if ready_queue else None
+                    if order_id is None:
+                        continue
+                    client, method, path = staff, "POST", f"/kitchen/ready/{order_id}/"
+
+                started = time.perf_counter()
+                try:
+                    status, body = client.request(method, path, b"" if method == "POST" else None)
+                except Exception:
+                    status, body = 0, b""
+                rec.add(name, time.perf_counter() - started, status)
+
+                if name == "add_to_order" and status == 200:
+                    has_cart = True
+                if name == "finalize_order" and status == 200:
+                    has_cart = False
+                    try:
+                        order_id = json.loads(body).get("order_id")
+                    except ValueError:
+                        order_id = None
+                    if order_id:
+                        with queue_lock:
+                            ready_queue.append(order_id)
+
+        self.stdout.write(
+            f"Нагрузка: {base}, потоков {opts['concurrency']}, {opts['duration']:.0f} с, "
+            f"блюд {len(dishes)}, гостей {len(guests)}"
+        )
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(opts["concurrency"])]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            # и при Ctrl+C: иначе каждый прогон оставляет guests + 1 строк сессий
+            _end_sessions(guest_sessions + [chef_session])
+        elapsed = time.monotonic() - started
+
+        report = build_report(rec, elapsed, {
+            "base_url": base,
+            "concurrency": opts["concurrency"],
+            "duration_s": opts["duration"],
+            "mix": mix,
+            "dishes": len(dishes),
+            "guests": len(guests),
+            "started_at": timezone.now().isoformat(),
+        })
+        self._print(report, self._load_baseline(opts["baseline"]))
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Отчёт: {opts['output']}"))
+
+    # ——— вспомогательное ———
+    def _parse_mix(self, raw: str) -> dict[str, int]:
+        if not raw:
+            return dict(DEFAULT_MIX)
+        mix = {}
+        for part in raw.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in DEFAULT_MIX:
+                raise CommandError(f"Неизвестный эндпоинт в --mix: {name}")
+            mix[name] = int(weight or 1)
+        return mix
+
+    def _load_baseline(self, path: str) -> dict:
+        if not path:
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("endpoints", {})
+
+    def _print(self, report: dict, baseline: dict) -> None:
+        header = f"{'endpoint':<16}{'count':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+        if baseline:
+            header += f"{'Δp95':>9}"
+        self.stdout.write(header)
+        for name, e in report["endpoints"].items():
+            line = (
+                f"{name:<16}{e['count']:>8}{e['errors']:>6}{e['rps']:>9.1f}"
+                f"{e['p50_ms']:>9.1f}{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}"
+            )
+            if name in baseline and baseline[name].get("p95_ms"):
+                delta = 100 * (e["p95_ms"] / baseline[name]["p95_ms"] - 1)
+                line += f"{delta:>+8.0f}%"
+            self.stdout.write(line)
+        t = report["total"]
+        self.stdout.write(
+            f"{'TOTAL':<16}{t['count']:>8}{t['errors']:>6}{t['rps']:>9.1f}"
+            f"{t['p50_ms']:>9.1f}{t['p95_ms']:>9.1f}{t['p99_ms']:>9.1f}"
+        )
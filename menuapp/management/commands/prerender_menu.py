@@ -0,0 +1,44 @@
+# menuapp/management/commands/prerender_menu.py
+"""
+Статическая копия меню для nginx/CDN (см. menuapp/prerender.py).
+
+    python manage.py prerender_menu                    # в MENU_PRERENDER_DIR, только изменившееся
+    python manage.py prerender_menu --output /srv/menu # в другой каталог
+    python manage.py prerender_menu --force            # перерисовать всё (после деплоя шаблонов не нужно)
+
+Перед первым запуском — collectstatic: страницы ссылаются на статику с хэшем.
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from menuapp import prerender
+
+
+class Command(BaseCommand):
+    help = "Записать страницы меню (все языки и варианты 21+) в каталог для nginx/CDN."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=None, help="каталог (по умолчанию MENU_PRERENDER_DIR)")
+        parser.add_argument("--force", action="store_true", help="перерисовать все страницы")
+        parser.add_argument("--allow-unhashed", action="store_true",
+                            help="не требовать collectstatic (ссылки на статику без хэша, для отладки)")
+
+    def handle(self, *args, **opts):
+        output = opts["output"] or settings.MENU_PRERENDER_DIR
+        if not output:
+            raise CommandError("укажите --output или MENU_PRERENDER_DIR")
+        try:
+            result = prerender.build(output, force=opts["force"], require_hashed=not opts["allow_unhashed"])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        if opts["verbosity"] > 1:
+            for path in result.rendered:
+                self.stdout.write(f"  {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{output}: записано {len(result.rendered)}, без изменений {result.unchanged}, "
+            f"не трогали {result.skipped}, удалено {len(result.removed)}"
+        ))
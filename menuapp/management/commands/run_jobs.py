@@ -0,0 +1,55 @@
+# menuapp/management/commands/run_jobs.py
+"""
+Воркер фоновых задач (очередь в БД, см. menuapp/jobs.py).
+
+    python manage.py run_jobs                 # работать, пока не остановят (SIGTERM/Ctrl+C)
+    python manage.py run_jobs --once          # разобрать очередь и выйти (cron, деплой)
+
+Воркеров можно запускать несколько: задачи разбираются без пересечений.
+По SIGTERM текущая задача доделывается, новая не берётся.
+"""
+from __future__ import annotations
+
+import signal
+
+from django.core.management.base import BaseCommand
+
+from menuapp import jobs
+
+
+class Command(BaseCommand):
+    help = "Выполнять фоновые задачи из очереди (нарезка картинок и т.п.)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="выйти, когда очередь опустеет")
+        parser.add_argument("--sleep", type=float, default=1.0, help="пауза опроса пустой очереди, сек.")
+        parser.add_argument("--max-jobs", type=int, default=None, help="выйти после N задач")
+        parser.add_argument("--purge-days", type=int, default=7,
+                            help="при старте удалить выполненные задачи старше N дней (0 — не удалять)")
+
+    def handle(self, *args, **opts):
+        stop = False
+
+        def on_signal(signum, frame):
+            nonlocal stop
+            stop = True
+            self.stdout.write("Останавливаюсь после текущей задачи…")
+
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
+
+        if opts["purge_days"]:
+            purged = jobs.purge(opts["purge_days"])
+            if purged:
+                self.stdout.write(f"Удалено старых задач: {purged}")
+
+        worker = jobs.worker_name()
+        self.stdout.write(f"Воркер {worker}: {', '.join(sorted(jobs.HANDLERS))}")
+        done = jobs.work(
+            worker,
+            once=opts["once"],
+            sleep=opts["sleep"],
+            max_jobs=opts["max_jobs"],
+            should_stop=lambda: stop,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Выполнено задач: {done}"))
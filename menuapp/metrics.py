@@ -0,0 +1,274 @@
+# menuapp/metrics.py
+"""
+Метрики в текстовом формате Prometheus (/metrics), без внешних сервисов.
+
+Счётчики и гистограммы копятся в памяти процесса и раз в FLUSH_INTERVAL
+сбрасываются в свой файл в MENU_METRICS_DIR (запись через os.replace —
+читатель не увидит половину файла). /metrics суммирует файлы всех воркеров
+gunicorn, поэтому ответ одинаковый, в какой бы воркер ни попал скрейп.
+Каталог нужно очищать при деплое (как multiprocess-режим prometheus_client):
+файлы умерших воркеров продолжают входить в сумму, чтобы счётчики не падали.
+
+Без MENU_METRICS_DIR метрики видны только текущего процесса (dev).
+
+Gauge'и (открытые заказы по статусам) не копятся, а считаются в момент
+скрейпа одним запросом к БД.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Order
+
+FLUSH_INTERVAL = 1.0  # сек.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ORDER_STAGE_BUCKETS = (30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600)
+
+# имя → (тип, описание, границы корзин для гистограмм)
+METRICS: dict[str, tuple[str, str, tuple]] = {
+    "menu_http_requests_total": ("counter", "HTTP-запросы по имени маршрута, методу и статусу.", ()),
+    "menu_http_request_duration_seconds": ("histogram", "Время ответа по имени маршрута.", LATENCY_BUCKETS),
+    "menu_db_queries_total": ("counter", "SQL-запросы, выполненные при обработке HTTP-запросов.", ()),
+    "menu_cache_requests_total": ("counter", "Обращения к кэшам приложения: hit / miss / stale.", ()),
+    "menu_order_transitions_total": ("counter", "Переходы статусов заказа.", ()),
+    "menu_order_stage_seconds": (
+        "histogram",
+        "Время заказа на этапе: queued — от последнего изменения корзины до «Принять» на кухне, "
+        "cooking — от отправки на кухню (или принятия) до «Готов».",
+        ORDER_STAGE_BUCKETS,
+    ),
+}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "MENU_METRICS", True))
+
+
+# ========= хранилище процесса =========
+Labels = tuple[tuple[str, str], ...]
+
+
+class _Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # один писатель файла за раз
+        self._reset()
+
+    def _reset(self) -> None:
+        self.pid = os.getpid()
+        self.name = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], list[float]] = {}  # [по корзинам..., +Inf, sum]
+        self.flushed = 0.0
+        self.timer: Optional[threading.Timer] = None
+
+    def _check_fork(self) -> None:
+        # gunicorn --preload: воркер наследует память мастера — начинаем с нуля
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name: str, labels: Labels, value: float = 1) -> None:
+        with self.lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_flush()
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        buckets = METRICS[name][2]
+        with self.lock:
+            self._check_fork()
+            h = self.histograms.get((name, labels))
+            if h is None:
+                h = self.histograms[(name, labels)] = [0.0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            else:
+                h[len(buckets)] += 1
+            h[-1] += value
+        self.maybe_flush()
+
+    def dump(self) -> dict:
+        with self.lock:
+            self._check_fork()
+            return {
+                "counters": [[n, list(map(list, lb)), v] for (n, lb), v in self.counters.items()],
+                "histograms": [[n, list(map(list, lb)), h] for (n, lb), h in self.histograms.items()],
+            }
+
+    def maybe_flush(self, force: bool = False) -> None:
+        directory = _directory()
+        if directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed < FLUSH_INTERVAL:
+            # недавно сбрасывали: досбросим по таймеру, чтобы хвост не завис
+            # в памяти притихшего воркера
+            with self.lock:
+                if self.timer is None:
+                    self.timer = threading.Timer(FLUSH_INTERVAL, self._flush_by_timer)
+                    self.timer.daemon = True
+                    self.timer.start()
+            return
+        self.flushed = now
+        data = self.dump()
+        path = directory / f"{self.name}.json"
+        tmp = directory / f".{self.name}.tmp"
+        with self.flush_lock:
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                tmp.write_text(json.dumps(data), encoding="utf-8")
+                os.replace(tmp, path)
+            except OSError:
+                pass  # метрики не должны ронять запрос
+
+    def _flush_by_timer(self) -> None:
+        with self.lock:
+            self.timer = None
+        self.maybe_flush(force=True)
+
+
+_store = _Store()
+atexit.register(lambda: _store.maybe_flush(force=True))
+
+
+def _directory() -> Optional[Path]:
+    raw = getattr(settings, "MENU_METRICS_DIR", "") or ""
+    if not raw:
+        return None
+    return Path(raw)
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ========= запись =========
+def inc(name: str, value: float = 1, **labels) -> None:
+    if enabled():
+        _store.inc(name, _labels(**labels), value)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if enabled():
+        _store.observe(name, _labels(**labels), value)
+
+
+def cache_result(cache_name: str, result: str) -> None:
+    """result: hit / miss / stale."""
+    inc("menu_cache_requests_total", cache=cache_name, result=result)
+
+
+def order_transition(
+    old_status: str, new_status: str, stage: Optional[str] = None, stage_started: Optional[datetime] = None,
+) -> None:
+    """
+    Переход заказа old_status → new_status. Время этапа `stage` считается
+    от stage_started (вход в old_status, см. orders.Moved) до текущего момента.
+    """
+    inc("menu_order_transitions_total", **{"from": old_status, "to": new_status})
+    if stage and stage_started is not None:
+        observe("menu_order_stage_seconds", (timezone.now() - stage_started).total_seconds(), stage=stage)
+
+
+# ========= чтение =========
+def _merged() -> tuple[dict, dict]:
+    counters: dict[tuple[str, Labels], float] = {}
+    histograms: dict[tuple[str, Labels], list[float]] = {}
+
+    def add(data: dict) -> None:
+        for name, labels, value in data.get("counters", []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data.get("histograms", []):
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms and len(histograms[key]) == len(values):
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+
+    directory = _directory()
+    own = f"{_store.name}.json"
+    if directory is not None:
+        for path in directory.glob("*.json"):
+            if path.name == own:
+                continue  # свой процесс берём из памяти — свежее
+            try:
+                add(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+    add(_store.dump())
+    return counters, histograms
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Iterable[tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Все метрики в text exposition format 0.0.4."""
+    counters, histograms = _merged()
+    lines: list[str] = []
+
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+            continue
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0.0
+            for bound, count in zip(buckets, h):
+                cumulative += count
+                lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', _fmt_value(bound)),))} {_fmt_value(cumulative)}")
+            cumulative += h[len(buckets)]
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {_fmt_value(cumulative)}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(h[-1])}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {_fmt_value(cumulative)}")
+
+    # gauge: открытые заказы — одним GROUP BY в момент скрейпа
+    lines.append("# HELP menu_orders_open Заказы по статусам (new — корзины, kitchen — очередь кухни).")
+    lines.append("# TYPE menu_orders_open gauge")
+    open_statuses = [Order.STATUS_NEW, Order.STATUS_KITCHEN]
+    counts = dict.fromkeys(open_statuses, 0)
+    counts.update(
+        Order.objects.filter(status__in=open_statuses)
+        .order_by()
+        .values_list("status")
+        .annotate(n=Count("id"))
+        .values_list("status", "n")
+    )
+    for status, n in counts.items():
+        lines.append(f'menu_orders_open{{status="{status}"}} {n}')
+
+    return "\n".join(lines) + "\n"
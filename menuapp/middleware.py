@@ -1,7 +1,17 @@
 # menuapp/middleware.py
+import time
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import redirect
 from django.urls import resolve
 
+from . import metrics, pagecache, profiling
+from .snapshot import get_menu_version
+
 AGE_COOKIE = "AGE_VERIFIED_21"
 
 # Префиксы URL, которые всегда пропускаем (они не ходят в i18n-паттернах)
@@ -10,6 +20,7 @@ EXCLUDE_PREFIXES = (
     "/media/",
     "/api/",
     "/i18n/",       # смена языка и подобные служебные эндпоинты
+    "/metrics",
     "/favicon.ico",
 )
 
@@ -27,8 +38,11 @@ EXCLUDE_NAMES = {
     "signup",
     # кухня (операции для персонала)
     "kitchen_orders",
+    "kitchen_events",
+    "kitchen_feed",
     "mark_accept",
     "mark_ready",
+    "kitchen_bulk",
     # просмотр корзины (GET и так пропускаем, но на всякий случай)
     "view_order",
 }
@@ -70,13 +84,15 @@ class AgeGate21Middleware:
         if _is_excluded_by_prefix(path):
             return self.get_response(request)
 
-        # 2) staff/superuser пропускаем, они знают, что делают
-        user = getattr(request, "user", None)
-        if getattr(user, "is_staff", False) or getattr(user, "is_superuser", False):
+        # 2) безопасные методы не блокируем: фронт уже блюрит контент 21+.
+        #    Проверяем до пользователя: GET не должен трогать сессию
+        #    (иначе Vary: Cookie, и страницы меню не закэшировать)
+        if request.method in SAFE_METHODS:
             return self.get_response(request)
 
-        # 3) безопасные методы не блокируем: фронт уже блюрит контент 21+
-        if request.method in SAFE_METHODS:
+        # 3) staff/superuser пропускаем, они знают, что делают
+        user = getattr(request, "user", None)
+        if getattr(user, "is_staff", False) or getattr(user, "is_superuser", False):
             return self.get_response(request)
 
         # 4) маршруты, которые нельзя блокировать (работают с i18n-префиксами)
@@ -90,3 +106,125 @@ class AgeGate21Middleware:
 
         # 6) нет куки — отправляем на страницу подтверждения
         return redirect("age_gate")
+
+
+class ProfilingMiddleware:
+    """
+    Разбивка времени запроса на db / tpl / view в заголовке Server-Timing
+    (видно во вкладке Network у браузера) и сбор медленных запросов с их SQL.
+
+    Включается настройкой MENU_PROFILING; выключенная — снимается Django
+    целиком (MiddlewareNotUsed) и ничего не стоит.
+    """
+
+    def __init__(self, get_response):
+        if not profiling.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.instrument_templates()
+
+    def __call__(self, request):
+        token = profiling.start()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(profiling.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            profile = profiling.finish(token)
+
+        if isinstance(response, StreamingHttpResponse):
+            # SSE и прочие потоки: время «запроса» — это время жизни соединения
+            return response
+
+        timings = profile.timings()
+        response["Server-Timing"] = profiling.server_timing(profile, timings)
+        if timings["total"] >= profiling.slow_ms():
+            profiling.record_slow(request, response, profile, timings)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Счётчики запросов, гистограмма времени ответа и число SQL-запросов
+    по имени маршрута (см. metrics.py). Ставится первым, чтобы мерить всё.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(count))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        metrics.inc("menu_http_requests_total", view=view, method=request.method, status=response.status_code)
+        metrics.observe("menu_http_request_duration_seconds", elapsed, view=view)
+        if queries[0]:
+            metrics.inc("menu_db_queries_total", queries[0], view=view)
+        return response
+
+
+class PageCacheMiddleware:
+    """
+    Готовые страницы меню из кэша процесса (см. pagecache.py) — отдаются
+    до вызова вьюхи. Ставится последним: внешние middleware (CSRF-кука,
+    Vary, X-Frame-Options) отрабатывают и на попадании.
+
+    Страницы меню — оболочки без пользовательских данных (views._render_shell),
+    поэтому кэш общий для анонимов и залогиненных. Мимо кэша: не-GET,
+    ответы не 200 или со своими куками.
+    """
+
+    VIEWS = {"home", "categories", "category_detail", "dish_detail"}  # /categories/ — та же views.home
+
+    def __init__(self, get_response):
+        if not pagecache.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        key = getattr(request, "_page_cache_key", None)
+        if key is not None and self._cacheable(request, response):
+            pagecache.store(key, response)
+            response["X-Page-Cache"] = "miss"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != "GET" or request.resolver_match.url_name not in self.VIEWS:
+            return None
+
+        key = pagecache.key(request, get_menu_version(), request.COOKIES.get(AGE_COOKIE) == "1")
+        page = pagecache.get(key)
+        if page is None:
+            metrics.cache_result("page", "miss")
+            request._page_cache_key = key
+            return None
+
+        metrics.cache_result("page", "hit")
+        response = HttpResponse(pagecache.render(page, get_token(request) if page.has_csrf else None))
+        for header, value in page.headers.items():
+            response[header] = value
+        response["X-Page-Cache"] = "hit"
+        return response
+
+    @staticmethod
+    def _cacheable(request, response) -> bool:
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        cache_control = response.get("Cache-Control", "")
+        return "private" not in cache_control and "no-store" not in cache_control
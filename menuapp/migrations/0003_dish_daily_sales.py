@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    """Переносим историю: уже отправленные на кухню заказы → продажи по дням."""
+    Order = apps.get_model("menuapp", "Order")
+    OrderItem = apps.get_model("menuapp", "OrderItem")
+    DishDailySales = apps.get_model("menuapp", "DishDailySales")
+
+    totals = {}
+    items = (
+        OrderItem.objects.filter(order__status__in=["kitchen", "ready"])
+        .values_list("dish_id", "quantity", "order__created_at")
+        .iterator()
+    )
+    for dish_id, quantity, created_at in items:
+        day = timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+        totals[(dish_id, day)] = totals.get((dish_id, day), 0) + quantity
+
+    DishDailySales.objects.bulk_create(
+        [DishDailySales(dish_id=d, day=day, quantity=q) for (d, day), q in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menuapp', '0002_alter_category_options_alter_dish_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='menuapp.dish', verbose_name='Блюдо')),
+            ],
+            options={
+                'verbose_name': 'Продажи блюда за день',
+                'verbose_name_plural': 'Продажи блюд по дням',
+                'indexes': [models.Index(fields=['day'], name='menuapp_dis_day_e38695_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dish', 'day'), name='uniq_dish_day')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
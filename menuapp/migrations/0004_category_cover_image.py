@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:21
+
+from django.db import migrations, models
+
+
+def fill_covers(apps, schema_editor):
+    Category = apps.get_model("menuapp", "Category")
+    Dish = apps.get_model("menuapp", "Dish")
+
+    firsts = {}
+    dishes = (
+        Dish.objects.exclude(image="")
+        .exclude(image__isnull=True)
+        .order_by("-is_available", "position", "id")
+        .values_list("category_id", "image")
+    )
+    for cat_id, image in dishes:
+        firsts.setdefault(cat_id, image)
+
+    changed = []
+    for c in Category.objects.only("id", "image"):
+        c.cover_image = c.image.name if c.image else firsts.get(c.pk, "")
+        if c.cover_image:
+            changed.append(c)
+    Category.objects.bulk_update(changed, ["cover_image"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menuapp', '0003_dish_daily_sales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='cover_image',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Обложка'),
+        ),
+        migrations.RunPython(fill_covers, migrations.RunPython.noop),
+    ]
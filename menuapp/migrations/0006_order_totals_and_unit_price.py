@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:27
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    """Цены позиций берём текущие (другой истории нет), итоги считаем по ним."""
+    Dish = apps.get_model("menuapp", "Dish")
+    Order = apps.get_model("menuapp", "Order")
+    OrderItem = apps.get_model("menuapp", "OrderItem")
+
+    OrderItem.objects.update(
+        unit_price=Subquery(Dish.objects.filter(pk=OuterRef("dish_id")).values("base_price")[:1])
+    )
+
+    items = OrderItem.objects.filter(order_id=OuterRef("pk")).values("order_id")
+    Order.objects.update(
+        total_quantity=Coalesce(
+            Subquery(items.annotate(q=Sum("quantity")).values("q")[:1]), 0
+        ),
+        total_price=Coalesce(
+            Subquery(
+                items.annotate(
+                    t=Sum(F("quantity") * F("unit_price"), output_field=DecimalField())
+                ).values("t")[:1]
+            ),
+            Decimal("0.00"),
+            output_field=DecimalField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menuapp', '0005_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10, verbose_name='Сумма'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8, verbose_name='Цена за единицу'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_open_orders(apps, schema_editor):
+    """
+    До индекса параллельные нажатия могли создать несколько NEW-заказов.
+    Оставляем самый свежий, позиции остальных переносим в него.
+    """
+    Order = apps.get_model("menuapp", "Order")
+    OrderItem = apps.get_model("menuapp", "OrderItem")
+
+    dup_users = (
+        Order.objects.filter(status="new")
+        .values("user_id")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("user_id", flat=True)
+    )
+    for user_id in dup_users:
+        orders = list(Order.objects.filter(user_id=user_id, status="new").order_by("-created_at", "-id"))
+        keeper, extra = orders[0], orders[1:]
+        for order in extra:
+            for item in OrderItem.objects.filter(order=order):
+                target = OrderItem.objects.filter(order=keeper, dish_id=item.dish_id).first()
+                if target:
+                    target.quantity += item.quantity
+                    target.save(update_fields=["quantity"])
+                    item.delete()
+                else:
+                    item.order = keeper
+                    item.save(update_fields=["order"])
+            keeper.total_quantity += order.total_quantity
+            keeper.total_price += order.total_price
+            order.delete()
+        keeper.save(update_fields=["total_quantity", "total_price"])
+
+
+class Migration(migrations.Migration):
+    # удаление заказов оставляет в транзакции отложенные проверки FK, и PostgreSQL
+    # не даст в ней же создать индекс ("pending trigger events"): слияние — своей
+    # транзакцией, индекс — после её коммита
+    atomic = False
+
+    dependencies = [
+        ('menuapp', '0006_order_totals_and_unit_price'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_open_orders, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'new')), fields=('user',), name='uniq_open_order_per_user'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menuapp', '0007_uniq_open_order_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Производные картинок'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Производные картинок'),
+        ),
+    ]
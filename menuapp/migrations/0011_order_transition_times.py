@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menuapp', '0010_menu_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='kitchen_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='На кухне с'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Готов в'),
+        ),
+    ]
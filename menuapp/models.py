@@ -2,23 +2,43 @@
 from __future__ import annotations
 
 from decimal import Decimal
+from functools import lru_cache
 from typing import Optional
 
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _, get_language
 
 
 # ========= i18n утилиты =========
-_LANGS = {"ru", "kk", "en"}
+# Языки, для которых у моделей есть поля <field>_<lang>, в порядке отката:
+# для текущего языка сначала его поле, затем остальные в этом порядке.
+# Новый язык = новые поля + код в этом кортеже, без правок свойств ниже.
+LOCALIZED_LANGS = ("ru", "en", "kk")
+DEFAULT_LANG = "ru"
+_LANGS = set(LOCALIZED_LANGS)
+
+LANG_FALLBACKS = {
+    lang: (lang,) + tuple(code for code in LOCALIZED_LANGS if code != lang)
+    for lang in LOCALIZED_LANGS
+}
+
+
+@lru_cache(maxsize=32)
+def _normalize_lang(code: Optional[str]) -> str:
+    code = (code or DEFAULT_LANG).split("-")[0].lower()
+    return code if code in _LANGS else DEFAULT_LANG
 
 
 def _lang_code() -> str:
-    """Текущий короткий код языка, всегда один из ru|kk|en, иначе ru."""
-    code = (get_language() or "ru").split("-")[0].lower()
-    return code if code in _LANGS else "ru"
+    """Текущий короткий код языка, всегда один из LOCALIZED_LANGS, иначе ru."""
+    return _normalize_lang(get_language())
 
 
 def _first(*vals: Optional[str]) -> str:
@@ -29,6 +49,61 @@ def _first(*vals: Optional[str]) -> str:
     return ""
 
 
+def localized(obj, field: str, lang: Optional[str] = None) -> str:
+    """Значение поля `field` на языке `lang` (по умолчанию текущем) с откатом."""
+    chain = LANG_FALLBACKS[_normalize_lang(lang) if lang else _lang_code()]
+    return _first(*(getattr(obj, f"{field}_{code}", "") for code in chain))
+
+
+# ========= изменения меню =========
+# post_save/post_delete не срабатывают на queryset.update() (bulk-экшены админки),
+# поэтому такие обновления шлют отдельный сигнал.
+menu_changed = Signal()
+
+
+class MenuQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # auto_now сам по себе не срабатывает на update(); по updated_at
+        # ключуются кэши карточек в шаблонах
+        kwargs.setdefault("updated_at", timezone.now())
+        rows = super().update(**kwargs)
+        if rows:
+            menu_changed.send(sender=self.model)
+        return rows
+
+
+class CategoryQuerySet(MenuQuerySet):
+    def refresh_covers(self) -> int:
+        """
+        Пересчитать денормализованную обложку (cover_image) для категорий
+        выборки: два запроса на любое число категорий + один bulk-UPDATE.
+        """
+        cats = list(self.only("id", "image", "cover_image"))
+        if not cats:
+            return 0
+
+        firsts: dict[int, str] = {}
+        dishes = (
+            Dish.objects.filter(category_id__in=[c.pk for c in cats])
+            .exclude(image="")
+            .exclude(image__isnull=True)
+            .order_by("-is_available", "position", "id")
+            .values_list("category_id", "image")
+        )
+        for cat_id, image in dishes:
+            firsts.setdefault(cat_id, image)
+
+        changed = []
+        for c in cats:
+            cover = c.image.name if c.image else firsts.get(c.pk, "")
+            if c.cover_image != cover:
+                c.cover_image = cover
+                changed.append(c)
+        if changed:
+            Category.objects.bulk_update(changed, ["cover_image"])
+        return len(changed)
+
+
 # ========= Категория =========
 class Category(models.Model):
     # i18n
@@ -44,6 +119,11 @@ class Category(models.Model):
     slug = models.SlugField(_("Слаг"), max_length=120, unique=True, blank=True)
     position = models.PositiveIntegerField(_("Позиция"), default=0)
     image = models.ImageField(_("Изображение"), upload_to="categories/", blank=True, null=True)
+    # путь к фактической обложке: своя картинка или фото первого блюда (см. refresh_covers)
+    cover_image = models.CharField(_("Обложка"), max_length=255, blank=True, default="", editable=False)
+    # производные картинок по ширинам/форматам (см. images.py); собирает воркер, см. jobs.py
+    image_variants = models.JSONField(_("Производные картинок"), default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(_("Обновлено"), auto_now=True)
 
     # навбар
     show_in_nav = models.BooleanField(_("Показывать в навбаре"), default=True)
@@ -52,6 +132,10 @@ class Category(models.Model):
     # 21+
     is_21plus = models.BooleanField(_("Скрывать до подтверждения 21+"), default=False)
 
+    objects = CategoryQuerySet.as_manager()
+
+    IMAGE_FIELDS = ("image",)
+
     class Meta:
         ordering = ["nav_position", "position", "id"]
         indexes = [
@@ -64,25 +148,11 @@ class Category(models.Model):
     # ——— локализованные свойства ———
     @property
     def name(self) -> str:
-        lang = _lang_code()
-        if lang == "ru":
-            return _first(self.name_ru, self.name_en, self.name_kk)
-        if lang == "en":
-            return _first(self.name_en, self.name_ru, self.name_kk)
-        if lang == "kk":
-            return _first(self.name_kk, self.name_ru, self.name_en)
-        return _first(self.name_ru, self.name_en, self.name_kk)
+        return localized(self, "name")
 
     @property
     def description(self) -> str:
-        lang = _lang_code()
-        if lang == "ru":
-            return _first(self.description_ru, self.description_en, self.description_kk)
-        if lang == "en":
-            return _first(self.description_en, self.description_ru, self.description_kk)
-        if lang == "kk":
-            return _first(self.description_kk, self.description_ru, self.description_en)
-        return _first(self.description_ru, self.description_en, self.description_kk)
+        return localized(self, "description")
 
     def __str__(self) -> str:
         return self.name or self.slug or f"Category #{self.pk}"
@@ -97,7 +167,7 @@ class Category(models.Model):
         creating = self.pk is None
 
         if not self.slug:
-            base = _first(self.name_ru, self.name_en, self.name_kk)
+            base = localized(self, "name", DEFAULT_LANG)
             s = slugify(base or "")
             if s:
                 self.slug = s[:120]
@@ -108,25 +178,27 @@ class Category(models.Model):
             self.slug = f"cat-{self.pk}"
             super().save(update_fields=["slug"])
 
+        # имя файла становится известно только после сохранения
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "image" in update_fields:
+            Category.objects.filter(pk=self.pk).refresh_covers()
+
     def get_absolute_url(self) -> str:
         return reverse("category_detail", kwargs={"slug": self.slug})
 
     def cover_image_url(self) -> Optional[str]:
         """
-        Обложка категории на фоне:
+        Обложка категории на фоне (без запросов, из cover_image):
           1) image самой категории
-          2) первая картинка блюда в категории
+          2) первая картинка блюда в категории (доступные — в приоритете)
           3) None
         """
-        if self.image:
-            try:
-                return self.image.url
-            except Exception:
-                pass
-        first_with_img = (
-            self.dishes.exclude(image="").exclude(image__isnull=True).order_by("position", "id").first()
-        )
-        return getattr(first_with_img.image, "url", None) if first_with_img else None
+        if not self.cover_image:
+            return None
+        try:
+            return self.image.storage.url(self.cover_image)
+        except Exception:
+            return None
 
 
 # ========= Блюдо =========
@@ -154,9 +226,17 @@ class Dish(models.Model):
     image = models.ImageField(_("Фото блюда"), upload_to="dishes/", blank=True, null=True)
     passport_bg = models.ImageField(_("Фон-паспорт"), upload_to="dishes/passports/", blank=True, null=True)
 
+    # производные картинок по ширинам/форматам (см. images.py); собирает воркер, см. jobs.py
+    image_variants = models.JSONField(_("Производные картинок"), default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(_("Обновлено"), auto_now=True)
+
     is_available = models.BooleanField(_("Доступно"), default=True)
     position = models.PositiveIntegerField(_("Позиция"), default=0)
 
+    objects = MenuQuerySet.as_manager()
+
+    IMAGE_FIELDS = ("image", "passport_bg")
+
     class Meta:
         ordering = ["category", "position", "id"]
         indexes = [
@@ -169,25 +249,18 @@ class Dish(models.Model):
 
     @property
     def name(self) -> str:
-        lang = _lang_code()
-        if lang == "ru":
-            return _first(self.name_ru, self.name_en, self.name_kk)
-        if lang == "en":
-            return _first(self.name_en, self.name_ru, self.name_kk)
-        if lang == "kk":
-            return _first(self.name_kk, self.name_ru, self.name_en)
-        return _first(self.name_ru, self.name_en, self.name_kk)
+        return localized(self, "name")
 
     @property
     def description(self) -> str:
-        lang = _lang_code()
-        if lang == "ru":
-            return _first(self.description_ru, self.description_en, self.description_kk)
-        if lang == "en":
-            return _first(self.description_en, self.description_ru, self.description_kk)
-        if lang == "kk":
-            return _first(self.description_kk, self.description_ru, self.description_en)
-        return _first(self.description_ru, self.description_en, self.description_kk)
+        return localized(self, "description")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        obj = super().from_db(db, field_names, values)
+        # помним исходную категорию: при переносе блюда обложку пересчитываем у обеих
+        obj._loaded_category_id = obj.__dict__.get("category_id")
+        return obj
 
     def save(self, *args, **kwargs):
         """
@@ -196,7 +269,7 @@ class Dish(models.Model):
         creating = self.pk is None
 
         if not self.slug:
-            base = _first(self.name_ru, self.name_en, self.name_kk)
+            base = localized(self, "name", DEFAULT_LANG)
             s = slugify(base or "")
             if s:
                 self.slug = s[:160]
@@ -231,14 +304,32 @@ class Order(models.Model):
         User, on_delete=models.CASCADE, related_name="orders", verbose_name=_("Пользователь")
     )
     created_at = models.DateTimeField(_("Создан"), auto_now_add=True)
+    # курсор для инкрементальной ленты кухни: меняется при смене статуса и позиций
+    updated_at = models.DateTimeField(_("Изменён"), auto_now=True)
     items = models.ManyToManyField("Dish", through="OrderItem", verbose_name=_("Позиции"))
     status = models.CharField(_("Статус"), max_length=20, choices=STATUS_CHOICES, default=STATUS_NEW)
+    # моменты переходов (orders.transition): отправлен/принят на кухню, готов
+    kitchen_at = models.DateTimeField(_("На кухне с"), null=True, blank=True)
+    ready_at = models.DateTimeField(_("Готов в"), null=True, blank=True)
+
+    # денормализованные итоги: меняются атомарно вместе с позициями (apply_item_delta)
+    total_price = models.DecimalField(_("Сумма"), max_digits=10, decimal_places=2, default=Decimal("0.00"))
+    total_quantity = models.PositiveIntegerField(_("Количество позиций"), default=0)
 
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["status", "created_at"]),
             models.Index(fields=["user", "created_at"]),
+            models.Index(fields=["updated_at", "id"]),
+        ]
+        constraints = [
+            # открытая корзина у пользователя одна: на этом индексе держится upsert в orders.py
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(status="new"),
+                name="uniq_open_order_per_user",
+            ),
         ]
         verbose_name = _("Заказ")
         verbose_name_plural = _("Заказы")
@@ -247,20 +338,47 @@ class Order(models.Model):
         username = self.user.username if self.user_id else ""
         return _("Заказ #{id} от {username}").format(id=self.id or 0, username=username)
 
-    def total_price(self) -> Decimal:
-        total = Decimal("0.00")
-        for item in self.orderitem_set.select_related("dish"):
-            total += item.line_price()
-        return total
+    def save(self, *args, **kwargs):
+        # save(update_fields=["status"]) тоже должен двигать updated_at
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "updated_at" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "updated_at"]
+        super().save(*args, **kwargs)
 
-    def total_quantity(self) -> int:
-        return sum(item.quantity for item in self.orderitem_set.all())
+    def apply_item_delta(self, quantity: int, amount: Decimal) -> None:
+        """
+        Изменить итоги заказа на дельту одним UPDATE с F()-выражениями
+        (без read-modify-write) и заодно сдвинуть updated_at.
+        """
+        Order.objects.filter(pk=self.pk).update(
+            total_quantity=F("total_quantity") + quantity,
+            total_price=F("total_price") + amount,
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=["total_quantity", "total_price", "updated_at"])
+
+    def recalculate_totals(self, save: bool = True) -> None:
+        """Пересчитать итоги по позициям (починка/миграции)."""
+        totals = self.orderitem_set.aggregate(
+            items_qty=Coalesce(Sum("quantity"), 0),
+            items_total=Coalesce(
+                Sum(F("quantity") * F("unit_price"), output_field=models.DecimalField()),
+                Decimal("0.00"),
+                output_field=models.DecimalField(),
+            ),
+        )
+        self.total_quantity = totals["items_qty"]
+        self.total_price = totals["items_total"]
+        if save:
+            self.save(update_fields=["total_quantity", "total_price"])
 
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, verbose_name=_("Заказ"))
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE, verbose_name=_("Блюдо"))
     quantity = models.PositiveIntegerField(_("Количество"), default=1)
+    # цена на момент добавления: исторические итоги не плывут при смене base_price
+    unit_price = models.DecimalField(_("Цена за единицу"), max_digits=8, decimal_places=2, default=Decimal("0.00"))
 
     class Meta:
         constraints = [
@@ -273,4 +391,84 @@ class OrderItem(models.Model):
         return _("{dish} ×{q}").format(dish=self.dish.name, q=self.quantity)
 
     def line_price(self) -> Decimal:
-        return (self.dish.base_price or Decimal("0.00")) * Decimal(self.quantity)
+        return (self.unit_price or Decimal("0.00")) * Decimal(self.quantity)
+
+
+# ========= Популярность =========
+class DishDailySales(models.Model):
+    """
+    Сколько порций блюда ушло на кухню за день. Пополняется инкрементально
+    при отправке заказа на кухню (см. popularity.record_orders), поэтому рейтинг
+    «популярного» читается из окна в N дней, а не агрегатом по OrderItem.
+    """
+
+    dish = models.ForeignKey(
+        Dish, on_delete=models.CASCADE, related_name="daily_sales", verbose_name=_("Блюдо")
+    )
+    day = models.DateField(_("День"))
+    quantity = models.PositiveIntegerField(_("Количество"), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dish", "day"], name="uniq_dish_day"),
+        ]
+        indexes = [
+            models.Index(fields=["day"]),
+        ]
+        verbose_name = _("Продажи блюда за день")
+        verbose_name_plural = _("Продажи блюд по дням")
+
+    def __str__(self) -> str:
+        return f"{self.dish_id} @ {self.day}: {self.quantity}"
+
+
+# ========= Фоновые задачи =========
+class Job(models.Model):
+    """
+    Задача для воркера (manage.py run_jobs), см. jobs.py. Очередь живёт
+    в той же БД: отдельный брокер ради нарезки картинок не нужен.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, _("В очереди")),
+        (STATUS_RUNNING, _("Выполняется")),
+        (STATUS_DONE, _("Готово")),
+        (STATUS_FAILED, _("Ошибка")),
+    )
+
+    kind = models.CharField(_("Тип"), max_length=64)
+    # одинаковый key = одна и та же работа: в очереди не больше одной такой задачи
+    key = models.CharField(_("Ключ"), max_length=200, blank=True, default="")
+    payload = models.JSONField(_("Параметры"), default=dict, blank=True)
+    status = models.CharField(_("Статус"), max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(_("Попыток"), default=0)
+    max_attempts = models.PositiveIntegerField(_("Максимум попыток"), default=5)
+    run_after = models.DateTimeField(_("Не раньше"), default=timezone.now)
+    locked_at = models.DateTimeField(_("Взята"), null=True, blank=True)
+    locked_by = models.CharField(_("Воркер"), max_length=100, blank=True, default="")
+    last_error = models.TextField(_("Последняя ошибка"), blank=True, default="")
+    created_at = models.DateTimeField(_("Создана"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Обновлена"), auto_now=True)
+
+    class Meta:
+        ordering = ["-id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["key"],
+                condition=models.Q(status="queued") & ~models.Q(key=""),
+                name="uniq_queued_job_key",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["key"]),
+        ]
+        verbose_name = _("Фоновая задача")
+        verbose_name_plural = _("Фоновые задачи")
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.key or self.pk} [{self.status}]"
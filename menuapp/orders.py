@@ -0,0 +1,278 @@
+# menuapp/orders.py
+"""
+Запись в корзину и переходы статусов заказа.
+
+Открытый заказ у пользователя один (частичный уникальный индекс
+uniq_open_order_per_user), поэтому «найти или создать» — это upsert,
+а добавление позиций — INSERT ... ON CONFLICT DO UPDATE quantity = quantity + n.
+На PostgreSQL добавление любого числа позиций — два запроса:
+  1) upsert открытого заказа;
+  2) один оператор с CTE: upsert позиций + сдвиг итогов заказа — только
+     если заказ всё ещё new; иначе (ушёл на кухню между 1 и 2) — повтор с 1.
+На прочих СУБД (dev на SQLite) — тот же результат через ORM.
+
+Статусы:  new ──SEND / ACCEPT──▶ kitchen ──READY──▶ ready
+Переход — один условный UPDATE ... WHERE status = <исходный>: заказ,
+который уже сдвинул другой экран кухни (или второй клик гостя), не
+совпадёт и не изменится, READY не откатится в KITCHEN. Так же одним
+оператором переводится пачка заказов («принять все новые», «готовы
+выбранные»). Момент перехода пишется в kitchen_at / ready_at, а переход
+NEW → KITCHEN пополняет продажи дня для «популярных» (popularity.record_orders).
+"""
+from __future__ import annotations
+
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics, popularity
+from .models import Order, OrderItem
+
+
+@dataclass
+class CartLine:
+    dish_id: int
+    quantity: int
+    unit_price: Decimal
+
+
+@dataclass
+class CartResult:
+    order_id: int
+    order_created: bool
+    total_quantity: int
+    total_price: Decimal
+    items: dict[int, tuple[int, int]] = field(default_factory=dict)  # dish_id → (item_id, quantity)
+
+
+def _merge(lines: Iterable[CartLine]) -> list[CartLine]:
+    """Одно блюдо — одна строка: ON CONFLICT не умеет трогать строку дважды."""
+    merged: dict[int, CartLine] = {}
+    for line in lines:
+        if line.quantity <= 0:
+            continue
+        if line.dish_id in merged:
+            merged[line.dish_id].quantity += line.quantity
+        else:
+            merged[line.dish_id] = CartLine(line.dish_id, line.quantity, line.unit_price)
+    return list(merged.values())
+
+
+def add_lines(user_id: int, lines: Iterable[CartLine]) -> CartResult:
+    """Добавить позиции в открытый заказ пользователя (создав его при необходимости)."""
+    lines = _merge(lines)
+    if connection.vendor == "postgresql":
+        return _add_lines_pg(user_id, lines)
+    return _add_lines_orm(user_id, lines)
+
+
+# ========= PostgreSQL: два оператора =========
+def _q(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _col(model, name: str) -> str:
+    return _q(model._meta.get_field(name).column)
+
+
+def _add_lines_pg(user_id: int, lines: list[CartLine]) -> CartResult:
+    now = timezone.now()
+    order_t, item_t = _q(Order._meta.db_table), _q(OrderItem._meta.db_table)
+    o = {f: _col(Order, f) for f in ("id", "user", "status", "created_at", "updated_at", "total_price", "total_quantity")}
+    i = {f: _col(OrderItem, f) for f in ("id", "order", "dish", "quantity", "unit_price")}
+
+    # без собственной транзакции: каждый оператор атомарен сам по себе,
+    # а лишний BEGIN/COMMIT — это ещё два round trip'а на каждое нажатие.
+    # Между (1) и (2) заказ может уйти на кухню (finalize в соседнем запросе):
+    # тогда (2) ничего не меняет, и мы повторяем (1) — он создаст новый заказ
+    with connection.cursor() as cur:
+        while True:
+            result = _upsert_open_order(cur, user_id, now, order_t, o)
+            if not lines or _upsert_items(cur, result, lines, now, order_t, item_t, o, i):
+                return result
+
+
+def _upsert_open_order(cur, user_id: int, now, order_t: str, o: dict) -> CartResult:
+    # (1) открытый заказ; xmax = 0 ⇔ строка только что вставлена
+    cur.execute(
+        f"""
+        INSERT INTO {order_t} ({o['user']}, {o['status']}, {o['created_at']}, {o['updated_at']},
+                               {o['total_price']}, {o['total_quantity']})
+        VALUES (%s, %s, %s, %s, 0, 0)
+        ON CONFLICT ({o['user']}) WHERE {o['status']} = %s
+        DO UPDATE SET {o['updated_at']} = EXCLUDED.{o['updated_at']}
+        RETURNING {o['id']}, {o['total_quantity']}, {o['total_price']}, (xmax = 0)
+        """,
+        [user_id, Order.STATUS_NEW, now, now, Order.STATUS_NEW],
+    )
+    order_id, total_quantity, total_price, created = cur.fetchone()
+    return CartResult(order_id, created, total_quantity, total_price)
+
+
+def _upsert_items(cur, result: CartResult, lines: list[CartLine], now,
+                  order_t: str, item_t: str, o: dict, i: dict) -> bool:
+    """
+    (2) позиции + итоги заказа одним оператором, только пока заказ в статусе new.
+    FOR UPDATE в still_new перепроверяет статус после ожидания блокировки, а
+    параллельный переход на кухню ждёт конца оператора и забирает заказ
+    уже с новыми позициями. False — заказ успел уйти, ничего не записано.
+    """
+    values_sql = ", ".join(["(%s::bigint, %s::integer, %s::numeric)"] * len(lines))
+    values = [v for ln in lines for v in (ln.dish_id, ln.quantity, ln.unit_price)]
+    cur.execute(
+        f"""
+        WITH still_new AS (
+            SELECT {o['id']} AS id FROM {order_t}
+            WHERE {o['id']} = %s AND {o['status']} = %s
+            FOR UPDATE
+        ),
+        delta (dish_id, qty, unit_price) AS (VALUES {values_sql}),
+        item AS (
+            INSERT INTO {item_t} ({i['order']}, {i['dish']}, {i['quantity']}, {i['unit_price']})
+            SELECT still_new.id, delta.dish_id, delta.qty, delta.unit_price FROM still_new CROSS JOIN delta
+            ON CONFLICT ({i['order']}, {i['dish']})
+            DO UPDATE SET {i['quantity']} = {item_t}.{i['quantity']} + EXCLUDED.{i['quantity']}
+            RETURNING {i['id']} AS id, {i['dish']} AS dish_id,
+                      {i['quantity']} AS quantity, {i['unit_price']} AS unit_price
+        ),
+        upd AS (
+            UPDATE {order_t} SET
+                {o['total_quantity']} = {o['total_quantity']} + (SELECT SUM(qty) FROM delta),
+                {o['total_price']} = {o['total_price']} + (
+                    SELECT SUM(item.unit_price * delta.qty)
+                    FROM item JOIN delta ON delta.dish_id = item.dish_id
+                ),
+                {o['updated_at']} = %s
+            WHERE {o['id']} IN (SELECT id FROM still_new)
+            RETURNING {o['total_quantity']} AS total_quantity, {o['total_price']} AS total_price
+        )
+        SELECT item.id, item.dish_id, item.quantity, upd.total_quantity, upd.total_price
+        FROM item CROSS JOIN upd
+        """,
+        [result.order_id, Order.STATUS_NEW] + values + [now],
+    )
+    rows = cur.fetchall()
+    for item_id, dish_id, quantity, total_quantity, total_price in rows:
+        result.items[dish_id] = (item_id, quantity)
+        result.total_quantity, result.total_price = total_quantity, total_price
+    return bool(rows)
+
+
+# ========= остальные СУБД: ORM =========
+def _add_lines_orm(user_id: int, lines: list[CartLine]) -> CartResult:
+    with transaction.atomic():
+        order, created = Order.objects.get_or_create(user_id=user_id, status=Order.STATUS_NEW)
+        result = CartResult(order.pk, created, order.total_quantity, order.total_price)
+        if not lines:
+            return result
+
+        quantity, amount = 0, Decimal("0.00")
+        for ln in lines:
+            item, item_created = OrderItem.objects.get_or_create(
+                order=order, dish_id=ln.dish_id,
+                defaults={"quantity": ln.quantity, "unit_price": ln.unit_price},
+            )
+            if not item_created:
+                OrderItem.objects.filter(pk=item.pk).update(quantity=F("quantity") + ln.quantity)
+                item.quantity += ln.quantity
+            result.items[ln.dish_id] = (item.pk, item.quantity)
+            quantity += ln.quantity
+            amount += item.unit_price * ln.quantity
+
+        order.apply_item_delta(quantity, amount)
+        result.total_quantity, result.total_price = order.total_quantity, order.total_price
+    return result
+
+
+# ========= статусы заказа =========
+@dataclass(frozen=True)
+class Transition:
+    source: str
+    target: str
+    stage: Optional[str] = None  # этап для menu_order_stage_seconds (см. metrics.order_transition)
+
+
+SEND = Transition(Order.STATUS_NEW, Order.STATUS_KITCHEN)               # гость оформил корзину
+ACCEPT = Transition(Order.STATUS_NEW, Order.STATUS_KITCHEN, "queued")   # кухня приняла за гостя
+READY = Transition(Order.STATUS_KITCHEN, Order.STATUS_READY, "cooking")
+
+# статус → поле с моментом входа в него
+ENTERED_AT = {Order.STATUS_KITCHEN: "kitchen_at", Order.STATUS_READY: "ready_at"}
+
+
+@dataclass
+class Moved:
+    order_id: int
+    user_id: int
+    stage_started: datetime  # начало завершённого этапа: вход в исходный статус или последнее изменение
+
+
+def transition(t: Transition, ids: Optional[Iterable[int]] = None) -> list[Moved]:
+    """
+    Перевести заказы `ids` (None — все, что сейчас в t.source) в t.target.
+    Возвращает только сдвинутые заказы: остальные были не в t.source.
+    """
+    if ids is not None:
+        ids = sorted(set(ids))
+        if not ids:
+            return []
+    now = timezone.now()
+    # ушедший на кухню заказ считается продажей — кто бы его ни отправил
+    # (гость или кухня, по одному или пачкой); в одной транзакции с переходом
+    sold = t.source == Order.STATUS_NEW
+    with transaction.atomic(savepoint=False) if sold else nullcontext():
+        if connection.vendor == "postgresql":
+            moved = _transition_pg(t, ids, now)
+        else:
+            moved = _transition_orm(t, ids, now)
+        if sold and moved:
+            popularity.record_orders([m.order_id for m in moved])
+    for m in moved:
+        metrics.order_transition(t.source, t.target, t.stage, m.stage_started)
+    return moved
+
+
+def _transition_pg(t: Transition, ids: Optional[list[int]], now) -> list[Moved]:
+    table = _q(Order._meta.db_table)
+    o = {f: _col(Order, f) for f in ("id", "user", "status", "updated_at", *ENTERED_AT.values())}
+    started = f"prev.{o['updated_at']}"
+    if t.source in ENTERED_AT:
+        started = f"COALESCE(prev.{o[ENTERED_AT[t.source]]}, {started})"
+    only_ids = f"AND o.{o['id']} = ANY(%s)" if ids is not None else ""
+
+    # prev — та же строка в снимке до UPDATE: из неё берём, когда начался этап.
+    # Условие на o.status PostgreSQL перепроверяет после ожидания блокировки,
+    # так что параллельный переход не применится второй раз
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE {table} AS o
+            SET {o['status']} = %s, {o['updated_at']} = %s, {o[ENTERED_AT[t.target]]} = %s
+            FROM {table} AS prev
+            WHERE prev.{o['id']} = o.{o['id']} AND o.{o['status']} = %s {only_ids}
+            RETURNING o.{o['id']}, o.{o['user']}, {started}
+            """,
+            [t.target, now, now, t.source] + ([ids] if ids is not None else []),
+        )
+        return [Moved(*row) for row in sorted(cur.fetchall())]
+
+
+def _transition_orm(t: Transition, ids: Optional[list[int]], now) -> list[Moved]:
+    since = ENTERED_AT.get(t.source)
+    with transaction.atomic():
+        qs = Order.objects.select_for_update().filter(status=t.source)
+        if ids is not None:
+            qs = qs.filter(pk__in=ids)
+        rows = list(qs.order_by("pk").values("pk", "user_id", "updated_at", *([since] if since else [])))
+        if not rows:
+            return []
+        Order.objects.filter(pk__in=[r["pk"] for r in rows], status=t.source).update(
+            status=t.target, updated_at=now, **{ENTERED_AT[t.target]: now},
+        )
+    return [Moved(r["pk"], r["user_id"], (since and r[since]) or r["updated_at"]) for r in rows]
@@ -0,0 +1,138 @@
+# menuapp/pagecache.py
+"""
+Кэш готовых HTML-страниц меню (см. PageCacheMiddleware).
+
+Страницы home / category_detail / dish_detail — оболочки без пользовательских
+данных (корзину, вход и сообщения подгружает JS, см. views.fragments), они
+зависят только от пути (в нём и языковой префикс), языка, куки AGE_VERIFIED_21
+и версии меню, поэтому отрендеренный ответ можно отдать следующему гостю —
+анониму или залогиненному, — не вызывая вьюху.
+Ключ — (путь с query, язык, возраст подтверждён, версия меню).
+
+Кэш живёт в памяти процесса и ограничен по байтам (MENU_PAGE_CACHE_BYTES):
+при переполнении вытесняются давно не читанные страницы (LRU). Со сменой
+версии меню старые страницы выбрасываются целиком. TTL (MENU_PAGE_CACHE_TTL)
+ограничивает устаревание того, что от версии не зависит, — «популярных»
+на главной.
+
+Если в странице всё же окажется CSRF-токен, в кэше он заменяется заглушкой
+и при выдаче подставляется свежий для текущего гостя: чужой токен не прошёл
+бы проверку.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+
+CSRF_PLACEHOLDER = b"__menu_page_cache_csrf__"
+_CSRF_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]+(")')
+
+# заголовки ответа, которые хранятся вместе со страницей
+KEEP_HEADERS = ("Content-Type", "Content-Language", "Cache-Control", "Vary", "X-Frame-Options")
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "MENU_PAGE_CACHE", True))
+
+
+def max_bytes() -> int:
+    return int(getattr(settings, "MENU_PAGE_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+def ttl() -> float:
+    return float(getattr(settings, "MENU_PAGE_CACHE_TTL", 60))
+
+
+Key = tuple[str, str, bool, int]
+
+
+@dataclass
+class Page:
+    content: bytes          # с CSRF_PLACEHOLDER вместо токенов
+    headers: dict[str, str]
+    has_csrf: bool
+    expires: float
+
+
+class LRU:
+    """Потокобезопасный LRU с лимитом по суммарному размеру страниц."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages: OrderedDict[Key, Page] = OrderedDict()
+        self.size = 0
+        self.version: Optional[int] = None
+
+    def get(self, key: Key) -> Optional[Page]:
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                return None
+            if page.expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self.pages.move_to_end(key)
+            return page
+
+    def set(self, key: Key, page: Page) -> None:
+        limit = max_bytes()
+        if len(page.content) > limit:
+            return
+        with self.lock:
+            version = key[3]
+            if version != self.version:
+                # версия меню сменилась: всё прежнее уже не будет прочитано
+                self.pages.clear()
+                self.size = 0
+                self.version = version
+            if key in self.pages:
+                self._pop(key)
+            self.pages[key] = page
+            self.size += len(page.content)
+            while self.size > limit:
+                self._pop(next(iter(self.pages)))
+
+    def _pop(self, key: Key) -> None:
+        page = self.pages.pop(key)
+        self.size -= len(page.content)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.pages.clear()
+            self.size = 0
+            self.version = None
+
+
+_cache = LRU()
+
+
+def key(request, version: int, age_verified: bool) -> Key:
+    lang = getattr(request, "LANGUAGE_CODE", "") or ""
+    return (request.get_full_path(), lang, age_verified, version)
+
+
+def get(k: Key) -> Optional[Page]:
+    return _cache.get(k)
+
+
+def store(k: Key, response) -> None:
+    content, replaced = _CSRF_RE.subn(rb"\1" + CSRF_PLACEHOLDER + rb"\2", response.content)
+    headers = {h: response[h] for h in KEEP_HEADERS if response.has_header(h)}
+    _cache.set(k, Page(content, headers, bool(replaced), time.monotonic() + ttl()))
+
+
+def render(page: Page, csrf_token: Optional[str]) -> bytes:
+    if not page.has_csrf or csrf_token is None:
+        return page.content
+    return page.content.replace(CSRF_PLACEHOLDER, csrf_token.encode())
+
+
+def clear() -> None:
+    """Сбросить страницы процесса (тесты, ручная отладка)."""
+    _cache.clear()
@@ -0,0 +1,143 @@
+# menuapp/popularity.py
+"""
+Рейтинг популярных блюд.
+
+Счётчики копятся в DishDailySales (блюдо × день) в момент оформления заказа,
+а рейтинг считается по окну последних N дней — стоимость чтения зависит
+от размера меню и окна, но не от всей истории заказов.
+"""
+from __future__ import annotations
+
+import math
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import metrics
+from .models import DishDailySales, OrderItem
+
+GEN_KEY = "popularity:gen"
+TOP_TTL = 300  # сек.; после нового заказа кэш сбрасывается поколением
+
+
+def _window_days() -> int:
+    return int(getattr(settings, "MENU_POPULAR_DAYS", 30))
+
+
+def _half_life() -> Optional[float]:
+    value = getattr(settings, "MENU_POPULAR_HALF_LIFE_DAYS", None)
+    return float(value) if value else None
+
+
+# ========= запись =========
+def record_orders(order_ids: list[int]) -> None:
+    """
+    Добавить позиции заказов к продажам текущего дня.
+    Вызывается один раз на заказ — при переходе NEW → KITCHEN (orders.transition),
+    кто бы его ни сделал: гость оформил корзину или кухня приняла заказ.
+    """
+    if not order_ids:
+        return
+    day = timezone.localdate()
+    if connection.vendor == "postgresql":
+        _record_orders_pg(order_ids, day)
+    else:
+        _record_orders_orm(order_ids, day)
+    transaction.on_commit(_bump_gen)
+
+
+def _record_orders_pg(order_ids: list[int], day) -> None:
+    """Один INSERT ... SELECT ... ON CONFLICT на все позиции всех заказов."""
+    q = connection.ops.quote_name
+    sales, items = q(DishDailySales._meta.db_table), q(OrderItem._meta.db_table)
+    with connection.cursor() as cur:
+        # GROUP BY: ON CONFLICT не умеет трогать строку дня дважды за оператор
+        cur.execute(
+            f"""
+            INSERT INTO {sales} (dish_id, day, quantity)
+            SELECT dish_id, %s, SUM(quantity) FROM {items}
+            WHERE order_id = ANY(%s) AND quantity > 0
+            GROUP BY dish_id
+            ON CONFLICT (dish_id, day)
+            DO UPDATE SET quantity = {sales}.quantity + EXCLUDED.quantity
+            """,
+            [day, list(order_ids)],
+        )
+
+
+def _record_orders_orm(order_ids: list[int], day) -> None:
+    items = (
+        OrderItem.objects.filter(order_id__in=order_ids, quantity__gt=0)
+        .values("dish_id").annotate(sold=Sum("quantity")).values_list("dish_id", "sold")
+    )
+    with transaction.atomic(savepoint=False):
+        for dish_id, quantity in items:
+            updated = DishDailySales.objects.filter(dish_id=dish_id, day=day).update(
+                quantity=F("quantity") + quantity
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    DishDailySales.objects.create(dish_id=dish_id, day=day, quantity=quantity)
+            except IntegrityError:
+                # строку дня успел создать параллельный заказ
+                DishDailySales.objects.filter(dish_id=dish_id, day=day).update(
+                    quantity=F("quantity") + quantity
+                )
+
+
+def _bump_gen() -> None:
+    try:
+        cache.incr(GEN_KEY)
+    except ValueError:
+        cache.set(GEN_KEY, 1, timeout=None)
+
+
+# ========= чтение =========
+def _compute(days: int, half_life: Optional[float]) -> list[int]:
+    today = timezone.localdate()
+    rows = DishDailySales.objects.filter(
+        day__gt=today - timedelta(days=days),
+    ).values_list("dish_id", "day", "quantity")
+
+    scores: dict[int, float] = {}
+    for dish_id, day, quantity in rows:
+        weight = 1.0
+        if half_life:
+            weight = math.pow(0.5, (today - day).days / half_life)
+        scores[dish_id] = scores.get(dish_id, 0.0) + quantity * weight
+
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+    return [dish_id for dish_id, _score in ranked]
+
+
+def ranked_dish_ids(days: Optional[int] = None, half_life: Optional[float] = None) -> list[int]:
+    """
+    id блюд по убыванию продаж за последние `days` дней (по умолчанию
+    MENU_POPULAR_DAYS). `half_life` (в днях) включает затухание: вчерашняя
+    порция весит больше позавчерашней. Доступность блюд здесь не учитывается —
+    её проверяет вызывающий по снимку меню.
+
+    Результат кэшируется до следующего оформленного заказа (или смены дня).
+    """
+    days = days or _window_days()
+    half_life = half_life if half_life is not None else _half_life()
+
+    gen = cache.get(GEN_KEY, 0)
+    key = f"popularity:ranked:{gen}:{timezone.localdate()}:{days}:{half_life}"
+    ids = cache.get(key)
+    metrics.cache_result("popularity", "miss" if ids is None else "hit")
+    if ids is None:
+        ids = _compute(days, half_life)
+        cache.set(key, ids, TOP_TTL)
+    return ids
+
+
+def top_dish_ids(limit: int = 12, days: Optional[int] = None, half_life: Optional[float] = None) -> list[int]:
+    return ranked_dish_ids(days, half_life)[:limit]
@@ -0,0 +1,237 @@
+# menuapp/prerender.py
+"""
+Статическая копия публичного меню (главная, категории, блюда на ru/kk/en)
+для раздачи nginx'ом или CDN — меню открывается, даже если воркеры Django
+заняты или лежат.
+
+Страницы меню — «оболочки» без пользовательских данных (см. views._render_shell),
+поэтому их можно записать в файлы как есть; корзину и вход JS подтянет из
+/fragments/, когда Django доступен. Рендер идёт через тестовый клиент Django:
+весь стек middleware, ровно тот HTML, который отдал бы воркер, с ссылками
+на статику с хэшем (нужен collectstatic).
+
+Раскладка каталога:
+    public/<путь>index.html    — страницы, не зависящие от куки возраста
+    guest/<путь>index.html     — главная для гостя без AGE_VERIFIED_21
+    verified/<путь>index.html  — главная и страницы 21+ с подтверждённым возрастом
+    manifest.json              — что записано и из каких данных
+Рядом с каждым index.html лежит index.html.gz (gzip_static). Страниц 21+
+для гостя нет: их запрос уходит в Django и получает редирект на /age/.
+
+    map $cookie_AGE_VERIFIED_21 $menu_age { "1" verified; default guest; }
+    location / {
+        root /srv/ryumki/prerender;
+        gzip_static on;
+        try_files /$menu_age${uri}index.html /public${uri}index.html @django;
+    }
+
+Повторный запуск перерисовывает только страницы, у которых сменился
+отпечаток зависимостей: updated_at самой категории/блюда и блюд на странице,
+список категорий (навбар), «популярные» для главной, шаблоны, переводы
+и манифест статики. Файл, чьё содержимое не изменилось, не перезаписывается.
+После правок меню сборку запускает воркер (задача "prerender", если задан
+MENU_PRERENDER_DIR); «популярные» меняются и без правок — для них
+`manage.py prerender_menu` стоит запускать по cron.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from . import pagecache
+from .models import LOCALIZED_LANGS
+from .snapshot import get_menu, get_menu_version
+from .views import AGE_COOKIE, _popular_dishes
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+PUBLIC, GUEST, VERIFIED = "public", "guest", "verified"
+
+
+@dataclass
+class Page:
+    url: str
+    lang: str
+    variant: str   # public / guest / verified
+    deps: str      # отпечаток данных, из которых собрана страница
+
+    @property
+    def path(self) -> str:
+        return f"{self.variant}{self.url}index.html"
+
+
+@dataclass
+class Result:
+    rendered: list[str] = field(default_factory=list)    # файлы, записанные заново
+    unchanged: int = 0                                    # перерисованы, но HTML тот же
+    skipped: int = 0                                      # зависимости не менялись
+    removed: list[str] = field(default_factory=list)     # страниц больше нет
+
+
+# ========= отпечатки =========
+def _digest(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def static_manifest() -> Optional[str]:
+    """Манифест collectstatic (имена с хэшем) или None, если статику не собирали."""
+    read = getattr(staticfiles_storage, "read_manifest", None)
+    return read() if read else None
+
+
+def _code_digest() -> str:
+    """Шаблоны, переводы и манифест статики: всё, что меняется деплоем, а не админкой."""
+    dirs = [Path(d) for t in settings.TEMPLATES for d in t.get("DIRS", [])]
+    dirs.append(Path(apps.get_app_config("menuapp").path) / "templates")
+    dirs += [Path(d) for d in settings.LOCALE_PATHS]
+    h = hashlib.sha1()
+    for root in dirs:
+        for f in sorted(root.rglob("*")):
+            if f.is_file() and f.suffix in (".html", ".mo"):
+                h.update(str(f.relative_to(root)).encode())
+                h.update(f.read_bytes())
+    h.update((static_manifest() or "").encode())
+    return h.hexdigest()
+
+
+def pages() -> list[Page]:
+    """Все страницы меню с отпечатками — по снимку меню, без рендера."""
+    code = _code_digest()
+    out = []
+    for lang in LOCALIZED_LANGS:
+        menu = get_menu(lang)
+        nav = [(c.id, c.updated_at) for c in menu.categories]
+        with translation.override(lang):
+            home = _digest(
+                code, lang, nav,
+                sorted((d.id, d.updated_at) for d in menu.dishes_by_id.values()),
+                [d.id for d in _popular_dishes(menu)],
+            )
+            for name in ("home", "categories"):
+                out += [Page(reverse(name), lang, v, home) for v in (GUEST, VERIFIED)]
+
+            for c in menu.categories:
+                deps = _digest(code, lang, nav, [(d.id, d.updated_at) for d in c.dishes])
+                variant = VERIFIED if c.is_21plus else PUBLIC
+                out.append(Page(reverse("category_detail", args=[c.slug]), lang, variant, deps))
+
+            for d in menu.dishes_by_slug.values():
+                deps = _digest(code, lang, nav, d.id, d.updated_at)
+                variant = VERIFIED if d.requires_21 else PUBLIC
+                out.append(Page(reverse("dish_detail", args=[d.slug]), lang, variant, deps))
+    return out
+
+
+# ========= запись =========
+def _host() -> str:
+    host = getattr(settings, "MENU_PRERENDER_HOST", "")
+    if host:
+        return host
+    for h in settings.ALLOWED_HOSTS:
+        if h != "*":
+            return h.lstrip(".")
+    return "localhost"
+
+
+def _write(path: Path, data: bytes) -> None:
+    # через временный файл: nginx не отдаст половину страницы
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _unlink(path: Path) -> None:
+    for p in (path, path.with_name(path.name + ".gz")):
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def load_manifest(output: Path) -> dict:
+    try:
+        return json.loads((output / MANIFEST).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build(output, *, force: bool = False, require_hashed: bool = True) -> Result:
+    """
+    Привести каталог `output` в соответствие с текущим меню: перерисовать
+    страницы с изменившимися зависимостями, удалить исчезнувшие.
+    force — перерисовать всё (файлы с тем же HTML всё равно не перезаписываются);
+    require_hashed=False — разрешить ссылки на
+    статику без хэша (dev без collectstatic).
+    """
+    if require_hashed and static_manifest() is None:
+        raise ImproperlyConfigured("нет манифеста статики: сначала manage.py collectstatic")
+
+    output = Path(output)
+    version = get_menu_version()
+    previous = load_manifest(output).get("pages", {})
+    result = Result()
+    entries: dict[str, dict] = {}
+
+    pagecache.clear()  # страница из кэша процесса могла собраться до последних «популярных»
+    client = Client(HTTP_HOST=_host())
+    # LocaleMiddleware включает язык каждой страницы — по выходе вернём текущий
+    with translation.override(translation.get_language()):
+        for page in pages():
+            prev = previous.get(page.path)
+            target = output / page.path
+            if not force and prev and prev["deps"] == page.deps and target.exists():
+                entries[page.path] = prev
+                result.skipped += 1
+                continue
+
+            if page.variant == VERIFIED:
+                client.cookies[AGE_COOKIE] = "1"
+            else:
+                client.cookies.pop(AGE_COOKIE, None)
+            response = client.get(page.url)
+            if response.status_code != 200:
+                # сбой рендера — не повод убирать страницу: nginx отдаёт прошлую версию
+                log.warning("prerender %s (%s): HTTP %s, оставляю прежний файл", page.url, page.variant, response.status_code)
+                if prev:
+                    entries[page.path] = prev
+                continue
+
+            content = response.content
+            digest = hashlib.sha256(content).hexdigest()
+            entries[page.path] = {
+                "url": page.url, "lang": page.lang, "variant": page.variant,
+                "deps": page.deps, "sha256": digest, "size": len(content),
+            }
+            if prev and prev.get("sha256") == digest and target.exists():
+                result.unchanged += 1
+                continue
+            _write(target, content)
+            _write(target.with_name(target.name + ".gz"), gzip.compress(content, 9, mtime=0))
+            result.rendered.append(page.path)
+
+    for path in set(previous) - set(entries):
+        _unlink(output / path)
+        result.removed.append(path)
+
+    _write(output / MANIFEST, json.dumps({
+        "menu_version": version,
+        "generated_at": timezone.now().isoformat(),
+        "pages": entries,
+    }, ensure_ascii=False, indent=1, sort_keys=True).encode())
+    return result
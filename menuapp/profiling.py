@@ -0,0 +1,166 @@
+# menuapp/profiling.py
+"""
+Профилирование запросов (включается MENU_PROFILING=true, см. ProfilingMiddleware).
+
+На каждый запрос собирается разбивка времени:
+  • db   — SQL: число запросов и суммарное время (execute_wrapper);
+  • tpl  — рендер шаблонов без SQL, который случился внутри рендера
+           (ленивые querysets в шаблоне засчитываются в db);
+  • view — всё остальное: код вьюхи и middleware.
+
+Медленные запросы (дольше MENU_PROFILING_SLOW_MS) вместе с их SQL попадают
+в кольцевой буфер процесса — его смотрит персонал на странице slow_requests.
+"""
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.conf import settings
+
+MAX_QUERIES = 200  # больше SQL на один запрос в буфер не пишем
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "MENU_PROFILING", False))
+
+
+def slow_ms() -> float:
+    return float(getattr(settings, "MENU_PROFILING_SLOW_MS", 500))
+
+
+@dataclass
+class Profile:
+    started: float = field(default_factory=time.perf_counter)
+    db_count: int = 0
+    db_time: float = 0.0
+    tpl_time: float = 0.0
+    tpl_db_time: float = 0.0      # SQL, выполненный во время рендера
+    tpl_depth: int = 0
+    queries: list[tuple[str, float]] = field(default_factory=list)
+
+    def timings(self) -> dict[str, float]:
+        """Миллисекунды по слоям; сумма db + tpl + view = total."""
+        total = time.perf_counter() - self.started
+        tpl = max(self.tpl_time - self.tpl_db_time, 0.0)
+        view = max(total - self.db_time - tpl, 0.0)
+        return {
+            "total": total * 1000,
+            "db": self.db_time * 1000,
+            "tpl": tpl * 1000,
+            "view": view * 1000,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("menu_profile", default=None)
+
+
+def start() -> contextvars.Token:
+    return _current.set(Profile())
+
+
+def finish(token: contextvars.Token) -> Optional[Profile]:
+    profile = _current.get()
+    _current.reset(token)
+    return profile
+
+
+# ========= SQL =========
+def sql_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper: время и текст каждого запроса."""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        spent = time.perf_counter() - started
+        profile.db_count += 1
+        profile.db_time += spent
+        if profile.tpl_depth:
+            profile.tpl_db_time += spent
+        if len(profile.queries) < MAX_QUERIES:
+            profile.queries.append((sql, spent * 1000))
+
+
+# ========= шаблоны =========
+_patched = False
+_patch_lock = threading.Lock()
+
+
+def instrument_templates() -> None:
+    """
+    Обернуть Template.render бэкенда DTL. Вложенные {% include %} рендерятся
+    в обход этой обёртки, так что время не задваивается; tpl_depth — страховка
+    на случай render_to_string внутри тега.
+    """
+    global _patched
+    with _patch_lock:
+        if _patched:
+            return
+        from django.template.backends.django import Template
+
+        original = Template.render
+
+        def render(self, context=None, request=None):
+            profile = _current.get()
+            if profile is None:
+                return original(self, context, request)
+            profile.tpl_depth += 1
+            started = time.perf_counter()
+            try:
+                return original(self, context, request)
+            finally:
+                profile.tpl_depth -= 1
+                if not profile.tpl_depth:
+                    profile.tpl_time += time.perf_counter() - started
+
+        Template.render = render
+        _patched = True
+
+
+# ========= заголовок =========
+def server_timing(profile: Profile, timings: dict[str, float]) -> str:
+    return ", ".join([
+        f'db;dur={timings["db"]:.1f};desc="{profile.db_count} queries"',
+        f'tpl;dur={timings["tpl"]:.1f}',
+        f'view;dur={timings["view"]:.1f}',
+        f'total;dur={timings["total"]:.1f}',
+    ])
+
+
+# ========= медленные запросы =========
+_slow: deque[dict] = deque(maxlen=int(getattr(settings, "MENU_PROFILING_BUFFER", 50)))
+_slow_lock = threading.Lock()
+
+
+def record_slow(request, response, profile: Profile, timings: dict[str, float]) -> None:
+    match = getattr(request, "resolver_match", None)
+    entry = {
+        "ts": time.time(),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "view": match.view_name if match else "",
+        "status": response.status_code,
+        "timings": {k: round(v, 1) for k, v in timings.items()},
+        "db_count": profile.db_count,
+        "queries": [{"sql": sql, "ms": round(ms, 2)} for sql, ms in profile.queries],
+    }
+    with _slow_lock:
+        _slow.append(entry)
+
+
+def slow_requests() -> list[dict]:
+    """Снимок буфера, новые сверху."""
+    with _slow_lock:
+        return list(reversed(_slow))
+
+
+def clear() -> None:
+    with _slow_lock:
+        _slow.clear()
@@ -0,0 +1,192 @@
+# menuapp/search.py
+"""
+Поиск блюд по названиям и описаниям на всех трёх языках (ru / kk / en).
+
+Индекс строится в памяти процесса один раз на версию меню (одним запросом
+к БД) и дальше отвечает без SQL:
+  • слова нормализуются: регистр, ё → е, й → и, казахские буквы — в
+    ближайшие русские (қ → к, ү → у, …), диакритика латиницы отбрасывается,
+    поэтому «куырдак» находит «қуырдақ», а «creme» — «crème»;
+  • слово запроса совпадает со словом меню целиком или как префикс
+    («пельм» → «пельмени») — поиск по мере набора;
+  • опечатки — по похожести триграмм, как pg_trgm («борш» → «борщ»);
+  • слова запроса соединяются через И; совпадение в названии весит
+    больше, чем в описании. Запрос обрезается до MAX_QUERY_LENGTH символов
+    и MAX_QUERY_WORDS слов: время поиска не растёт с длиной строки;
+  • пока один поток строит индекс новой версии, остальные ищут по
+    предыдущему (как снимок меню в snapshot.get_menu).
+
+Недоступные блюда и блюда скрытых категорий отсекает вызывающий — по
+снимку меню той же версии (см. api.search).
+"""
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Optional
+
+from . import metrics
+from .models import LOCALIZED_LANGS, Dish
+from .snapshot import get_menu_version
+
+# поле → вес совпадения
+FIELDS = {"name": 3.0, "description": 1.0}
+
+PREFIX_SCORE = 0.8       # слово меню начинается со слова запроса
+FUZZY_MIN = 0.3          # порог похожести триграмм (как pg_trgm.similarity_threshold)
+FUZZY_SCORE = 0.7        # множитель для нечётких совпадений: точное и префикс выше
+FUZZY_MIN_LENGTH = 3     # короче — только точное совпадение и префикс
+
+MAX_QUERY_LENGTH = 100   # символов запроса, дальше не читаем
+MAX_QUERY_WORDS = 8      # различных слов запроса, остальные отбрасываем
+
+_LETTERS = str.maketrans({
+    "ә": "а", "ғ": "г", "қ": "к", "ң": "н", "ө": "о",
+    "ұ": "у", "ү": "у", "һ": "х", "і": "и",
+})
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+# ========= нормализация =========
+def normalize(text: str) -> str:
+    """Нижний регистр без диакритики; й/ё и казахские буквы — к базовым."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.translate(_LETTERS)
+
+
+def words(text: str) -> list[str]:
+    return _WORD_RE.findall(normalize(text or ""))
+
+
+def trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ========= индекс =========
+@dataclass(eq=False)
+class SearchIndex:
+    version: int
+    vocabulary: list[str]                      # отсортированные слова меню
+    postings: list[dict[int, float]]           # номер слова → {id блюда: вес поля}
+    grams: dict[str, list[int]]                # триграмма → номера слов
+    gram_counts: list[int]                     # номер слова → число его триграмм
+
+    def _matches(self, word: str) -> dict[int, float]:
+        """Слова меню, подходящие под слово запроса: номер → оценка 0..1."""
+        found: dict[int, float] = {}
+        vocabulary = self.vocabulary
+        for i in range(bisect_left(vocabulary, word), len(vocabulary)):
+            if not vocabulary[i].startswith(word):
+                break
+            found[i] = 1.0 if vocabulary[i] == word else PREFIX_SCORE
+        if len(word) < FUZZY_MIN_LENGTH:
+            return found
+
+        query = trigrams(word)
+        shared: Counter[int] = Counter()
+        for gram in query:
+            shared.update(self.grams.get(gram, ()))
+        size, counts = len(query), self.gram_counts
+        for i, common in shared.items():
+            # похожесть common / (size + counts[i] - common) >= FUZZY_MIN, без деления
+            if common * (1 + FUZZY_MIN) >= FUZZY_MIN * (size + counts[i]) and i not in found:
+                found[i] = common / (size + counts[i] - common) * FUZZY_SCORE
+        return found
+
+    def search(self, query: str) -> list[int]:
+        """id блюд, подходящих под все слова запроса, от лучших к худшим."""
+        scores: Optional[dict[int, float]] = None
+        for word in list(dict.fromkeys(words(query[:MAX_QUERY_LENGTH])))[:MAX_QUERY_WORDS]:
+            best: dict[int, float] = defaultdict(float)
+            for i, score in self._matches(word).items():
+                for dish_id, weight in self.postings[i].items():
+                    best[dish_id] = max(best[dish_id], score * weight)
+            if scores is None:
+                scores = dict(best)
+            else:
+                scores = {d: s + best[d] for d, s in scores.items() if d in best}
+            if not scores:
+                return []
+        if not scores:
+            return []
+        return sorted(scores, key=lambda d: (-scores[d], d))
+
+
+def _build(version: int) -> SearchIndex:
+    columns = [f"{f}_{lang}" for f in FIELDS for lang in LOCALIZED_LANGS]
+    weights: dict[str, dict[int, float]] = defaultdict(dict)  # слово → {id блюда: вес}
+    for row in Dish.objects.values("id", *columns):
+        for f, weight in FIELDS.items():
+            for lang in LOCALIZED_LANGS:
+                for word in words(row[f"{f}_{lang}"]):
+                    by_dish = weights[word]
+                    if by_dish.get(row["id"], 0) < weight:
+                        by_dish[row["id"]] = weight
+
+    vocabulary = sorted(weights)
+    grams: dict[str, list[int]] = defaultdict(list)
+    gram_counts = []
+    for i, word in enumerate(vocabulary):
+        word_grams = trigrams(word)
+        gram_counts.append(len(word_grams))
+        for gram in word_grams:
+            grams[gram].append(i)
+    return SearchIndex(
+        version=version,
+        vocabulary=vocabulary,
+        postings=[weights[w] for w in vocabulary],
+        grams=dict(grams),
+        gram_counts=gram_counts,
+    )
+
+
+# ========= индекс текущей версии =========
+_index: Optional[SearchIndex] = None
+_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    """
+    Индекс для текущей версии меню. После смены версии его строит один
+    поток; остальные в это время получают предыдущий индекс (если он есть)
+    или ждут окончания сборки, но сами в БД не идут.
+    """
+    global _index
+    version = get_menu_version()
+    index = _index
+    if index is not None and index.version == version:
+        metrics.cache_result("search_index", "hit")
+        return index
+
+    if not _lock.acquire(blocking=False):
+        if index is not None:
+            metrics.cache_result("search_index", "stale")
+            return index
+        _lock.acquire()
+
+    try:
+        index = _index
+        hit = index is not None and index.version == version
+        metrics.cache_result("search_index", "hit" if hit else "miss")
+        if not hit:
+            index = _index = _build(version)
+        return index
+    finally:
+        _lock.release()
+
+
+def search(query: str) -> list[int]:
+    return get_index().search(query)
+
+
+def clear() -> None:
+    """Сбросить индекс процесса (тесты, ручная отладка)."""
+    global _index
+    with _lock:
+        _index = None
@@ -1,9 +1,10 @@
 from rest_framework import serializers
-from django.utils.translation import get_language
-from .models import Category, Dish
 
 AGE_COOKIE = "AGE_VERIFIED_21"
 
+# Сериализаторы работают поверх снимка меню (snapshot.MenuCategory/MenuDish):
+# имена уже разрешены под язык снимка, обложки посчитаны — запросов к БД нет.
+
 
 def _age_verified(serializer) -> bool:
     req = getattr(serializer, "context", {}).get("request")
@@ -19,106 +20,75 @@ def _abs_url(serializer, url: str | None) -> str | None:
     return req.build_absolute_uri(url) if req else url
 
 
-class DishSerializer(serializers.ModelSerializer):
+def _variants(serializer, picture) -> dict:
+    """{"webp": [{"width": 320, "url": ...}, ...], ...} — производные картинки для srcset."""
+    if picture is None:
+        return {}
+    return {
+        fmt: [{"width": w, "url": _abs_url(serializer, url)} for w, url in items]
+        for fmt, items in picture.widths.items()
+    }
+
+
+def _lang(serializer) -> str:
+    return serializer.context.get("lang") or "ru"
+
+
+class DishSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    slug = serializers.CharField()
+    description = serializers.CharField()
+    base_price = serializers.DecimalField(max_digits=8, decimal_places=2)
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     passport_bg = serializers.SerializerMethodField()
-    requires_21 = serializers.SerializerMethodField()
+    is_available = serializers.BooleanField()
+    requires_21 = serializers.BooleanField()
     locked = serializers.SerializerMethodField()
     lang = serializers.SerializerMethodField()
 
-    # отдаём name/description через свойства модели (уже i18n-aware)
-    name = serializers.SerializerMethodField()
-    description = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Dish
-        fields = (
-            "id",
-            "name",
-            "slug",
-            "description",
-            "base_price",
-            "image",
-            "passport_bg",
-            "is_available",
-            "requires_21",
-            "locked",
-            "lang",
-        )
-
-    def get_name(self, obj):  # noqa
-        return obj.name
-
-    def get_description(self, obj):  # noqa
-        return obj.description
-
     def get_image(self, obj):
-        return _abs_url(self, obj.image.url) if obj.image else None
+        return _abs_url(self, obj.image_url)
 
-    def get_passport_bg(self, obj):
-        pb = getattr(obj, "passport_bg", None)
-        return _abs_url(self, pb.url) if getattr(pb, "url", None) else None
+    def get_image_variants(self, obj):
+        return _variants(self, obj.picture)
 
-    def get_requires_21(self, obj):
-        return bool(getattr(obj.category, "is_21plus", False))
+    def get_passport_bg(self, obj):
+        return _abs_url(self, obj.passport_bg_url)
 
     def get_locked(self, obj):
-        return self.get_requires_21(obj) and not _age_verified(self)
+        return obj.requires_21 and not _age_verified(self)
 
     def get_lang(self, obj):
-        return get_language() or "ru"
+        return _lang(self)
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    slug = serializers.CharField()
+    description = serializers.CharField()
+    position = serializers.IntegerField()
     image = serializers.SerializerMethodField()
-    requires_21 = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    requires_21 = serializers.BooleanField(source="is_21plus")
     locked = serializers.SerializerMethodField()
     cover_background_url = serializers.SerializerMethodField()
     dishes = DishSerializer(many=True, read_only=True)
     lang = serializers.SerializerMethodField()
 
-    name = serializers.SerializerMethodField()
-    description = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Category
-        fields = (
-            "id",
-            "name",
-            "slug",
-            "description",
-            "position",
-            "image",
-            "requires_21",
-            "locked",
-            "cover_background_url",
-            "dishes",
-            "lang",
-        )
-
-    def get_name(self, obj):  # noqa
-        return obj.name
-
-    def get_description(self, obj):  # noqa
-        return obj.description
-
     def get_image(self, obj):
-        return _abs_url(self, obj.image.url) if obj.image else None
+        return _abs_url(self, obj.image_url)
 
-    def get_requires_21(self, obj):
-        return bool(getattr(obj, "is_21plus", False))
+    def get_image_variants(self, obj):
+        return _variants(self, obj.picture)
 
     def get_locked(self, obj):
-        return self.get_requires_21(obj) and not _age_verified(self)
+        return obj.is_21plus and not _age_verified(self)
 
     def get_cover_background_url(self, obj):
-        cover = None
-        if hasattr(obj, "cover_image_url"):
-            try:
-                cover = obj.cover_image_url()
-            except Exception:
-                cover = None
-        return _abs_url(self, cover) if cover else None
+        return _abs_url(self, obj.cover_url)
 
     def get_lang(self, obj):
-        return get_language() or "ru"
+        return _lang(self)
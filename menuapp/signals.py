@@ -0,0 +1,61 @@
+# menuapp/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import images, jobs
+from .models import Category, Dish, menu_changed
+from .snapshot import bump_menu_version
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Dish)
+@receiver(menu_changed)
+def on_menu_changed(sender, **kwargs):
+    """
+    Любое изменение категорий/блюд (в т.ч. queryset.update() из админки)
+    поднимает версию меню. Второй раз — после коммита: иначе параллельный
+    запрос мог успеть собрать снимок новой версии из старых данных.
+    """
+    bump_menu_version()
+    transaction.on_commit(bump_menu_version)
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def refresh_category_cover(sender, instance, **kwargs):
+    """Фото/позиция/доступность блюда могли поменять обложку его категории."""
+    ids = {instance.category_id, getattr(instance, "_loaded_category_id", None)} - {None}
+    Category.objects.filter(pk__in=ids).refresh_covers()
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(menu_changed, sender=Dish)
+def refresh_all_covers(sender, **kwargs):
+    """queryset.update() по блюдам (экшены админки): какие категории задеты — не знаем."""
+    Category.objects.all().refresh_covers()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Dish)
+def enqueue_image_variants(sender, instance, update_fields=None, **kwargs):
+    """
+    Нарезка производных — в воркер (jobs.py): сохранение в админке
+    не ждёт Pillow. Ставим задачу, только если файл действительно сменился.
+    """
+    if update_fields is not None and not set(sender.IMAGE_FIELDS) & set(update_fields):
+        return
+    if images.stale(instance, sender.IMAGE_FIELDS):
+        jobs.enqueue_images(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Dish)
+@receiver(menu_changed)
+def enqueue_prerender(sender, **kwargs):
+    """Статическую копию меню (prerender.py) обновит воркер — только изменившиеся страницы."""
+    jobs.enqueue_prerender()
@@ -0,0 +1,278 @@
+# menuapp/snapshot.py
+"""
+Снимок меню в памяти процесса.
+
+Меню меняется несколько раз в день, а читается на каждом запросе, поэтому
+всё меню (категории, блюда, имена на нужном языке, обложки, цены) собирается
+один раз на пару (версия меню, язык) и дальше отдаётся без запросов к БД.
+
+Версия меню лежит в кэше Django (на проде — общий для всех воркеров бэкенд)
+и увеличивается сигналами при любом изменении Category/Dish (см. signals.py).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Optional
+
+from django.core.cache import cache
+
+from . import images, metrics
+from .models import Category, Dish, _lang_code, localized
+
+VERSION_KEY = "menu:version"
+MODIFIED_KEY = "menu:modified"
+
+
+# ========= версия меню =========
+def get_menu_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # ключа нет (рестарт кэша/вытеснение) — стартуем с метки времени,
+        # чтобы не совпасть с версией, которую уже видели другие процессы
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_menu_version() -> int:
+    cache.set(MODIFIED_KEY, int(time.time()), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_menu_version()
+
+
+def get_menu_modified() -> datetime:
+    """Время последнего изменения меню (для Last-Modified), с точностью до секунды."""
+    ts = cache.get(MODIFIED_KEY)
+    if ts is None:
+        cache.add(MODIFIED_KEY, int(time.time()), timeout=None)
+        ts = cache.get(MODIFIED_KEY)
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+# ========= объекты снимка =========
+@dataclass(eq=False)
+class MenuCategory:
+    id: int
+    slug: str
+    name: str
+    description: str
+    position: int
+    nav_position: int
+    show_in_nav: bool
+    is_21plus: bool
+    image_url: Optional[str]
+    cover_url: Optional[str]              # фон страницы: производная ~1920px, если есть
+    updated_at: Optional[datetime] = None  # для ключей кэша фрагментов в шаблонах
+    picture: Optional[images.Picture] = None
+    dishes: list["MenuDish"] = field(default_factory=list)  # только доступные, по позиции
+
+    def __str__(self) -> str:
+        return self.name or self.slug
+
+
+@dataclass(eq=False)
+class MenuDish:
+    id: int
+    slug: str
+    name: str
+    description: str
+    base_price: Decimal
+    image_url: Optional[str]
+    passport_bg_url: Optional[str]        # фон карточки: производная ~640px, если есть
+    is_available: bool
+    position: int
+    category: MenuCategory = field(repr=False)
+    updated_at: Optional[datetime] = None
+    picture: Optional[images.Picture] = None
+
+    @property
+    def requires_21(self) -> bool:
+        return self.category.is_21plus
+
+    def __str__(self) -> str:
+        return self.name or self.slug
+
+
+@dataclass(eq=False)
+class MenuSnapshot:
+    version: int
+    lang: str
+    categories: list[MenuCategory]
+    categories_by_slug: dict[str, MenuCategory]
+    dishes_by_slug: dict[str, MenuDish]
+    dishes_by_id: dict[int, MenuDish]
+    nav_categories: list[MenuCategory]
+
+    @property
+    def has_21plus(self) -> bool:
+        return any(c.is_21plus for c in self.categories)
+
+    def category(self, slug: str) -> Optional[MenuCategory]:
+        return self.categories_by_slug.get(slug)
+
+    def dish(self, slug: str) -> Optional[MenuDish]:
+        return self.dishes_by_slug.get(slug)
+
+    def available_dishes(self) -> list[MenuDish]:
+        """Все доступные блюда в порядке (position, id), как в старом fallback."""
+        dishes = [d for c in self.categories for d in c.dishes]
+        return sorted(dishes, key=lambda d: (d.position, d.id))
+
+
+# ========= сборка =========
+def _file_url(f) -> Optional[str]:
+    if not f:
+        return None
+    try:
+        return f.url
+    except Exception:
+        return None
+
+
+def _build(version: int, lang: str) -> MenuSnapshot:
+    """
+    Два запроса: все категории и все блюда. Дальше — только Python:
+    имена/описания разрешаются под `lang` один раз, и шаблоны читают
+    готовые атрибуты вместо свойств модели с цепочкой отката.
+    srcset'ы картинок тоже собираются здесь, из манифестов image_variants.
+    """
+    storage = Category._meta.get_field("image").storage
+    covers: dict[int, str] = {}                 # id категории → cover_image
+    manifests: dict[str, dict] = {}             # имя файла → манифест производных
+    categories: list[MenuCategory] = []
+    by_id: dict[int, MenuCategory] = {}
+    dishes_by_slug: dict[str, MenuDish] = {}
+    dishes_by_id: dict[int, MenuDish] = {}
+
+    for c in Category.objects.order_by("nav_position", "position", "id"):
+        picture = images.picture(storage, c.image.name if c.image else None, c.image_variants.get("image"))
+        mc = MenuCategory(
+            id=c.pk,
+            slug=c.slug,
+            name=localized(c, "name", lang),
+            description=localized(c, "description", lang),
+            position=c.position,
+            nav_position=c.nav_position,
+            show_in_nav=c.show_in_nav,
+            is_21plus=c.is_21plus,
+            image_url=_file_url(c.image),
+            cover_url=c.cover_image_url(),
+            updated_at=c.updated_at,
+            picture=picture,
+        )
+        categories.append(mc)
+        by_id[mc.id] = mc
+        covers[mc.id] = c.cover_image
+        if c.image:
+            manifests[c.image.name] = c.image_variants.get("image")
+
+    for d in Dish.objects.order_by("position", "id"):
+        mc = by_id.get(d.category_id)
+        if mc is None:
+            continue
+        if d.image:
+            manifests[d.image.name] = d.image_variants.get("image")
+        picture = images.picture(storage, d.image.name if d.image else None, d.image_variants.get("image"))
+        passport = images.picture(
+            storage, d.passport_bg.name if d.passport_bg else None, d.image_variants.get("passport_bg")
+        )
+        md = MenuDish(
+            id=d.pk,
+            slug=d.slug,
+            name=localized(d, "name", lang),
+            description=localized(d, "description", lang),
+            base_price=d.base_price,
+            image_url=_file_url(d.image),
+            passport_bg_url=passport.best(640) if passport else None,
+            is_available=d.is_available,
+            position=d.position,
+            category=mc,
+            updated_at=d.updated_at,
+            picture=picture,
+        )
+        dishes_by_slug[md.slug] = md
+        dishes_by_id[md.id] = md
+        if md.is_available:
+            mc.dishes.append(md)
+
+    # обложка — своя картинка категории или фото блюда: берём их производные
+    for mc in categories:
+        cover = covers.get(mc.id)
+        pic = images.picture(storage, cover, manifests.get(cover)) if cover else None
+        if pic is not None:
+            mc.cover_url = pic.best(1920)
+
+    return MenuSnapshot(
+        version=version,
+        lang=lang,
+        categories=categories,
+        categories_by_slug={c.slug: c for c in categories},
+        dishes_by_slug=dishes_by_slug,
+        dishes_by_id=dishes_by_id,
+        nav_categories=[c for c in categories if c.show_in_nav],
+    )
+
+
+# ========= кэш снимков (single-flight) =========
+_snapshots: dict[tuple[int, str], MenuSnapshot] = {}
+_latest: dict[str, MenuSnapshot] = {}  # последний собранный снимок на язык
+_locks: dict[tuple[int, str], threading.Lock] = {}
+_guard = threading.Lock()
+
+
+def get_menu(lang: Optional[str] = None) -> MenuSnapshot:
+    """
+    Снимок меню для текущей версии и языка.
+
+    После смены версии снимок пересобирает ровно один поток процесса:
+    остальные в это время получают предыдущий снимок (если он есть)
+    или ждут окончания сборки, но сами в БД не идут.
+    """
+    lang = lang or _lang_code()
+    version = get_menu_version()
+    key = (version, lang)
+
+    snap = _snapshots.get(key)
+    if snap is not None:
+        metrics.cache_result("menu_snapshot", "hit")
+        return snap
+
+    with _guard:
+        lock = _locks.setdefault(key, threading.Lock())
+
+    if not lock.acquire(blocking=False):
+        stale = _latest.get(lang)
+        if stale is not None:
+            metrics.cache_result("menu_snapshot", "stale")
+            return stale
+        lock.acquire()
+
+    try:
+        snap = _snapshots.get(key)
+        metrics.cache_result("menu_snapshot", "hit" if snap is not None else "miss")
+        if snap is None:
+            snap = _build(version, lang)
+            with _guard:
+                for k in [k for k in _snapshots if k[0] != version]:
+                    del _snapshots[k]
+                _snapshots[key] = snap
+                _latest[lang] = snap
+        return snap
+    finally:
+        lock.release()
+        with _guard:
+            if _locks.get(key) is lock and key in _snapshots:
+                del _locks[key]
+
+
+def clear() -> None:
+    """Сбросить снимки процесса (тесты, ручная отладка)."""
+    with _guard:
+        _snapshots.clear()
+        _latest.clear()
@@ -0,0 +1,40 @@
+# menuapp/storage.py
+"""
+Хранилище статики для collectstatic: имена с хэшем содержимого
+(style.3f2a….css), рядом — .gz и .br (brotli, если установлен), отдаёт
+WhiteNoise с Cache-Control: immutable на год вперёд. Меняется файл —
+меняется имя, так что повторный визит ничего не перепроверяет.
+
+Отличия от CompressedManifestStaticFilesStorage:
+  • ссылка в CSS на файл, которого нет (шрифты в style.css), не роняет
+    collectstatic — остаётся как есть;
+  • {% static %} на файл вне манифеста (нет файла / статику ещё не
+    собирали — тесты, свежий чекаут) отдаёт путь без хэша вместо 500.
+"""
+from __future__ import annotations
+
+import logging
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+log = logging.getLogger(__name__)
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                log.warning("%s: ссылка на отсутствующий файл %s", name, matchobj["url"])
+                return matchobj["matched"]
+
+        return convert
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
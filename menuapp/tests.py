@@ -1,3 +1,1282 @@
-from django.test import TestCase
+# menuapp/tests.py
+"""
+Бюджеты запросов и времени для вьюх menuapp/urls.py и read-API.
 
-# Create your tests here.
+Каждая проверка прогоняет один и тот же запрос на меню из 10, 100 и 1000
+блюд (и на кухне с пропорциональным числом открытых заказов) и падает, если:
+  • число SQL-запросов отличается между размерами — значит, появился N+1;
+  • число запросов больше бюджета вьюхи;
+  • запрос дольше TIME_BUDGET (грубая страховка от квадратичных циклов).
+
+kitchen_events (бесконечный SSE-поток под ASGI) здесь не меряется.
+
+PopularityTests — рейтинг «популярных» по окну дней с затуханием (popularity.py).
+
+CartTests — запись в корзину (orders.add_lines): один открытый заказ,
+одна строка на блюдо, цены позиций и итоги заказа.
+
+BatchOrderTests — пакетное добавление в корзину (views.add_to_order_batch).
+
+EventBusTests — шина событий кухни (events.py): доставка, догон по
+Last-Event-ID, переполнение очереди, публикация только после коммита.
+
+JobQueueTests — очередь фоновых задач (jobs.py): идемпотентная постановка,
+повторы и нарезка картинок воркером.
+
+StaticStorageTests — хэширование и сжатие статики (storage.py).
+
+PageCacheTests — кэш готовых страниц меню и пользовательские фрагменты к ним
+(pagecache.py, views.fragments).
+
+CardCacheTests — кэш карточек блюд на главной ({% cache %} по updated_at).
+
+SearchTests — поиск блюд по индексу в памяти (search.py, /api/search/).
+
+ApiConditionalTests — 304 по If-None-Match в read-API и его сброс (api.py).
+
+PrerenderTests — статическая копия меню для nginx (prerender.py).
+
+LoadtestTests — отчёт и уборка за manage.py loadtest.
+
+MetricsAccessTests — кому отвечает /metrics (токен, DEBUG).
+
+KitchenFeedTests — инкрементальная лента кухни по курсору (views.kitchen_feed).
+
+OrderTransitionTests — переходы статусов заказа условным UPDATE (orders.transition).
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+import time
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponseServerError
+from django.test import Client, TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from . import events, jobs, orders, pagecache, popularity, prerender, search, snapshot, views
+from .management.commands import loadtest
+from .models import Category, Dish, DishDailySales, Job, Order, OrderItem
+from .storage import StaticStorage
+
+SIZES = (10, 100, 1000)
+CATEGORIES = 10
+TIME_BUDGET = 0.5  # сек. на запрос при 1000 блюд
+
+JSON = {"HTTP_ACCEPT": "application/json"}
+
+
+# без кэша страниц: иначе замер главной и страниц меню — попадание в кэш,
+# а вьюха и шаблон не выполняются (кэш страниц проверяет PageCacheTests)
+@override_settings(MENU_PAGE_CACHE=False)
+class QueryBudgetTests(TestCase):
+    # session + user — цена любого запроса залогиненного пользователя
+    AUTH = 2
+    # позиций в пакетных запросах: столько блюд есть уже в самом маленьком меню
+    LINES = SIZES[0]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user("guest", password="x")
+        cls.chef = User.objects.create_user("chef", password="x", is_staff=True)
+        cls.categories = [
+            Category.objects.create(
+                name_ru=f"Категория {i}", slug=f"cat-{i}", position=i, is_21plus=(i == CATEGORIES - 1)
+            )
+            for i in range(CATEGORIES)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+
+    # ——— данные ———
+    def _grow_menu(self, size: int) -> None:
+        """Досыпать блюд до `size` (bulk_create сигналов не шлёт — версию двигаем сами)."""
+        have = Dish.objects.count()
+        Dish.objects.bulk_create([
+            Dish(
+                category=self.categories[n % CATEGORIES],
+                name_ru=f"Блюдо {n}",
+                slug=f"dish-{n}",
+                base_price=Decimal(100 + n),
+                position=n,
+            )
+            for n in range(have, size)
+        ])
+        snapshot.bump_menu_version()
+
+    def _grow_kitchen(self, size: int) -> None:
+        """Открытых заказов на кухне — десятая часть от числа блюд, по три позиции в каждом."""
+        dishes = list(Dish.objects.order_by("id").values_list("id", "base_price")[:3])
+        for n in range(Order.objects.filter(status=Order.STATUS_KITCHEN).count(), size // 10):
+            user = User.objects.create_user(f"kitchen-guest-{size}-{n}")
+            order = Order.objects.create(user=user, status=Order.STATUS_KITCHEN)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, dish_id=pk, quantity=2, unit_price=price) for pk, price in dishes
+            ])
+            order.recalculate_totals()
+
+    # блюдо из «взрослой» категории: заодно проверяем путь с куки 21+
+    SAMPLE_DISH = f"dish-{CATEGORIES - 1}"
+
+    def _sample_dish_id(self, size: int = 0) -> int:
+        return Dish.objects.get(slug=self.SAMPLE_DISH).pk
+
+    # ——— измерение ———
+    @staticmethod
+    def _on(postgresql: int, other: int) -> int:
+        """
+        Бюджет зависит от СУБД: на PostgreSQL корзина и счётчики популярности
+        пишутся upsert'ами, на остальных — ORM-циклом по позициям (см. orders.py).
+        """
+        return postgresql if connection.vendor == "postgresql" else other
+
+    def assertBudget(self, budget: int, request, prepare=None, login=None):
+        """
+        prepare(size) готовит состояние перед каждым замером (его запросы
+        не считаются) и отдаёт аргумент для request(arg) → response; без
+        prepare в request уходит size. Первый прогон на каждом размере —
+        прогрев снимка меню и кэшей, меряется второй.
+        """
+        if login is not None:
+            self.client.force_login(login)
+        counts = {}
+        for size in SIZES:
+            self._grow_menu(size)
+            self._grow_kitchen(size)
+            for attempt in ("warm", "measure"):
+                arg = prepare(size) if prepare is not None else size
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = request(arg)
+                    elapsed = time.perf_counter() - started
+                self.assertLess(response.status_code, 400, f"size={size}: {response.status_code}")
+                self.assertNotIn("X-Page-Cache", response, "замер попал в кэш страниц")
+            counts[size] = len(ctx)
+            self.assertLess(elapsed, TIME_BUDGET, f"size={size}: {elapsed:.3f}s")
+
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"число запросов растёт с размером меню: {counts}\n"
+            + "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+        self.assertLessEqual(counts[SIZES[-1]], budget, "\n".join(q["sql"] for q in ctx.captured_queries))
+
+    # ——— меню ———
+    def test_home(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("home")))
+
+    def test_home_logged_in(self):
+        # страница-оболочка одна для всех: ни сессии, ни пользователя
+        self.assertBudget(0, lambda size: self.client.get(reverse("home")), login=self.guest)
+
+    def test_fragments(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("fragments")))
+
+    def test_fragments_logged_in(self):
+        # сводка корзины — одна выборка итогов заказа, дальше кэш
+        self.assertBudget(self.AUTH, lambda size: self.client.get(reverse("fragments")), login=self.guest)
+
+    def test_categories(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("categories")))
+
+    def test_category_detail(self):
+        self.assertBudget(0, lambda size: self.client.get(
+            reverse("category_detail", args=[self.categories[-1].slug])
+        ))
+
+    def test_dish_detail(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("dish_detail", args=[self.SAMPLE_DISH])))
+
+    def test_snapshot_build(self):
+        # холодная сборка снимка: категории + блюда, независимо от размера
+        counts = {}
+        for size in SIZES:
+            self._grow_menu(size)
+            snapshot.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                snapshot.get_menu("ru")
+            counts[size] = len(ctx)
+        self.assertEqual(set(counts.values()), {2}, counts)
+
+    # ——— аккаунты и возраст ———
+    def test_signup_form(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("signup")))
+
+    def test_age_gate(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("age_gate")))
+
+    def test_age_confirm(self):
+        self.assertBudget(0, lambda size: self.client.post(reverse("age_confirm")))
+
+    # ——— корзина ———
+    def test_add_to_order(self):
+        self.assertBudget(
+            self.AUTH + self._on(postgresql=2, other=7),
+            lambda dish_id: self.client.post(reverse("add_to_order", args=[dish_id]), **JSON),
+            self._sample_dish_id, self.guest,
+        )
+
+    def test_add_to_order_batch(self):
+        def prepare(size):
+            items = [{"dish_id": pk, "quantity": 2} for pk in Dish.objects.values_list("pk", flat=True)[: self.LINES]]
+            return json.dumps({"items": items})
+
+        def request(body):
+            return self.client.post(reverse("add_to_order_batch"), body, content_type="application/json", **JSON)
+
+        self.assertBudget(self.AUTH + self._on(postgresql=4, other=27), request, prepare, self.guest)
+
+    def test_view_order(self):
+        def prepare(size):
+            lines = [orders.CartLine(pk, 1, price) for pk, price in Dish.objects.values_list("pk", "base_price")]
+            orders.add_lines(self.guest.pk, lines)
+
+        self.assertBudget(self.AUTH + 2, lambda size: self.client.get(reverse("view_order")), prepare, self.guest)
+
+    def test_finalize_order(self):
+        def prepare(size):
+            lines = [orders.CartLine(pk, 1, price) for pk, price in Dish.objects.values_list("pk", "base_price")[: self.LINES]]
+            orders.add_lines(self.guest.pk, lines)
+
+        self.assertBudget(
+            self.AUTH + self._on(postgresql=7, other=22),
+            lambda size: self.client.post(reverse("finalize_order"), **JSON),
+            prepare, self.guest,
+        )
+
+    # ——— кухня ———
+    def test_kitchen_orders(self):
+        self.assertBudget(self.AUTH + 2, lambda size: self.client.get(reverse("kitchen_orders")), login=self.chef)
+
+    def test_kitchen_feed(self):
+        self.assertBudget(self.AUTH + 2, lambda size: self.client.get(reverse("kitchen_feed")), login=self.chef)
+
+    def test_mark_accept(self):
+        def prepare(size):
+            user = User.objects.create_user(f"accept-{size}-{time.monotonic_ns()}")
+            return Order.objects.create(user=user).pk
+
+        # переход + продажи дня для «популярных» (на ORM — выборка позиций заказа)
+        self.assertBudget(
+            self.AUTH + self._on(postgresql=2, other=5),
+            lambda order_id: self.client.post(reverse("mark_accept", args=[order_id]), **JSON),
+            prepare, self.chef,
+        )
+
+    def test_mark_ready(self):
+        def prepare(size):
+            user = User.objects.create_user(f"ready-{size}-{time.monotonic_ns()}")
+            return Order.objects.create(user=user, status=Order.STATUS_KITCHEN).pk
+
+        self.assertBudget(
+            self.AUTH + self._on(postgresql=1, other=4),
+            lambda order_id: self.client.post(reverse("mark_ready", args=[order_id]), **JSON),
+            prepare, self.chef,
+        )
+
+    def test_kitchen_bulk(self):
+        # «готовы выбранные»: все заказы на кухне одним UPDATE, сколько бы их ни было
+        def prepare(size):
+            ids = list(Order.objects.filter(status=Order.STATUS_KITCHEN).values_list("pk", flat=True))
+            if not ids:  # прошлый замер уже всё закрыл — вернём на кухню
+                Order.objects.filter(status=Order.STATUS_READY).update(status=Order.STATUS_KITCHEN)
+                ids = list(Order.objects.filter(status=Order.STATUS_KITCHEN).values_list("pk", flat=True))
+            return ids
+
+        self.assertBudget(
+            self.AUTH + self._on(postgresql=1, other=4),
+            lambda ids: self.client.post(reverse("kitchen_bulk"), {"action": "ready", "order_id": ids}, **JSON),
+            prepare, self.chef,
+        )
+
+    def test_slow_requests(self):
+        self.assertBudget(self.AUTH, lambda size: self.client.get(reverse("slow_requests")), login=self.chef)
+
+    @override_settings(MENU_METRICS_TOKEN="scrape")
+    def test_metrics(self):
+        # счётчики из памяти/файлов, открытые заказы — один GROUP BY
+        self.assertBudget(1, lambda size: self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape"))
+
+    # ——— read-API ———
+    def test_api_categories(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("api_categories")))
+
+    def test_api_category(self):
+        self.assertBudget(0, lambda size: self.client.get(
+            reverse("api_category", args=[self.categories[0].slug])
+        ))
+
+    def test_api_dish(self):
+        self.assertBudget(0, lambda size: self.client.get(reverse("api_dish", args=[self.SAMPLE_DISH])))
+
+    def test_api_search(self):
+        # индекс строится при прогреве, дальше — ни одного запроса
+        self.assertBudget(0, lambda size: self.client.get(reverse("api_search"), {"q": "блюдо 9"}))
+
+
+class PopularityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user("guest", password="x")
+        soups = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.old, cls.steady, cls.fresh = [
+            Dish.objects.create(category=soups, slug=slug, base_price=100, name_ru=slug)
+            for slug in ("old", "steady", "fresh")
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def sold(self, dish: Dish, days_ago: int, quantity: int) -> None:
+        DishDailySales.objects.create(dish=dish, day=timezone.localdate() - timedelta(days=days_ago), quantity=quantity)
+
+    def test_window_and_decay(self):
+        self.sold(self.old, 40, 100)      # за окном
+        self.sold(self.steady, 10, 5)
+        self.sold(self.fresh, 0, 3)
+        self.assertEqual(popularity.ranked_dish_ids(days=30, half_life=0), [self.steady.pk, self.fresh.pk])
+        # период полураспада 2 дня: 5 порций десятидневной давности весят 5 / 32
+        self.assertEqual(popularity.ranked_dish_ids(days=30, half_life=2), [self.fresh.pk, self.steady.pk])
+        self.assertEqual(popularity.ranked_dish_ids(days=60, half_life=0)[0], self.old.pk)
+
+    def test_recorded_once_per_finalize(self):
+        self.client.force_login(self.guest)
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+        orders.add_lines(self.guest.pk, [orders.CartLine(self.fresh.pk, 2, self.fresh.base_price)])
+        order = Order.objects.get(user=self.guest)
+
+        with mock.patch.object(popularity, "record_orders", wraps=popularity.record_orders) as record, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse("finalize_order"), **JSON).status_code, 200)
+            self.assertEqual(self.client.post(reverse("finalize_order"), **JSON).status_code, 400)
+            views._send_to_kitchen(order)  # второй клик, который успел найти заказ до перехода
+        record.assert_called_once_with([order.pk])
+        self.assertEqual(DishDailySales.objects.get(dish=self.fresh).quantity, 2)
+        self.assertEqual(popularity.ranked_dish_ids(), [self.fresh.pk])
+
+    def test_recorded_when_kitchen_accepts(self):
+        # кухня принимает заказ за гостя, поштучно и «все новые» — продажи те же, что при оформлении
+        chef = User.objects.create_user("chef", password="x", is_staff=True)
+        self.client.force_login(chef)
+        carts = []
+        for name in ("a", "b", "c"):
+            user = User.objects.create_user(f"guest-{name}")
+            orders.add_lines(user.pk, [
+                orders.CartLine(self.fresh.pk, 1, self.fresh.base_price),
+                orders.CartLine(self.steady.pk, 2, self.steady.base_price),
+            ])
+            carts.append(Order.objects.get(user=user))
+
+        with mock.patch.object(popularity, "record_orders", wraps=popularity.record_orders) as record, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("mark_accept", args=[carts[0].pk]), **JSON)
+            self.client.post(reverse("kitchen_bulk"), {"action": "accept", "all": "1"}, **JSON)
+            self.client.post(reverse("mark_accept", args=[carts[0].pk]), **JSON)  # 409: уже на кухне
+            self.client.post(reverse("kitchen_bulk"), {"action": "ready", "all": "1"}, **JSON)
+        self.assertEqual(record.call_args_list, [mock.call([carts[0].pk]), mock.call([carts[1].pk, carts[2].pk])])
+        self.assertEqual(
+            dict(DishDailySales.objects.values_list("dish_id", "quantity")),
+            {self.fresh.pk: 3, self.steady.pk: 6},
+        )
+        self.assertEqual(popularity.ranked_dish_ids(), [self.steady.pk, self.fresh.pk])
+
+
+class CartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user("guest", password="x")
+        soups = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.borsch = Dish.objects.create(category=soups, slug="borsch", base_price=100, name_ru="Борщ")
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+
+    def line(self, quantity: int = 1) -> orders.CartLine:
+        return orders.CartLine(self.borsch.pk, quantity, self.borsch.base_price)
+
+    def test_one_open_order_and_one_row_per_dish(self):
+        first = orders.add_lines(self.guest.pk, [self.line(1), self.line(2)])  # одно блюдо дважды в пакете
+        again = orders.add_lines(self.guest.pk, [self.line(3)])
+        self.assertTrue(first.order_created)
+        self.assertFalse(again.order_created)
+        self.assertEqual(again.order_id, first.order_id)
+        self.assertEqual(again.items[self.borsch.pk], (first.items[self.borsch.pk][0], 6))
+        self.assertEqual(Order.objects.filter(user=self.guest).count(), 1)
+        self.assertEqual(OrderItem.objects.get().quantity, 6)
+
+        Order.objects.filter(pk=first.order_id).update(status=Order.STATUS_KITCHEN)
+        after = orders.add_lines(self.guest.pk, [self.line()])
+        self.assertTrue(after.order_created)
+        self.assertEqual(OrderItem.objects.filter(order_id=after.order_id).get().quantity, 1)
+
+    def add(self, dish: Dish):
+        return self.client.post(reverse("add_to_order", args=[dish.pk]), **JSON)
+
+    def test_price_fixed_and_totals_after_repeated_adds(self):
+        self.client.force_login(self.guest)
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+        for _ in range(2):
+            self.add(self.borsch)
+        self.borsch.base_price = Decimal("150.00")
+        self.borsch.save()
+        self.add(self.borsch)
+        salad = Dish.objects.create(category=self.borsch.category, slug="salad", base_price=40, name_ru="Салат")
+        self.add(salad)
+
+        order = Order.objects.get(user=self.guest)
+        item = order.orderitem_set.get(dish=self.borsch)
+        self.assertEqual((item.quantity, item.unit_price), (3, Decimal("100.00")))
+        self.assertEqual((order.total_quantity, order.total_price), (4, Decimal("340.00")))
+        order.recalculate_totals(save=False)  # итоги, сдвинутые инкрементами, сходятся с позициями
+        self.assertEqual((order.total_quantity, order.total_price), (4, Decimal("340.00")))
+
+    @skipUnless(connection.vendor == "postgresql", "гонка между двумя операторами upsert — только PostgreSQL")
+    def test_order_sent_between_statements(self):
+        upsert = orders._upsert_open_order
+        sent = []
+
+        def upsert_then_finalize(*args):
+            result = upsert(*args)
+            if not sent:  # соседний запрос оформил заказ между (1) и (2)
+                Order.objects.filter(pk=result.order_id).update(status=Order.STATUS_KITCHEN)
+                sent.append(result.order_id)
+            return result
+
+        with mock.patch.object(orders, "_upsert_open_order", upsert_then_finalize):
+            result = orders.add_lines(self.guest.pk, [self.line(2)])
+        self.assertNotEqual(result.order_id, sent[0])
+        self.assertFalse(OrderItem.objects.filter(order_id=sent[0]).exists())
+        self.assertEqual(OrderItem.objects.get(order_id=result.order_id).quantity, 2)
+        self.assertEqual(result.total_quantity, 2)
+
+    def test_kitchen_event_from_written_lines(self):
+        self.client.force_login(self.guest)
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+        with mock.patch("menuapp.events.publish") as publish:
+            for _ in range(2):
+                self.client.post(reverse("add_to_order", args=[self.borsch.pk]), **JSON)
+        (created, first), (updated, second) = [c.args for c in publish.call_args_list]
+        self.assertEqual((created, updated), ("order.created", "order.updated"))
+        self.assertEqual(second["items"], [{"dish_id": self.borsch.pk, "dish": "Борщ", "quantity": 2}])
+        self.assertTrue(second["merge"])
+        self.assertEqual(second["user"], "guest")
+
+
+class BatchOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user("guest", password="x")
+        soups = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.borsch = Dish.objects.create(category=soups, slug="borsch", base_price=100, name_ru="Борщ")
+        cls.sold_out = Dish.objects.create(
+            category=soups, slug="sold-out", base_price=100, name_ru="Окрошка", is_available=False,
+        )
+        bar = Category.objects.create(name_ru="Бар", slug="bar", is_21plus=True)
+        cls.beer = Dish.objects.create(category=bar, slug="beer", base_price=100, name_ru="Пиво")
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+        self.client.force_login(self.guest)
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+
+    def post(self, body):
+        return self.client.post(reverse("add_to_order_batch"), json.dumps(body), content_type="application/json")
+
+    def test_malformed(self):
+        line = {"dish_id": self.borsch.pk, "quantity": 1}
+        for body in (
+            [line], {}, {"items": []}, {"items": [line] * 51},
+            {"items": [{"quantity": 1}]}, {"items": [{"dish_id": "борщ"}]},
+            {"items": [{**line, "quantity": 0}]}, {"items": [{**line, "quantity": 100}]},
+            {"items": [{**line, "quantity": 2.9}]}, {"items": [{**line, "quantity": True}]},
+            {"items": [{**line, "quantity": "2"}]}, {"items": [{**line, "dish_id": float(self.borsch.pk)}]},
+            {"items": [{**line, "dish_id": True}]}, {"items": [{**line, "quantity": float("inf")}]},
+        ):
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()["error"], "bad_request")
+        self.assertFalse(Order.objects.exists())
+
+    def test_unavailable(self):
+        response = self.post({"items": [
+            {"dish_id": self.borsch.pk}, {"dish_id": self.sold_out.pk}, {"dish_id": 10 ** 9},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["dish_ids"], [self.sold_out.pk, 10 ** 9])
+        self.assertFalse(Order.objects.exists())
+
+    def test_age_required(self):
+        items = [{"dish_id": self.borsch.pk}, {"dish_id": self.beer.pk, "quantity": 2}]
+        del self.client.cookies["AGE_VERIFIED_21"]
+        self.assertRedirects(self.post({"items": items}), reverse("age_gate"), fetch_redirect_response=False)
+        # вьюха проверяет 21+ сама, не полагаясь на AgeGate21Middleware;
+        # цепочку middleware клиент собирает один раз — нужен новый
+        with modify_settings(MIDDLEWARE={"remove": "menuapp.middleware.AgeGate21Middleware"}):
+            self.client = self.client_class()
+            self.client.force_login(self.guest)
+            response = self.post({"items": items})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {"ok": False, "error": "age_required", "dish_ids": [self.beer.pk]})
+        self.assertFalse(Order.objects.exists())
+
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+        response = self.post({"items": items})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total_quantity"], 3)
+
+    def test_finalize_must_be_boolean(self):
+        items = [{"dish_id": self.borsch.pk, "quantity": 1}]
+        for finalize in ("false", 0, 1, None, "true"):
+            response = self.post({"items": items, "finalize": finalize})
+            self.assertEqual(response.status_code, 400, finalize)
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual(self.post({"items": items, "finalize": False}).json()["status"], Order.STATUS_NEW)
+        self.assertEqual(self.post({"items": items, "finalize": True}).json()["status"], Order.STATUS_KITCHEN)
+
+
+class EventBusTests(TestCase):
+    def test_deliver_and_replay_after_id(self):
+        async def scenario():
+            sub, missed = events.subscribe()
+            try:
+                self.assertEqual(missed, [])
+                first = events._publish_now(events.ORDER_CREATED, {"order_id": 1})
+                second = events._publish_now(events.ORDER_UPDATED, {"order_id": 1})
+                self.assertEqual([await sub.get(1), await sub.get(1)], [first, second])
+                self.assertIsNone(await sub.get(0.01))
+            finally:
+                events.unsubscribe(sub)
+
+            # экран переподключился с Last-Event-ID = first: догоняет только second
+            again, missed = events.subscribe(first["id"])
+            events.unsubscribe(again)
+            self.assertEqual(missed, [second])
+
+        asyncio.run(scenario())
+
+    def test_backlog_and_queue_are_bounded(self):
+        async def scenario():
+            sub, _missed = events.subscribe()
+            try:
+                sent = [events._publish_now(events.ORDER_UPDATED, {"n": n}) for n in range(3)]
+                await asyncio.sleep(0)  # доставка идёт через call_soon_threadsafe
+                # медленный экран: самое старое выброшено из очереди
+                self.assertEqual([await sub.get(1), await sub.get(1)], sent[1:])
+            finally:
+                events.unsubscribe(sub)
+            _sub, missed = events.subscribe(0)
+            events.unsubscribe(_sub)
+            self.assertEqual(missed, sent[1:])  # кольцевой буфер помнит последние BACKLOG_SIZE
+
+        with mock.patch.object(events, "QUEUE_SIZE", 2), \
+                mock.patch.object(events, "_backlog", deque(maxlen=2)):
+            asyncio.run(scenario())
+
+    def test_published_only_after_commit(self):
+        with mock.patch.object(events, "_publish_now") as publish_now, \
+                self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    events.publish(events.ORDER_FINALIZED, {"order_id": 1})
+                    raise RuntimeError("откат")
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                events.publish(events.ORDER_FINALIZED, {"order_id": 2})
+            publish_now.assert_not_called()  # до коммита внешней транзакции — ничего
+        publish_now.assert_called_once_with(events.ORDER_FINALIZED, {"order_id": 2})
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+        jobs.handler("test.fail")(cls._fail)
+
+    @classmethod
+    def tearDownClass(cls):
+        jobs.HANDLERS.pop("test.fail", None)
+        super().tearDownClass()
+        shutil.rmtree(cls.media, ignore_errors=True)
+
+    @staticmethod
+    def _fail(payload):
+        raise RuntimeError("boom")
+
+    def setUp(self):
+        self.category = Category.objects.create(name_ru="Супы", slug="soups")
+
+    @staticmethod
+    def _upload(name="borsch.png") -> SimpleUploadedFile:
+        from PIL import Image
+
+        buf = io.BytesIO()
+        Image.new("RGB", (400, 300), "red").save(buf, "PNG")
+        return SimpleUploadedFile(name, buf.getvalue(), content_type="image/png")
+
+    def test_save_enqueues_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dish = Dish.objects.create(category=self.category, name_ru="Борщ", base_price=1, image=self._upload())
+        with self.captureOnCommitCallbacks(execute=True):
+            dish.position = 5
+            dish.save()  # файл тот же — вторая задача не нужна
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_images(dish)  # та же задача уже ждёт
+        self.assertEqual(Job.objects.filter(key=jobs.image_key(Dish, dish.pk)).count(), 1)
+        self.assertEqual(Dish.objects.get(pk=dish.pk).image_variants, {})
+
+    def test_worker_builds_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dish = Dish.objects.create(category=self.category, name_ru="Борщ", base_price=1, image=self._upload())
+        self.assertEqual(jobs.work("test", once=True), 1)
+
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_DONE, 1))
+        dish.refresh_from_db()
+        self.assertEqual(dish.image_variants["image"]["src"], dish.image.name)
+        self.assertIn("jpeg", dish.image_variants["image"]["formats"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dish.save()  # манифест актуален — в очереди пусто
+        self.assertFalse(Job.objects.filter(status=Job.STATUS_QUEUED).exists())
+
+    def test_retry_then_fail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue("test.fail", key="fail")
+        Job.objects.update(max_attempts=2)
+
+        with self.assertLogs("menuapp.jobs", "ERROR"):
+            self.assertFalse(jobs.run(jobs.claim("test")))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertIn("boom", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(jobs.claim("test"))  # пауза перед повтором
+
+        Job.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs("menuapp.jobs", "ERROR"):
+            jobs.run(jobs.claim("test"))
+        self.assertEqual(Job.objects.get().status, Job.STATUS_FAILED)
+
+
+class StaticStorageTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = StaticStorage(location=self.root, base_url="/static/")
+
+    def test_post_process(self):
+        self.storage.save("img/bg.png", ContentFile(b"png" * 100))
+        self.storage.save("css/site.css", ContentFile(
+            b"body{background:url('../img/bg.png')}\n"
+            b"@font-face{src:url('../fonts/missing.ttf')}\n" * 20
+        ))
+        paths = {name: (self.storage, name) for name in ("img/bg.png", "css/site.css")}
+        with self.assertLogs("menuapp.storage", "WARNING"):
+            results = list(self.storage.post_process(paths))
+        self.assertFalse([r for r in results if isinstance(r[2], Exception)], results)
+
+        hashed = self.storage.stored_name("css/site.css")
+        self.assertRegex(hashed, r"^css/site\.[0-9a-f]{12}\.css$")
+        self.assertTrue(self.storage.exists(hashed + ".gz"))
+        css = self.storage.open(hashed).read().decode()
+        self.assertIn(self.storage.stored_name("img/bg.png").split("/")[-1], css)
+        self.assertIn("../fonts/missing.ttf", css)  # битая ссылка не роняет collectstatic
+
+    def test_missing_file_url(self):
+        # не собранная статика / нет файла: путь без хэша, а не 500 в {% static %}
+        self.assertEqual(self.storage.url("img/passport-page.png"), "/static/img/passport-page.png")
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.bar = Category.objects.create(name_ru="Бар", slug="bar", is_21plus=True)
+        cls.dish = Dish.objects.create(category=cls.category, name_ru="Борщ", slug="borsch", base_price=100)
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+        pagecache.clear()
+
+    def get(self, client, name="home", *args):
+        return client.get(reverse(name, args=args))
+
+    def test_hit_skips_view(self):
+        self.assertEqual(self.get(self.client, "dish_detail", "borsch")["X-Page-Cache"], "miss")
+        # попадание отдаёт middleware: вьюха (и снимок меню) не вызываются, SQL нет
+        with mock.patch("menuapp.views.get_menu", side_effect=AssertionError("view called")) as get_menu, \
+                self.assertNumQueries(0):
+            response = self.get(self.client, "dish_detail", "borsch")
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        get_menu.assert_not_called()
+
+    def test_all_menu_pages_cached(self):
+        for name, args in (("home", ()), ("categories", ()), ("category_detail", ("soups",)),
+                           ("dish_detail", ("borsch",))):
+            self.assertEqual(self.get(self.client, name, *args)["X-Page-Cache"], "miss", name)
+            self.assertEqual(self.get(self.client, name, *args)["X-Page-Cache"], "hit", name)
+
+    def test_key_parts(self):
+        self.get(self.client)
+        self.assertEqual(self.get(self.client)["X-Page-Cache"], "hit")
+        # язык — префикс пути
+        self.assertEqual(self.client.get("/en/")["X-Page-Cache"], "miss")
+        # кука возраста
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+        self.assertEqual(self.get(self.client)["X-Page-Cache"], "miss")
+        # версия меню
+        Dish.objects.filter(pk=self.dish.pk).update(base_price=120)
+        response = self.get(self.client, "dish_detail", "borsch")
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        self.assertContains(response, "120")
+
+    def test_shared_with_logged_in(self):
+        self.get(Client())
+        guest = User.objects.create_user("guest", password="x")
+        self.client.force_login(guest)
+        with self.assertNumQueries(0):
+            response = self.get(self.client)
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertNotIn("Cookie", response.get("Vary", ""))
+
+    def test_age_dependent_page_varies_on_cookie(self):
+        self.client.cookies["AGE_VERIFIED_21"] = "1"
+        response = self.get(self.client, "category_detail", "bar")
+        self.assertIn("Cookie", response["Vary"])
+        self.assertIn("Cookie", self.get(self.client, "category_detail", "bar")["Vary"])  # и из кэша
+
+    def test_messages_via_fragments(self):
+        # flash-сообщение (редирект с 21+ категории без куки) не попадает в общую страницу
+        self.assertRedirects(
+            self.get(self.client, "category_detail", "bar"), reverse("age_gate"), fetch_redirect_response=False
+        )
+        self.assertNotContains(self.get(self.client), "Подтвердите возраст")
+        data = self.get(self.client, "fragments").json()
+        self.assertEqual([m["text"] for m in data["messages"]], ["Контент 21+. Подтвердите возраст."])
+        self.assertEqual(self.get(self.client, "fragments").json()["messages"], [])
+
+    def test_fragments_cart(self):
+        guest = User.objects.create_user("guest", password="x")
+        orders.add_lines(guest.pk, [orders.CartLine(self.dish.pk, 2, self.dish.base_price)])
+        self.client.force_login(guest)
+        response = self.get(self.client, "fragments")
+        self.assertIn("no-cache", response["Cache-Control"])
+        data = response.json()
+        self.assertTrue(data["authenticated"])
+        self.assertEqual(data["cart"]["quantity"], 2)
+
+    def test_csrf_from_fragments(self):
+        self.get(Client())
+        guest = Client(enforce_csrf_checks=True)
+        response = self.get(guest)
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value=""')
+        token = self.get(guest, "fragments").json()["csrf_token"]
+        confirm = guest.post(reverse("age_confirm"), {"csrfmiddlewaretoken": token})
+        self.assertEqual(confirm.status_code, 302)
+
+    @override_settings(MENU_PAGE_CACHE_BYTES=250)
+    def test_lru_bytes(self):
+        lru = pagecache.LRU()
+        page = lambda: pagecache.Page(b"x" * 100, {}, False, time.monotonic() + 60)  # noqa: E731
+        lru.set(("/a", "ru", False, 1), page())
+        lru.set(("/b", "ru", False, 1), page())
+        lru.get(("/a", "ru", False, 1))
+        lru.set(("/c", "ru", False, 1), page())
+        self.assertEqual([k[0] for k in lru.pages], ["/a", "/c"])
+        self.assertEqual(lru.size, 200)
+        lru.set(("/a", "ru", False, 2), page())  # новая версия меню вытесняет всё старое
+        self.assertEqual(list(lru.pages), [("/a", "ru", False, 2)])
+
+
+class CardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.dishes = [
+            Dish.objects.create(category=cls.category, name_ru=f"Суп {n}", slug=f"soup-{n}", base_price=100 + n, position=n)
+            for n in range(20)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        caches["fragments"].clear()
+        snapshot.clear()
+        pagecache.clear()
+
+    def render_home(self) -> tuple[int, str]:
+        """(сколько карточек отрендерено заново, HTML)."""
+        pagecache.clear()
+        fragments = caches["fragments"]
+        with mock.patch.object(fragments, "set", wraps=fragments.set) as stored:
+            response = self.client.get(reverse("home"))
+        return stored.call_count, response.content.decode()
+
+    def test_one_dish_rerenders_one_card(self):
+        rendered, _html = self.render_home()
+        self.assertEqual(rendered, 20 + 12)  # вся сетка + карусель популярных
+        self.assertEqual(self.render_home()[0], 0)
+
+        last = self.dishes[-1]  # не попадает в 12 популярных
+        last.base_price = Decimal("999.00")
+        last.save()
+        rendered, html = self.render_home()
+        self.assertEqual(rendered, 1)
+        self.assertIn("999", html)
+
+    def test_queryset_update_touches_updated_at(self):
+        self.render_home()
+        Dish.objects.filter(pk__in=[d.pk for d in self.dishes[-2:]]).update(base_price=Decimal("5.00"))
+        self.assertEqual(self.render_home()[0], 2)
+
+    def test_language_in_key(self):
+        self.render_home()
+        pagecache.clear()
+        fragments = caches["fragments"]
+        self.addCleanup(translation.deactivate)  # LocaleMiddleware оставит активным en
+        with mock.patch.object(fragments, "set", wraps=fragments.set) as stored:
+            self.client.get("/en/")
+        self.assertEqual(stored.call_count, 20 + 12)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.soups = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.borsch = Dish.objects.create(
+            category=cls.soups, slug="borsch", base_price=100,
+            name_ru="Борщ", name_en="Borscht", name_kk="Борщ",
+            description_ru="Свёкла, говядина, сметана",
+        )
+        cls.kuyrdak = Dish.objects.create(
+            category=cls.soups, slug="kuyrdak", base_price=100,
+            name_ru="Куырдак", name_en="Kuyrdak", name_kk="Қуырдақ",
+            description_ru="Жареная печень с луком",
+        )
+        cls.pelmeni = Dish.objects.create(
+            category=cls.soups, slug="pelmeni", base_price=100,
+            name_ru="Пельмени", name_en="Dumplings", name_kk="Тұшпара",
+            description_ru="С говядиной и сметаной",
+        )
+        cls.brulee = Dish.objects.create(
+            category=cls.soups, slug="brulee", base_price=100,
+            name_ru="Крем-брюле", name_en="Crème brûlée",
+        )
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+        search.clear()
+
+    def slugs(self, q: str, **params) -> list[str]:
+        response = self.client.get(reverse("api_search"), {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [d["slug"] for d in response.json()]
+
+    def test_normalize(self):
+        self.assertEqual(search.words("Қуырдақ, Crème-брюле Ёлка!"), ["куырдак", "creme", "брюле", "елка"])
+
+    def test_exact_prefix_and_typo(self):
+        self.assertEqual(self.slugs("борщ"), ["borsch"])
+        self.assertEqual(self.slugs("пельм"), ["pelmeni"])
+        self.assertEqual(self.slugs("борш"), ["borsch"])
+        self.assertEqual(self.slugs("пелмени"), ["pelmeni"])
+
+    def test_all_languages(self):
+        self.assertEqual(self.slugs("тұшпара"), ["pelmeni"])
+        self.assertEqual(self.slugs("тушпара"), ["pelmeni"])
+        self.assertEqual(self.slugs("қуырдақ"), ["kuyrdak"])
+        self.assertEqual(self.slugs("dumpl"), ["pelmeni"])
+        self.assertEqual(self.slugs("creme brulee"), ["brulee"])
+
+    def test_name_ranks_above_description(self):
+        # «сметана» только в описаниях: у борща — точным словом, у пельменей — «сметаной»
+        self.assertEqual(self.slugs("сметана"), ["borsch", "pelmeni"])
+        self.assertEqual(self.slugs("борщ сметана"), ["borsch"])
+        self.assertEqual(self.slugs(""), [])
+
+    def test_query_is_capped(self):
+        # девятое слово и всё дальше сотого символа не читаются
+        self.assertEqual(self.slugs("б бо бор борщ с св све свек zzzz"), ["borsch"])
+        self.assertEqual(self.slugs("борщ" + " " * search.MAX_QUERY_LENGTH + "zzzz"), ["borsch"])
+
+    def test_stale_index_while_rebuilding(self):
+        self.assertEqual(self.slugs("борщ"), ["borsch"])
+        self.pelmeni.name_ru = "Манты"
+        self.pelmeni.save()
+        # индекс новой версии строит другой поток: ищем по прежнему, без SQL и без ожидания
+        with search._lock:
+            with self.assertNumQueries(0):
+                self.assertEqual(search.search("пельмени"), [self.pelmeni.pk])
+        self.assertEqual(search.search("манты"), [self.pelmeni.pk])
+
+    def test_limit_and_localized_response(self):
+        self.assertEqual(len(self.slugs("говядина", limit=1)), 1)
+        response = self.client.get(reverse("api_search"), {"q": "borscht", "lang": "en"})
+        self.assertEqual(response.json()[0]["name"], "Borscht")
+
+    def test_unavailable_hidden_and_index_follows_menu(self):
+        self.assertEqual(self.slugs("борщ"), ["borsch"])
+        Dish.objects.filter(pk=self.borsch.pk).update(is_available=False)
+        self.assertEqual(self.slugs("борщ"), [])
+        self.pelmeni.name_ru = "Манты"
+        self.pelmeni.save()
+        self.assertEqual(self.slugs("манты"), ["pelmeni"])
+
+
+class ApiConditionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        soups = Category.objects.create(name_ru="Супы", name_en="Soups", slug="soups")
+        cls.borsch = Dish.objects.create(
+            category=soups, slug="borsch", base_price=100, name_ru="Борщ", name_en="Borscht",
+        )
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+
+    def get(self, etag: str = "", **headers):
+        if etag:
+            headers["HTTP_IF_NONE_MATCH"] = etag
+        return self.client.get(reverse("api_dish", args=["borsch"]), **headers)
+
+    def test_not_modified_until_version_bump(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("Accept-Language", first["Vary"])
+        self.assertEqual(self.get(first["ETag"]).status_code, 304)
+
+        Dish.objects.filter(pk=self.borsch.pk).update(base_price=120)
+        response = self.get(first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["base_price"], "120.00")
+
+    def test_language_change_without_param(self):
+        ru = self.get(HTTP_ACCEPT_LANGUAGE="ru")
+        self.assertEqual(ru.json()["name"], "Борщ")
+        en = self.get(ru["ETag"], HTTP_ACCEPT_LANGUAGE="en")
+        self.assertEqual(en.status_code, 200)
+        self.assertEqual(en.json()["name"], "Borscht")
+
+        self.client.cookies["django_language"] = "ru"
+        self.assertEqual(self.get(en["ETag"], HTTP_ACCEPT_LANGUAGE="en").status_code, 200)
+        self.assertEqual(self.get(ru["ETag"], HTTP_ACCEPT_LANGUAGE="en").status_code, 304)
+
+    def test_modified_since_alone_is_not_enough(self):
+        first = self.get(HTTP_ACCEPT_LANGUAGE="ru")
+        response = self.get(HTTP_ACCEPT_LANGUAGE="en", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+
+
+class PrerenderTests(TestCase):
+    # на язык: главная и /categories/ (гость + 21+), две категории, два блюда
+    PAGES = (4 + 2 + 2) * 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.soups = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.bar = Category.objects.create(name_ru="Бар", slug="bar", is_21plus=True)
+        cls.borsch = Dish.objects.create(category=cls.soups, name_ru="Борщ", slug="borsch", base_price=100)
+        cls.beer = Dish.objects.create(category=cls.bar, name_ru="Пиво", slug="beer", base_price=50)
+
+    def setUp(self):
+        cache.clear()
+        snapshot.clear()
+        self.out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.out, ignore_errors=True)
+
+    def build(self, **kwargs) -> prerender.Result:
+        return prerender.build(self.out, require_hashed=False, **kwargs)
+
+    def exists(self, path: str) -> bool:
+        return (prerender.Path(self.out) / path).exists()
+
+    def test_layout(self):
+        result = self.build()
+        self.assertEqual(len(result.rendered), self.PAGES)
+        for path in (
+            "guest/index.html", "verified/index.html", "verified/kk/index.html",
+            "public/categories/soups/index.html", "public/en/dishes/borsch/index.html",
+            "verified/categories/bar/index.html", "verified/en/dishes/beer/index.html",
+            "public/categories/soups/index.html.gz",
+        ):
+            self.assertTrue(self.exists(path), path)
+        # 21+ без подтверждения возраста — только через Django (редирект на /age/)
+        self.assertFalse(self.exists("guest/categories/bar/index.html"))
+        self.assertFalse(self.exists("public/dishes/beer/index.html"))
+
+        html = (prerender.Path(self.out) / "public/en/dishes/borsch/index.html").read_text()
+        self.assertIn('lang="en"', html)
+        self.assertNotRegex(html, r'name="csrfmiddlewaretoken" value="[^"]')
+        self.assertEqual(len(prerender.load_manifest(prerender.Path(self.out))["pages"]), self.PAGES)
+
+    def test_incremental(self):
+        self.build()
+        again = self.build()
+        self.assertEqual((again.rendered, again.skipped), ([], self.PAGES))
+
+        self.borsch.base_price = Decimal("777.00")
+        self.borsch.save()
+        rendered = set(self.build().rendered)
+        self.assertIn("public/dishes/borsch/index.html", rendered)
+        self.assertIn("public/kk/categories/soups/index.html", rendered)
+        self.assertIn("guest/en/index.html", rendered)
+        self.assertNotIn("verified/categories/bar/index.html", rendered)
+        self.assertNotIn("verified/dishes/beer/index.html", rendered)
+        self.assertEqual(len(rendered), 3 * (1 + 1 + 4))  # блюдо, его категория, главные
+
+        self.assertEqual(len(self.build(force=True).rendered), 0)  # HTML тот же — файлы не трогаем
+
+    def test_removed_pages(self):
+        self.build()
+        self.beer.delete()
+        result = self.build()
+        self.assertEqual(len(result.removed), 3)
+        self.assertFalse(self.exists("verified/dishes/beer/index.html"))
+        self.assertFalse(self.exists("verified/dishes/beer/index.html.gz"))
+
+    def test_failed_render_keeps_previous_page(self):
+        self.build()
+        path = "public/dishes/borsch/index.html"
+        before = (prerender.Path(self.out) / path).read_text()
+        self.borsch.base_price = Decimal("777.00")
+        self.borsch.save()
+
+        get = Client.get
+
+        def flaky_get(client, url, *args, **kwargs):
+            if url == "/dishes/borsch/":
+                return HttpResponseServerError()
+            return get(client, url, *args, **kwargs)
+
+        with mock.patch.object(Client, "get", flaky_get):
+            result = self.build()
+        self.assertEqual(result.removed, [])
+        self.assertNotIn(path, result.rendered)
+        self.assertEqual((prerender.Path(self.out) / path).read_text(), before)
+        self.assertIn(path, prerender.load_manifest(prerender.Path(self.out))["pages"])
+        self.assertIn(path, self.build().rendered)  # прежние deps — перерисуем при следующей сборке
+
+    def test_requires_collectstatic(self):
+        with mock.patch.object(prerender, "static_manifest", return_value=None):
+            with self.assertRaises(ImproperlyConfigured):
+                prerender.build(self.out)
+
+    def test_worker_follows_menu(self):
+        with override_settings(MENU_PRERENDER_DIR=self.out, MENU_JOBS_EAGER=True), \
+                mock.patch.object(prerender, "static_manifest", return_value="{}"):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.borsch.name_ru = "Борщ украинский"
+                self.borsch.save()
+        self.assertIn("украинский", (prerender.Path(self.out) / "public/dishes/borsch/index.html").read_text())
+
+
+class LoadtestTests(TestCase):
+    def test_percentile_nearest_rank(self):
+        p = loadtest._percentile
+        hundred = [float(i) for i in range(1, 101)]
+        self.assertEqual((p(hundred, 50), p(hundred, 95), p(hundred, 99), p(hundred, 100)), (50, 95, 99, 100))
+        self.assertEqual(p([float(i) for i in range(1, 21)], 95), 19)
+        self.assertEqual(p([float(i) for i in range(1, 7)], 50), 3)
+        self.assertEqual(p([5.0], 99), 5)
+        self.assertEqual(p([], 99), 0)
+
+    def test_sessions_do_not_pile_up(self):
+        other = User.objects.create_user("regular")
+        self.client.force_login(other)
+        call_command("loadtest", seed=True, duration=0, guests=3, categories=1, dishes=1, stdout=io.StringIO())
+        self.assertEqual(Session.objects.count(), 1)  # сессии прогона удалены, чужая на месте
+
+        # прерванный прогон: сессии остались — их убирает --cleanup
+        for user in User.objects.filter(username__startswith="lt-"):
+            loadtest._session_cookie(user)
+        call_command("loadtest", cleanup=True, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), [self.client.session.session_key])
+        self.assertFalse(User.objects.filter(username__startswith="lt-").exists())
+
+
+class MetricsAccessTests(TestCase):
+    def get(self, token: str = ""):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return self.client.get(reverse("metrics"), **headers)
+
+    @override_settings(MENU_METRICS_TOKEN="", DEBUG=False)
+    def test_closed_without_token_in_production(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get("anything").status_code, 403)
+
+    @override_settings(MENU_METRICS_TOKEN="", DEBUG=True)
+    def test_open_without_token_in_debug(self):
+        self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(MENU_METRICS_TOKEN="scrape", DEBUG=True)
+    def test_token_required_when_set(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get("wrong").status_code, 403)
+        response = self.get("scrape")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("menu_orders_open", response.content.decode())
+
+
+class KitchenFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user("chef", password="x", is_staff=True)
+        soups = Category.objects.create(name_ru="Супы", slug="soups")
+        cls.borsch = Dish.objects.create(category=soups, slug="borsch", base_price=100, name_ru="Борщ")
+
+    def setUp(self):
+        self.client.force_login(self.chef)
+        self.cursor_at = timezone.now() - timedelta(minutes=1)
+
+    def order(self, name: str, status: str, touched: timedelta) -> Order:
+        user = User.objects.create_user(name)
+        result = orders.add_lines(user.pk, [orders.CartLine(self.borsch.pk, 1, self.borsch.base_price)])
+        Order.objects.filter(pk=result.order_id).update(status=status, updated_at=self.cursor_at + touched)
+        return Order.objects.get(pk=result.order_id)
+
+    def feed(self, since=None) -> dict:
+        params = {} if since is None else {"since": since}
+        response = self.client.get(reverse("kitchen_feed"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, data: dict) -> list[int]:
+        return [o["order_id"] for o in data["orders"]]
+
+    def test_since_cursor(self):
+        stale = self.order("stale", Order.STATUS_KITCHEN, -timedelta(minutes=10))
+        border = self.order("border", Order.STATUS_KITCHEN, -views.FEED_OVERLAP / 2)
+        done = self.order("done", Order.STATUS_READY, timedelta(seconds=5))
+        cart = self.order("cart", Order.STATUS_NEW, -timedelta(minutes=10))
+        # позиции поменялись после курсора — заказ снова в ленте, с новым количеством
+        orders.add_lines(cart.user_id, [orders.CartLine(self.borsch.pk, 2, self.borsch.base_price)])
+
+        data = self.feed(views._make_cursor(self.cursor_at))
+        self.assertFalse(data["full"])
+        self.assertNotIn(stale.pk, self.ids(data))
+        self.assertEqual(sorted(self.ids(data)), sorted([border.pk, done.pk, cart.pk]))
+        changed = next(o for o in data["orders"] if o["order_id"] == cart.pk)
+        self.assertEqual(changed["items"], [{"dish_id": self.borsch.pk, "dish": "Борщ", "quantity": 3}])
+        self.assertEqual(next(o for o in data["orders"] if o["order_id"] == done.pk)["status"], "ready")
+
+        # следующий опрос с выданным курсором: только то, что попадает в запас FEED_OVERLAP
+        # (корзину тронули только что) — клиент просто заменит карточку ещё раз
+        self.assertEqual(self.ids(self.feed(data["cursor"])), [cart.pk])
+
+    def test_bad_cursor_falls_back_to_full_list(self):
+        stale = self.order("stale", Order.STATUS_KITCHEN, -timedelta(minutes=10))
+        done = self.order("done", Order.STATUS_READY, timedelta(seconds=5))
+        for since in ("abc", "", "9" * 40):
+            data = self.feed(since)
+            self.assertTrue(data["full"], since)
+            self.assertEqual(self.ids(data), [stale.pk])  # только открытые заказы
+        self.assertNotIn(done.pk, self.ids(self.feed()))
+
+
+class OrderTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user("chef", password="x", is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.chef)
+
+    def order(self, status: str = Order.STATUS_NEW) -> Order:
+        user = User.objects.create_user(f"guest-{time.monotonic_ns()}")
+        return Order.objects.create(user=user, status=status)
+
+    def post(self, name: str, *args, **data):
+        return self.client.post(reverse(name, args=args), data, **JSON)
+
+    def test_accept_then_ready(self):
+        order = self.order()
+        response = self.post("mark_accept", order.pk)
+        self.assertEqual(response.json(), {"ok": True, "order_id": order.pk, "status": Order.STATUS_KITCHEN})
+        order.refresh_from_db()
+        self.assertIsNotNone(order.kitchen_at)
+        self.assertIsNone(order.ready_at)
+
+        self.assertEqual(self.post("mark_ready", order.pk).status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_READY)
+        self.assertGreaterEqual(order.ready_at, order.kitchen_at)
+
+    def test_stale_screen_cannot_revert(self):
+        order = self.order(Order.STATUS_READY)
+        for name in ("mark_accept", "mark_ready"):
+            response = self.post(name, order.pk)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()["status"], Order.STATUS_READY)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_READY)
+        self.assertIsNone(order.kitchen_at)
+        self.assertEqual(self.post("mark_ready", 10 ** 9).status_code, 404)
+
+    def test_transition_applies_once(self):
+        order = self.order()
+        self.assertEqual([m.order_id for m in orders.transition(orders.SEND, [order.pk])], [order.pk])
+        self.assertEqual(orders.transition(orders.SEND, [order.pk]), [])
+        self.assertEqual(orders.transition(orders.ACCEPT, [order.pk]), [])
+
+    def test_stage_metrics(self):
+        order = self.order(Order.STATUS_KITCHEN)
+        Order.objects.filter(pk=order.pk).update(kitchen_at=timezone.now() - timedelta(minutes=5))
+        with mock.patch("menuapp.metrics.order_transition") as observed:
+            orders.transition(orders.READY, [order.pk])
+        (source, target, stage, started), _kwargs = observed.call_args
+        self.assertEqual((source, target, stage), (Order.STATUS_KITCHEN, Order.STATUS_READY, "cooking"))
+        self.assertAlmostEqual((timezone.now() - started).total_seconds(), 300, delta=5)
+
+    def test_bulk_accept_all_new(self):
+        new = [self.order() for _ in range(3)]
+        cooking = self.order(Order.STATUS_KITCHEN)
+        response = self.post("kitchen_bulk", action="accept", all="1")
+        self.assertEqual(response.json()["order_ids"], sorted(o.pk for o in new))
+        self.assertEqual(Order.objects.filter(status=Order.STATUS_KITCHEN, kitchen_at__isnull=False).count(), 3)
+        cooking.refresh_from_db()
+        self.assertIsNone(cooking.kitchen_at)  # уже был на кухне — не трогаем
+
+    def test_bulk_ready_selected(self):
+        picked = [self.order(Order.STATUS_KITCHEN) for _ in range(2)]
+        other = self.order(Order.STATUS_KITCHEN)
+        still_new = self.order()
+        ids = [o.pk for o in picked] + [still_new.pk]
+        response = self.post("kitchen_bulk", action="ready", order_id=ids)
+        self.assertEqual(response.json()["order_ids"], [o.pk for o in picked])
+        self.assertEqual(
+            dict(Order.objects.values_list("pk", "status")),
+            {picked[0].pk: "ready", picked[1].pk: "ready", other.pk: "kitchen", still_new.pk: "new"},
+        )
+        # без order_id и all=1 пакет не применяется ни к чему
+        self.assertEqual(self.post("kitchen_bulk", action="ready").status_code, 400)
+        self.assertEqual(self.post("kitchen_bulk", action="cancel", all="1").status_code, 400)
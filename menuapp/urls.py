@@ -8,19 +8,27 @@ urlpatterns = [
     path("categories/", views.home, name="categories"),  # список категорий
     path("categories/<slug:slug>/", views.category_detail, name="category_detail"),  # одна категория
     path("dishes/<slug:slug>/", views.dish_detail, name="dish_detail"),  # одно блюдо
+    path("fragments/", views.fragments, name="fragments"),  # корзина/вход/сообщения для оболочки (JSON)
 
     # === аккаунты ===
     path("signup/", views.signup, name="signup"),
 
     # === заказы ===
     path("order/add/<int:dish_id>/", views.add_to_order, name="add_to_order"),
+    path("order/add/batch/", views.add_to_order_batch, name="add_to_order_batch"),
     path("order/", views.view_order, name="view_order"),
     path("order/finalize/", views.finalize_order, name="finalize_order"),
 
     # === кухня ===
     path("kitchen/", views.kitchen_orders, name="kitchen_orders"),
+    path("kitchen/events/", views.kitchen_events, name="kitchen_events"),  # SSE
+    path("kitchen/feed/", views.kitchen_feed, name="kitchen_feed"),  # дельты по курсору
     path("kitchen/accept/<int:order_id>/", views.mark_accept, name="mark_accept"),
     path("kitchen/ready/<int:order_id>/", views.mark_ready, name="mark_ready"),
+    path("kitchen/bulk/", views.kitchen_bulk, name="kitchen_bulk"),  # принять все / готовы выбранные
+
+    # === профилирование (staff) ===
+    path("debug/slow/", views.slow_requests, name="slow_requests"),
 
     # === возрастной фильтр ===
     path("age/", views.age_gate, name="age_gate"),
@@ -1,27 +1,41 @@
 # menuapp/views.py
 from __future__ import annotations
 
+import hmac
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.messages import get_messages
 from django.db import transaction
-from django.db.models import Prefetch, Count  # ← добавили Count
+from django.db.models import Prefetch
 from django.http import (
     HttpRequest,
     HttpResponse,
     HttpResponseBadRequest,
     HttpResponseForbidden,
+    Http404,
     JsonResponse,
+    StreamingHttpResponse,
 )
-from django.shortcuts import get_object_or_404, redirect, render
+from django.shortcuts import redirect, render
+from django.middleware.csrf import get_token
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.translation import get_language, gettext as _
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 
-from .models import Category, Dish, Order, OrderItem
+from . import events, metrics, orders, popularity, profiling
+from .cart import get_cart_summary, invalidate_cart
+from .models import DEFAULT_LANG, Order, OrderItem
+from .snapshot import get_menu
 
 AGE_COOKIE = "AGE_VERIFIED_21"
 
@@ -35,54 +49,100 @@ def _lang_code() -> str:
     return (get_language() or "ru").split("-")[0].lower()
 
 
+def _render_shell(request: HttpRequest, template: str, context: dict, *, by_age: bool = False) -> HttpResponse:
+    """
+    Страница меню как «оболочка»: в ней нет ничего пользовательского —
+    корзину, вход, flash-сообщения и CSRF-токен JS подгружает из fragments.
+    Поэтому её можно отдать из общего кэша любому гостю, в т.ч. залогиненному.
+    Язык — в пути; от куки возраста зависят только страницы 21+ (by_age).
+    """
+    response = render(request, template, {**context, "shell": True})
+    patch_cache_control(response, public=True, max_age=settings.MENU_SHELL_MAX_AGE)
+    if by_age:
+        patch_vary_headers(response, ["Cookie"])
+    return response
+
+
 def _wants_json(request: HttpRequest) -> bool:
     ct = request.headers.get("x-requested-with") == "XMLHttpRequest"
     acc = request.headers.get("accept", "")
     return ct or "application/json" in acc
 
 
-def _get_or_create_open_order(request: HttpRequest) -> Order:
-    order, _ = Order.objects.get_or_create(
-        user=request.user,
-        status=Order.STATUS_NEW,
+def _send_to_kitchen(order: Order) -> None:
+    """NEW → KITCHEN: статус и продажи дня (orders.transition), событие для кухни, сводка корзины."""
+    with transaction.atomic():
+        sent = orders.transition(orders.SEND, [order.pk])
+        order.status = Order.STATUS_KITCHEN
+        if not sent:
+            return  # второй клик или кухня приняла раньше: заказ уже на кухне
+        events.publish(events.ORDER_FINALIZED, events.order_payload(order))
+        invalidate_cart(order.user_id)
+
+
+def _publish_transitions(moved: list[orders.Moved], status: str, event_type: str) -> None:
+    """Событие для экранов кухни и сброс сводки корзины по каждому сдвинутому заказу."""
+    for m in moved:
+        events.publish(event_type, events.order_payload(Order(pk=m.order_id, status=status), with_items=False))
+        invalidate_cart(m.user_id)
+
+
+def _after_cart_change(request: HttpRequest, result: orders.CartResult) -> None:
+    """
+    Уведомить кухню и сбросить сводку корзины после записи в корзину.
+    В событии — только записанные позиции (из result), имена из снимка меню:
+    перечитывать заказ ради кухни — лишний запрос на каждое нажатие.
+    """
+    order = Order(pk=result.order_id, user=request.user, status=Order.STATUS_NEW)
+    dishes = get_menu(DEFAULT_LANG).dishes_by_id
+    events.publish(
+        events.ORDER_CREATED if result.order_created else events.ORDER_UPDATED,
+        events.cart_payload(
+            order,
+            {pk: quantity for pk, (_item_id, quantity) in result.items.items()},
+            {pk: dishes[pk].name for pk in result.items if pk in dishes},
+        ),
     )
-    return order
+    invalidate_cart(request.user.pk)
 
 
 # ========================= pages =========================
-def home(request: HttpRequest) -> HttpResponse:
+def _popular_dishes(menu, limit: int = 12) -> list:
     """
-    Главная: список категорий + «популярные» блюда.
+    Популярные за окно MENU_POPULAR_DAYS; остаток добиваем доступными
+    блюдами по позиции (как раньше делал Count с нулями).
     """
-    # Категории с доступными блюдами
-    categories = (
-        Category.objects.all()
-        .order_by("nav_position", "position", "id")
-        .prefetch_related(
-            Prefetch(
-                "dishes",
-                queryset=Dish.objects.filter(is_available=True).order_by("position", "id"),
-            )
-        )
-    )
+    popular = []
+    for pk in popularity.ranked_dish_ids():
+        d = menu.dishes_by_id.get(pk)
+        if d is not None and d.is_available:
+            popular.append(d)
+            if len(popular) == limit:
+                return popular
+
+    seen = {d.id for d in popular}
+    for d in menu.available_dishes():
+        if len(popular) == limit:
+            break
+        if d.id not in seen:
+            popular.append(d)
+    return popular
 
-    # Популярные по числу заказов; если пусто — просто доступные по позиции
-    popular = (
-        Dish.objects.filter(is_available=True)
-        .annotate(times=Count("orderitem"))      # OrderItem через related_name по умолчанию
-        .order_by("-times", "position", "id")[:12]
-    )
-    if not popular:
-        popular = Dish.objects.filter(is_available=True).order_by("position", "id")[:12]
 
-    locked = categories.filter(is_21plus=True).exists() and not _age_verified(request)
+def home(request: HttpRequest) -> HttpResponse:
+    """
+    Главная: список категорий + «популярные» блюда.
+    Всё берётся из снимка меню — в установившемся режиме без запросов к БД.
+    """
+    menu = get_menu()
+    locked = menu.has_21plus and not _age_verified(request)
 
-    return render(
+    return _render_shell(
         request,
         "menuapp/home.html",
         {
-            "categories": categories,
-            "popular_dishes": popular,   # ← вот и контент для карусели
+            "categories": menu.categories,
+            "popular_dishes": _popular_dishes(menu),   # ← вот и контент для карусели
             "background_url": None,
             "lang_code": _lang_code(),
             "age_locked": locked,
@@ -91,56 +151,65 @@ def home(request: HttpRequest) -> HttpResponse:
 
 
 def category_detail(request: HttpRequest, slug: str) -> HttpResponse:
-    category = get_object_or_404(
-        Category.objects.prefetch_related(
-            Prefetch(
-                "dishes",
-                queryset=Dish.objects.filter(is_available=True).order_by("position", "id"),
-            )
-        ),
-        slug=slug,
-    )
+    category = get_menu().category(slug)
+    if category is None:
+        raise Http404
 
     if category.is_21plus and not _age_verified(request):
         messages.warning(request, _("Контент 21+. Подтвердите возраст."))
         return redirect("age_gate")
 
-    try:
-        bg = category.cover_image_url()
-    except Exception:
-        bg = None
-
-    return render(
+    return _render_shell(
         request,
         "menuapp/category.html",
         {
             "category": category,
-            "background_url": bg,
+            "background_url": category.cover_url,
             "lang_code": _lang_code(),
         },
+        by_age=category.is_21plus,
     )
 
 
 def dish_detail(request: HttpRequest, slug: str) -> HttpResponse:
-    dish = get_object_or_404(Dish.objects.select_related("category"), slug=slug)
+    dish = get_menu().dish(slug)
+    if dish is None:
+        raise Http404
 
     if dish.requires_21 and not _age_verified(request):
         messages.warning(request, _("Контент 21+. Подтвердите возраст."))
         return redirect("age_gate")
 
-    bg_url = getattr(getattr(dish, "passport_bg", None), "url", None) or dish.category.cover_image_url()
-
-    return render(
+    return _render_shell(
         request,
         "menuapp/dish.html",
         {
             "dish": dish,
-            "background_url": bg_url,
+            "background_url": dish.passport_bg_url or dish.category.cover_url,
             "lang_code": _lang_code(),
         },
+        by_age=dish.requires_21,
     )
 
 
+@never_cache
+def fragments(request: HttpRequest) -> JsonResponse:
+    """
+    Пользовательская часть страницы-оболочки (см. _render_shell): бейдж
+    корзины, состояние входа, flash-сообщения и CSRF-токен для форм.
+    Сводка корзины — из кэша, так что у залогиненного это сессия + пользователь.
+    """
+    user = request.user
+    return JsonResponse({
+        "authenticated": user.is_authenticated,
+        "username": user.get_username() if user.is_authenticated else "",
+        "is_staff": user.is_staff,
+        "cart": get_cart_summary(user),
+        "messages": [{"level": m.tags, "text": str(m)} for m in get_messages(request)],
+        "csrf_token": get_token(request),
+    })
+
+
 # ========================= auth =========================
 def signup(request: HttpRequest) -> HttpResponse:
     if request.method == "POST":
@@ -158,24 +227,24 @@ def signup(request: HttpRequest) -> HttpResponse:
 # ========================= orders =========================
 @login_required
 @require_POST
-@transaction.atomic
 def add_to_order(request: HttpRequest, dish_id: int) -> HttpResponse:
-    dish = get_object_or_404(Dish, pk=dish_id, is_available=True)
+    # блюдо, цена и правило 21+ — из снимка меню, без запроса
+    dish = get_menu().dishes_by_id.get(dish_id)
+    if dish is None or not dish.is_available:
+        raise Http404
 
     if dish.requires_21 and not _age_verified(request):
         if _wants_json(request):
             return JsonResponse({"ok": False, "error": "age_required"}, status=403)
         return HttpResponseForbidden(_("Нужно подтвердить 21+"))
 
-    order = _get_or_create_open_order(request)
-    item, created = OrderItem.objects.select_for_update().get_or_create(order=order, dish=dish)
-    if not created:
-        item.quantity += 1
-        item.save(update_fields=["quantity"])
+    result = orders.add_lines(request.user.pk, [orders.CartLine(dish.id, 1, dish.base_price)])
+    item_id, quantity = result.items[dish.id]
+    _after_cart_change(request, result)
 
     if _wants_json(request):
         return JsonResponse(
-            {"ok": True, "order_id": order.id, "item_id": item.id, "quantity": item.quantity},
+            {"ok": True, "order_id": result.order_id, "item_id": item_id, "quantity": quantity},
             status=200,
         )
 
@@ -183,10 +252,94 @@ def add_to_order(request: HttpRequest, dish_id: int) -> HttpResponse:
     return redirect("view_order")
 
 
+BATCH_MAX_LINES = 50
+BATCH_MAX_QUANTITY = 99
+
+
+def _parse_batch(request: HttpRequest) -> tuple[list[tuple[int, int]], bool] | None:
+    """
+    {"items": [{dish_id, quantity}, ...], "finalize": bool} → ([(dish_id, quantity)], finalize);
+    None, если тело кривое. Типы — строго JSON-овские, ничего не угадываем:
+    dish_id и quantity — целые числа (не 2.9, не true, не "2", не Infinity),
+    finalize — boolean (не "false" и не 0).
+    """
+    try:
+        body = json.loads(request.body or b"{}")
+        raw = body.get("items") if isinstance(body, dict) else None
+        if not isinstance(raw, list) or not 0 < len(raw) <= BATCH_MAX_LINES:
+            return None
+        lines = [(x["dish_id"], x.get("quantity", 1)) for x in raw]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    # type() is int, а не isinstance: bool — подкласс int
+    if any(type(pk) is not int or type(q) is not int for pk, q in lines):
+        return None
+    finalize = body.get("finalize", False)
+    if not isinstance(finalize, bool):
+        return None
+    if any(not 0 < q <= BATCH_MAX_QUANTITY for _, q in lines):
+        return None
+    return lines, finalize
+
+
+@login_required
+@require_POST
+def add_to_order_batch(request: HttpRequest) -> JsonResponse:
+    """
+    Пакетное добавление в корзину: {"items": [{"dish_id": 1, "quantity": 2}, ...],
+    "finalize": false}. Доступность и 21+ проверяются по снимку меню для всех
+    блюд сразу, запись — один upsert на все позиции; с finalize=true заказ
+    в той же транзакции уходит на кухню.
+    """
+    parsed = _parse_batch(request)
+    if parsed is None:
+        return JsonResponse({"ok": False, "error": "bad_request"}, status=400)
+    lines, finalize = parsed
+
+    menu = get_menu()
+    dishes = {dish_id: menu.dishes_by_id.get(dish_id) for dish_id, _q in lines}
+    unavailable = sorted(pk for pk, d in dishes.items() if d is None or not d.is_available)
+    if unavailable:
+        return JsonResponse({"ok": False, "error": "unavailable", "dish_ids": unavailable}, status=400)
+    if not _age_verified(request):
+        locked = sorted(pk for pk, d in dishes.items() if d.requires_21)
+        if locked:
+            return JsonResponse({"ok": False, "error": "age_required", "dish_ids": locked}, status=403)
+
+    cart_lines = [orders.CartLine(pk, q, dishes[pk].base_price) for pk, q in lines]
+    with transaction.atomic():
+        result = orders.add_lines(request.user.pk, cart_lines)
+        status = Order.STATUS_NEW
+        if finalize:
+            order = Order(
+                pk=result.order_id, user=request.user, status=Order.STATUS_NEW,
+                total_quantity=result.total_quantity, total_price=result.total_price,
+            )
+            _send_to_kitchen(order)
+            status = order.status
+        else:
+            _after_cart_change(request, result)
+
+    return JsonResponse({
+        "ok": True,
+        "order_id": result.order_id,
+        "status": status,
+        "items": [
+            {"dish_id": pk, "item_id": item_id, "quantity": quantity}
+            for pk, (item_id, quantity) in result.items.items()
+        ],
+        "total_quantity": result.total_quantity,
+        "total_price": str(result.total_price),
+    })
+
+
 @login_required
 def view_order(request: HttpRequest) -> HttpResponse:
     order = (
         Order.objects.filter(user=request.user, status__in=[Order.STATUS_NEW, Order.STATUS_KITCHEN])
+        .prefetch_related(
+            Prefetch("orderitem_set", queryset=OrderItem.objects.select_related("dish").order_by("id"))
+        )
         .order_by("-created_at")
         .first()
     )
@@ -207,14 +360,13 @@ def finalize_order(request: HttpRequest) -> HttpResponse:
         messages.info(request, _("Нечего оформлять"))
         return redirect("home")
 
-    if order.total_quantity() == 0:
+    if order.total_quantity == 0:
         if _wants_json(request):
             return JsonResponse({"ok": False, "error": "empty"}, status=400)
         messages.info(request, _("Корзина пуста"))
         return redirect("view_order")
 
-    order.status = Order.STATUS_KITCHEN
-    order.save(update_fields=["status"])
+    _send_to_kitchen(order)
 
     if _wants_json(request):
         return JsonResponse({"ok": True, "order_id": order.id, "status": order.status})
@@ -244,30 +396,183 @@ def kitchen_orders(request: HttpRequest) -> HttpResponse:
     return render(request, "menuapp/kitchen.html", {"orders": orders})
 
 
+FEED_OVERLAP = timedelta(seconds=2)  # запас на транзакции, закоммиченные «задним числом»
+
+
+def _parse_cursor(value: str | None):
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(int(value) / 1_000_000, tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _make_cursor(moment) -> str:
+    return str(int(moment.timestamp() * 1_000_000))
+
+
 @user_passes_test(_staff_check)
-@require_POST
-def mark_accept(request: HttpRequest, order_id: int) -> HttpResponse:
-    order = get_object_or_404(Order, pk=order_id)
-    order.status = Order.STATUS_KITCHEN
-    order.save(update_fields=["status"])
+def kitchen_feed(request: HttpRequest) -> JsonResponse:
+    """
+    Инкрементальная лента кухни: ?since=<cursor> → только заказы, у которых
+    с тех пор менялся статус или позиции (по индексу updated_at).
+    Без курсора — все открытые заказы. Ответ идемпотентен: клиент просто
+    заменяет карточки по order_id, а заказы в статусе ready убирает.
+    """
+    since = _parse_cursor(request.GET.get("since"))
+    now = timezone.now()
+
+    orders = Order.objects.select_related("user").prefetch_related(
+        Prefetch("orderitem_set", queryset=OrderItem.objects.select_related("dish").order_by("id"))
+    )
+    if since is None:
+        orders = orders.filter(status__in=[Order.STATUS_NEW, Order.STATUS_KITCHEN])
+    else:
+        orders = orders.filter(updated_at__gte=since - FEED_OVERLAP)
+
+    payload = [
+        events.order_payload(o, items=o.orderitem_set.all())
+        for o in orders.order_by("updated_at", "id")
+    ]
+    return JsonResponse({"cursor": _make_cursor(now), "full": since is None, "orders": payload})
+
+
+SSE_HEARTBEAT = 15  # сек.; комментарий-пинг, чтобы прокси не рвали простаивающий поток
+
+
+@user_passes_test(_staff_check)
+async def kitchen_events(request: HttpRequest) -> HttpResponse:
+    """
+    SSE-поток событий заказов для экранов кухни (работает под ASGI).
+    Экран один раз грузит kitchen_orders, дальше только применяет события.
+    """
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or 0) or None
+    except ValueError:
+        last_id = None
+
+    async def stream():
+        sub, missed = events.subscribe(last_id)
+        try:
+            yield "retry: 3000\n\n"
+            for event in missed:
+                yield events.format_sse(event)
+            while True:
+                event = await sub.get(SSE_HEARTBEAT)
+                yield events.format_sse(event) if event else ": ping\n\n"
+        finally:
+            events.unsubscribe(sub)
+
+    resp = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: не буферизовать поток
+    return resp
+
+
+KITCHEN_ACTIONS = {
+    "accept": (orders.ACCEPT, events.ORDER_ACCEPTED),
+    "ready": (orders.READY, events.ORDER_READY),
+}
+
+
+def _kitchen_transition(request: HttpRequest, order_id: int, action: str, done: str) -> HttpResponse:
+    t, event_type = KITCHEN_ACTIONS[action]
+    moved = orders.transition(t, [order_id])
+    if not moved:
+        status = Order.objects.filter(pk=order_id).values_list("status", flat=True).first()
+        if status is None:
+            raise Http404
+        # другой экран кухни успел раньше: ничего не меняем, показываем текущий статус
+        if _wants_json(request):
+            return JsonResponse({"ok": False, "error": "conflict", "order_id": order_id, "status": status}, status=409)
+        messages.warning(request, _("Заказ #%(id)s уже в статусе «%(status)s»") % {
+            "id": order_id, "status": dict(Order.STATUS_CHOICES)[status],
+        })
+        return redirect("kitchen_orders")
+
+    _publish_transitions(moved, t.target, event_type)
     if _wants_json(request):
-        return JsonResponse({"ok": True, "order_id": order.id, "status": order.status})
-    messages.success(request, _("Заказ принят на кухню"))
+        return JsonResponse({"ok": True, "order_id": order_id, "status": t.target})
+    messages.success(request, done)
     return redirect("kitchen_orders")
 
 
+@user_passes_test(_staff_check)
+@require_POST
+def mark_accept(request: HttpRequest, order_id: int) -> HttpResponse:
+    return _kitchen_transition(request, order_id, "accept", _("Заказ принят на кухню"))
+
+
 @user_passes_test(_staff_check)
 @require_POST
 def mark_ready(request: HttpRequest, order_id: int) -> HttpResponse:
-    order = get_object_or_404(Order, pk=order_id)
-    order.status = Order.STATUS_READY
-    order.save(update_fields=["status"])
+    return _kitchen_transition(request, order_id, "ready", _("Заказ готов"))
+
+
+@user_passes_test(_staff_check)
+@require_POST
+def kitchen_bulk(request: HttpRequest) -> HttpResponse:
+    """
+    Пакетный переход одним UPDATE: action=accept|ready и несколько order_id
+    («готовы выбранные») или all=1 — все заказы в исходном статусе
+    («принять все новые»). Заказы, уже сдвинутые другим экраном, пропускаются.
+    """
+    action = KITCHEN_ACTIONS.get(request.POST.get("action", ""))
+    select_all = request.POST.get("all") == "1"
+    try:
+        ids = [int(v) for v in request.POST.getlist("order_id")]
+    except ValueError:
+        ids = []
+    if action is None or not (ids or select_all):
+        if _wants_json(request):
+            return JsonResponse({"ok": False, "error": "bad_request"}, status=400)
+        return HttpResponseBadRequest()
+
+    t, event_type = action
+    moved = orders.transition(t, None if select_all else ids)
+    _publish_transitions(moved, t.target, event_type)
     if _wants_json(request):
-        return JsonResponse({"ok": True, "order_id": order.id, "status": order.status})
-    messages.success(request, _("Заказ готов"))
+        return JsonResponse({"ok": True, "status": t.target, "order_ids": [m.order_id for m in moved]})
+    messages.success(request, _("Заказов переведено: %(count)s") % {"count": len(moved)})
     return redirect("kitchen_orders")
 
 
+# ========================= профилирование =========================
+@user_passes_test(_staff_check)
+def slow_requests(request: HttpRequest) -> HttpResponse:
+    """Медленные запросы этого процесса (буфер ProfilingMiddleware) с их SQL."""
+    entries = profiling.slow_requests()
+    if _wants_json(request):
+        return JsonResponse({"enabled": profiling.enabled(), "threshold_ms": profiling.slow_ms(), "requests": entries})
+    # записи буфера общие для всех потоков: время для шаблона — в копиях
+    entries = [{**e, "at": datetime.fromtimestamp(e["ts"], tz=dt_timezone.utc)} for e in entries]
+    return render(request, "menuapp/slow_requests.html", {
+        "entries": entries,
+        "enabled": profiling.enabled(),
+        "threshold_ms": profiling.slow_ms(),
+    })
+
+
+# ========================= метрики =========================
+def prometheus_metrics(request: HttpRequest) -> HttpResponse:
+    """
+    /metrics для Prometheus — только с "Authorization: Bearer <MENU_METRICS_TOKEN>".
+    Без токена эндпоинт открыт лишь при DEBUG: в метриках маршруты, трафик
+    и число открытых заказов, а каждый скрейп — запрос к БД.
+    """
+    if not metrics.enabled():
+        raise Http404
+    token = settings.MENU_METRICS_TOKEN
+    if token:
+        sent = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(sent.encode(), token.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # ========================= age gate =========================
 def age_gate(request: HttpRequest) -> HttpResponse:
     return render(request, "menuapp/age_gate.html")